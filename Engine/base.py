@@ -1,5 +1,20 @@
 from abc import abstractmethod
+import io
+import operator
 import re
+import sys
+import threading
+import time
+from config import HASH_JOIN_MEMORY_ROWS, NESTED_LOOP_JOIN_MAX_PAIRS
+from .condition import ConditionParser
+from .operators import BatchFilter, Filter, Gather, IndexScan, Join, Limit, Operator, Scan
+from .parallel import map_chunks, scan_workers
+from .plan import PlanNode, QueryStats
+from .predicate import Between, Comparison, Predicate
+from .zonemap import ZoneMap, table_range
+
+# the operator of a join condition with its sides swapped
+MIRRORED_JOIN_OPS = {"=": "=", "!=": "!=", "<": ">", "<=": ">=", ">": "<", ">=": "<="}
 
 
 class BaseEngine():
@@ -10,63 +25,159 @@ class BaseEngine():
         "insert_data": r'insert into (.*?) with data (.*?);',
         "delete_data": r'delete from (.*?) where (.*?);',
         "update_data": r'update in (.*?) where (.*?) and set (.*?);',
-        "projection": r'show field (.*?) from (.*?);',
-        "filtering": r'show data (.*?) from (.*?) where (.*?);',
+        "projection": r'show field (.*?) from (.*?)(?: limit (\d+))?(?: offset (\d+))?;',
+        "filtering": r'show data (.*?) from (.*?) where (.*?)(?: limit (\d+))?(?: offset (\d+))?;',
+        "join_using": r'join (.*?) and (.*?) on (.*?) using (.*?);',
         "join": r'join (.*?) and (.*?) on (.*?);',
+        "aggregate_where": r'find (.*?) in (.*?) where (.*) group by (.*?);',
         "aggregate": r'find (.*?) in (.*?) group by (.*?);',
-        "order": r'sort data in (.*?) by (.*?) (.*?);',
+        "order_where": r'sort data in (.*?) where (.*) by (.*?)(?: limit (\d+))?(?: offset (\d+))?;',
+        "order": r'sort data in (.*?) by (.*?)(?: limit (\d+))?(?: offset (\d+))?;',
         "exit": r'exit',
         "load_data": r'load data from (.*?);',
+        "aggregate_table_where": r'find (.*?) in (.*?) where (.*);',
         "aggregate_table": r'find (.*?) in (.*?);',
-        "group": r"group (.*?) by (.*?);"
+        "group_where": r"group (.*?) where (.*) by (.*?);",
+        "group": r"group (.*?) by (.*?);",
+        "set_chunk_size": r'set chunk size of (.*?) to (\d+) ?(rows|bytes|kb|mb);',
+        "compact_table": r'compact table (.*?);',
+        "set_format": r'set format of (.*?) to (.*?);',
+        "create_index": r'create index on (.*?)\((.*?)\);',
+        "drop_index": r'drop index on (.*?)\((.*?)\);',
+        "explain": r'explain (analyze )?(.*;)'
+    }
+    # queries that can be explained
+    explain_commands = ("delete_data", "update_data", "projection", "filtering", "join_using", "join", "aggregate_where", "aggregate",
+                        "order_where", "order", "aggregate_table_where", "aggregate_table", "group_where", "group")
+
+    # join strategy -> operators it supports
+    join_strategies = {
+        "nested loop": ("=", "!=", ">", "<", ">=", "<="),
+        "hash": ("=",),
+        "sort merge": ("=", ">", "<", ">=", "<="),
     }
+    # aggregation methods of find queries
+    aggregation_methods = ("max", "min", "sum", "avg", "count", "stddev", "variance", "median", "percentile")
+    # operator functions of join conditions
+    join_ops = {
+        "=": operator.eq,
+        "!=": operator.ne,
+        ">": operator.gt,
+        "<": operator.lt,
+        ">=": operator.ge,
+        "<=": operator.le,
+    }
+
+    def __init__(self):
+        # the explain state of the query running in every thread, an engine is shared by the
+        # threads of the web server
+        self._explain = threading.local()
 
-    def parse_and_execute(self, input_str):
+    # set by explain: "plan" to only plan the next query, "analyze" to plan and run it
+    @property
+    def explain_mode(self) -> str or None:
+        return getattr(self._explain, "mode", None)
+
+    @explain_mode.setter
+    def explain_mode(self, mode: str or None) -> None:
+        self._explain.mode = mode
+
+    # the plan of the explained query
+    @property
+    def plan(self) -> PlanNode or None:
+        return getattr(self._explain, "plan", None)
+
+    @plan.setter
+    def plan(self, plan: PlanNode or None) -> None:
+        self._explain.plan = plan
+
+    def parse_and_execute(self, input_str, io_output=sys.stdout):
         if not input_str.endswith(';'):
-            print("all queries must end with a semicolon ';'")
+            print("all queries must end with a semicolon ';'", file=io_output)
             return True
         elif re.match(self.command_dict['exit'], input_str):
             return False
+        elif re.match(self.command_dict['explain'], input_str):
+            # explain
+            # example: explain show data name from table_name where id=4;
+            # example: explain analyze sort data in table_name by id desc;
+            kwargs = re.match(self.command_dict['explain'], input_str)
+            return self.explain(kwargs.group(2), kwargs.group(1) is not None, io_output)
         elif re.match(self.command_dict['load_data'], input_str):
             # load data
             # example: load data from xxx.csv
             file_name = re.match(self.command_dict['load_data'], input_str).group(1)
-            print(file_name)
-            return self.load_data(file_name)
+            print(file_name, file=io_output)
+            return self.load_data(file_name, io_output)
+        elif re.match(self.command_dict['set_chunk_size'], input_str):
+            # set chunk size
+            # example: set chunk size of table_name to 10000 rows;
+            # example: set chunk size of table_name to 4 mb;
+            kwargs = re.match(self.command_dict['set_chunk_size'], input_str)
+            table_name = kwargs.group(1)
+            size = int(kwargs.group(2))
+            unit = kwargs.group(3)
+            if size <= 0:
+                print("chunk size must be a positive number", file=io_output)
+                return True
+            if unit == "rows":
+                return self.set_chunk_size(table_name, size, None, io_output)
+            multipliers = {"bytes": 1, "kb": 1024, "mb": 1024 * 1024}
+            return self.set_chunk_size(table_name, None, size * multipliers[unit], io_output)
+        elif re.match(self.command_dict['compact_table'], input_str):
+            # compact table
+            # example: compact table table_name;
+            table_name = re.match(self.command_dict['compact_table'], input_str).group(1)
+            return self.compact_table(table_name, io_output)
+        elif re.match(self.command_dict['set_format'], input_str):
+            # set the chunk format
+            # example: set format of table_name to columnar;
+            kwargs = re.match(self.command_dict['set_format'], input_str)
+            return self.set_format(kwargs.group(1), kwargs.group(2), io_output)
+        elif re.match(self.command_dict['create_index'], input_str):
+            # create index
+            # example: create index on table_name(field);
+            kwargs = re.match(self.command_dict['create_index'], input_str)
+            return self.create_index(kwargs.group(1), kwargs.group(2).strip(), io_output)
+        elif re.match(self.command_dict['drop_index'], input_str):
+            # drop index
+            # example: drop index on table_name(field);
+            kwargs = re.match(self.command_dict['drop_index'], input_str)
+            return self.drop_index(kwargs.group(1), kwargs.group(2).strip(), io_output)
         elif re.match(self.command_dict['list_all_tables'], input_str):
             # show all tables
             # example: show tables
-            return self.show_tables()
+            return self.show_tables(io_output)
         elif re.match(self.command_dict['create_table'], input_str):
             # create table
             # example: create table table_name(field1,field2,field3)
             kwargs = re.match(self.command_dict['create_table'], input_str)
             match = re.match(r'(.*?)\((.*?)\)', kwargs.group(1))
             if match is None:
-                print("invalid query: check the table specification")
+                print("invalid query: check the table specification", file=io_output)
                 return True
             table_name = match.group(1)
             fields = match.group(2).split(',')
-            return self.create_table(table_name, fields)
+            return self.create_table(table_name, fields, io_output)
         elif re.match(self.command_dict['drop_table'], input_str):
             # drop table
             # example: drop table table_name
             table_name = re.match(self.command_dict['drop_table'], input_str).group(1)
-            return self.drop_table(table_name)
+            return self.drop_table(table_name, io_output)
         elif re.match(self.command_dict['insert_data'], input_str):
             # insert data
             # example: insert into table_name with data id=4,address=east42
             kwargs = re.match(self.command_dict['insert_data'], input_str)
             table_name = kwargs.group(1)
             data = kwargs.group(2).split(',')
-            return self.insert_data(table_name, data)
+            return self.insert_data(table_name, data, io_output)
         elif re.match(self.command_dict['delete_data'], input_str):
             # delete data
             # example: delete from table_name where id=4
             kwargs = re.match(self.command_dict['delete_data'], input_str)
             table_name = kwargs.group(1)
             condition = kwargs.group(2)
-            return self.delete_data(table_name, condition)
+            return self.delete_data(table_name, condition, io_output)
         elif re.match(self.command_dict['update_data'], input_str):
             # update data
             # example: update in table_name where id=4 and set address=east42,id=5
@@ -74,20 +185,21 @@ class BaseEngine():
             table_name = kwargs.group(1)
             condition = kwargs.group(2)
             data = kwargs.group(3).split(',')
-            return self.update_data(table_name, condition, data)
+            return self.update_data(table_name, condition, data, io_output)
         elif re.match(self.command_dict['projection'], input_str):
             # projection
-            # example: show column id,name from table_name
+            # example: show column id,name from table_name limit 10
             kwargs = re.match(self.command_dict['projection'], input_str)
             if kwargs.group(1) == '*':
                 fields = ['*']
             else:
                 fields = kwargs.group(1).split(',')
             table_name = kwargs.group(2)
-            return self.projection(table_name, fields)
+            limit, offset = self._parse_limit(kwargs.group(3), kwargs.group(4))
+            return self.projection(table_name, fields, io_output, limit=limit, offset=offset)
         elif re.match(self.command_dict['filtering'], input_str):
             # filtering
-            # example: show data id,name from table_name where id=4
+            # example: show data id,name from table_name where id>4 limit 10 offset 20
             kwargs = re.match(self.command_dict['filtering'], input_str)
             if kwargs.group(1) == '*':
                 fields = ['*']
@@ -95,19 +207,42 @@ class BaseEngine():
                 fields = kwargs.group(1).split(',')
             table_name = kwargs.group(2)
             condition = kwargs.group(3)
-            return self.filtering(table_name, fields, condition)
+            limit, offset = self._parse_limit(kwargs.group(4), kwargs.group(5))
+            return self.filtering(table_name, fields, condition, io_output, limit=limit, offset=offset)
+        elif re.match(self.command_dict['order_where'], input_str):
+            # order the rows meeting a condition
+            # example: sort data in table_name where age>30 by id desc
+            kwargs = re.match(self.command_dict['order_where'], input_str)
+            table_name = kwargs.group(1)
+            condition = kwargs.group(2)
+            sort_fields = self.parse_sort_fields(kwargs.group(3), io_output)
+            if sort_fields is None:
+                return True
+            limit, offset = self._parse_limit(kwargs.group(4), kwargs.group(5))
+            return self.order(table_name, sort_fields, io_output, condition=condition, limit=limit, offset=offset)
         elif re.match(self.command_dict['order'], input_str):
             # order
-            # example: sort data in table_name by id desc
+            # example: sort data in table_name by id desc limit 10
+            # example: sort data in table_name by year desc, score desc, name asc
             kwargs = re.match(self.command_dict['order'], input_str)
             table_name = kwargs.group(1)
-            field = kwargs.group(2)
-            order_method = kwargs.group(3)
-            # check if order_method is valid
-            if order_method not in ['asc', 'desc']:
-                print("order method must be asc or desc")
+            sort_fields = self.parse_sort_fields(kwargs.group(2), io_output)
+            if sort_fields is None:
+                return True
+            limit, offset = self._parse_limit(kwargs.group(3), kwargs.group(4))
+            return self.order(table_name, sort_fields, io_output, limit=limit, offset=offset)
+        elif re.match(self.command_dict['join_using'], input_str):
+            # join with a forced strategy
+            # example: join table1 and table2 on table1.id=table2.id using sort merge
+            kwargs = re.match(self.command_dict['join_using'], input_str)
+            table1 = kwargs.group(1)
+            table2 = kwargs.group(2)
+            condition = kwargs.group(3)
+            strategy = kwargs.group(4).strip()
+            if strategy not in self.join_strategies:
+                print("join strategy must be nested loop, hash or sort merge", file=io_output)
                 return True
-            return self.order(table_name, field, order_method)
+            return self.join(table1, table2, condition, io_output, strategy=strategy)
         elif re.match(self.command_dict['join'], input_str):
             # join
             # example: join table1 and table2 on table1.id=table2.id
@@ -115,52 +250,372 @@ class BaseEngine():
             table1 = kwargs.group(1)
             table2 = kwargs.group(2)
             condition = kwargs.group(3)
-            return self.join(table1, table2, condition)
+            return self.join(table1, table2, condition, io_output)
+        elif re.match(self.command_dict['aggregate_where'], input_str):
+            # aggregate the rows meeting a condition
+            # example: find count(*),avg(salary) in table_name where age>30 group by dept;
+            kwargs = re.match(self.command_dict['aggregate_where'], input_str)
+            aggregations = self.parse_aggregations(kwargs.group(1), io_output)
+            if aggregations is None:
+                return True
+            return self.multi_aggregate(kwargs.group(2), aggregations, kwargs.group(4), io_output, condition=kwargs.group(3))
         elif re.match(self.command_dict['aggregate'], input_str):
             # aggregate
-            # example: find max(salary) from table_name group by age;
+            # example: find count(*),avg(salary) in table_name group by age;
             kwargs = re.match(self.command_dict['aggregate'], input_str)
-            agg = kwargs.group(1)
-            aggregation_method = re.match(r'(.*?)\((.*?)\)', agg).group(1)
-            aggregation_field = re.match(r'(.*?)\((.*?)\)', agg).group(2)
-            if aggregation_method is None or aggregation_field is None:
-                print("invalid query: check the format of the aggregation field")
-                return True
-            # check if aggregation method is valid
-            if aggregation_method not in ['max', 'min', 'sum', 'avg', 'count']:
-                print("aggregation method must be max, min, sum, avg or count")
+            aggregations = self.parse_aggregations(kwargs.group(1), io_output)
+            if aggregations is None:
                 return True
             table_name = kwargs.group(2)
             group_field = kwargs.group(3)
-            return self.aggregate(table_name, aggregation_method, aggregation_field, group_field)
+            return self.multi_aggregate(table_name, aggregations, group_field, io_output)
+        elif re.match(self.command_dict['aggregate_table_where'], input_str):
+            # aggregate the rows of the table meeting a condition
+            # example: find max(salary) in table_name where age>30;
+            kwargs = re.match(self.command_dict['aggregate_table_where'], input_str)
+            aggregations = self.parse_aggregations(kwargs.group(1), io_output)
+            if aggregations is None:
+                return True
+            return self.multi_aggregate(kwargs.group(2), aggregations, None, io_output, condition=kwargs.group(3))
         elif re.match(self.command_dict['aggregate_table'], input_str):
             # aggregate table
-            # example: find max(salary) from table_name
+            # example: find max(salary),median(salary) in table_name;
             kwargs = re.match(self.command_dict['aggregate_table'], input_str)
-            agg = kwargs.group(1)
-            aggregation_method = re.match(r'(.*?)\((.*?)\)', agg).group(1)
-            aggregation_field = re.match(r'(.*?)\((.*?)\)', agg).group(2)
-            if aggregation_method is None or aggregation_field is None:
-                print("invalid query: check the format of the aggregation field")
-                return True
-            # check if aggregation method is valid
-            if aggregation_method not in ['max', 'min', 'sum', 'avg', 'count']:
-                print("aggregation method must be max, min, sum or avg")
+            aggregations = self.parse_aggregations(kwargs.group(1), io_output)
+            if aggregations is None:
                 return True
             table_name = kwargs.group(2)
-            return self.aggregate_table(table_name, aggregation_method, aggregation_field)
+            return self.multi_aggregate(table_name, aggregations, None, io_output)
+        elif re.match(self.command_dict['group_where'], input_str):
+            # group the rows meeting a condition
+            # example: group table_name where salary>1000 by age;
+            kwargs = re.match(self.command_dict['group_where'], input_str)
+            return self.group(kwargs.group(1), kwargs.group(3), io_output, condition=kwargs.group(2))
         elif re.match(self.command_dict['group'], input_str):
             # group
             # example: group table_name by age;
             kwargs = re.match(self.command_dict['group'], input_str)
             table_name = kwargs.group(1)
             group_field = kwargs.group(2)
-            return self.group(table_name, group_field)
+            return self.group(table_name, group_field, io_output)
         else:
-            print("invalid query")
+            print("invalid query", file=io_output)
+            return True
+
+    # print the plan of the query, and with analyze run the query (discarding its output)
+    # and print the rows and time of every operator and the io of the query
+    # update and delete queries are applied by explain analyze
+    def explain(self, query: str, analyze: bool, io_output=sys.stdout) -> bool:
+        if not any(re.match(self.command_dict[command], query) for command in self.explain_commands):
+            print("only show, sort, join, find, group, update and delete queries can be explained", file=io_output)
+            return True
+        # the query method records its plan and returns before executing it unless analyzing
+        query_output = io.StringIO()
+        self.explain_mode = "analyze" if analyze else "plan"
+        self.plan = None
+        try:
+            with QueryStats() as stats:
+                start_time = time.perf_counter()
+                self.parse_and_execute(query, query_output)
+                execution_time = time.perf_counter() - start_time
+        finally:
+            self.explain_mode = None
+        plan = self.plan
+        self.plan = None
+        if plan is None:
+            # the query failed before it was planned, show why
+            print(query_output.getvalue(), end="", file=io_output)
+            return True
+        for line in plan.render():
+            print(line, file=io_output)
+        if analyze:
+            print(f"chunks read: {stats.chunks_read}", file=io_output)
+            print(f"bytes read: {stats.bytes_read}", file=io_output)
+            print(f"temp files written: {len(stats.temp_files)}", file=io_output)
+            print(f"execution time: {execution_time * 1000:.3f} ms", file=io_output)
+        return True
+
+    # record the plan of the query for explain
+    # return False if the query must not be executed (explain without analyze)
+    def _begin_plan(self, plan: PlanNode) -> bool:
+        if self.explain_mode is None:
             return True
+        self.plan = plan
+        plan.set_analyze(self.explain_mode == "analyze")
+        return self.explain_mode == "analyze"
+
+    # return (limit, offset) of the limit and offset clauses of a query, limit is None without a limit
+    def _parse_limit(self, limit: str or None, offset: str or None) -> tuple:
+        return int(limit) if limit is not None else None, int(offset) if offset is not None else 0
+
+    # return the plan outputting the rows of the plan after the first offset rows, at most limit rows
+    def _plan_limit(self, plan: Operator, limit: int or None, offset: int) -> Operator:
+        if limit is None and offset == 0:
+            return plan
+        return Limit(plan, limit, offset)
+
+    # return the operator reading the rows of the table that can meet the predicate:
+    # an index scan if an index can answer the predicate, a full scan otherwise, which
+    # skips the chunks whose zone maps rule the predicate out
+    # read() returns the rows of a full scan, by default the rows of those chunks
+    def _plan_scan(self, table_name: str, predicate: Predicate = None, read=None) -> Scan:
+        index_choice = self._choose_index(table_name, predicate) if predicate is not None else None
+        if index_choice is not None:
+            count, conjunct, _ = index_choice
+            return IndexScan(table_name, conjunct, count, lambda: self._scan_candidates(table_name, predicate))
+        if read is None:
+            read = lambda: self._scan_candidates(table_name, predicate)
+        chunk_nums = self._zone_chunks(table_name, predicate)
+        scan = Scan(table_name, sum(self.catalog.get_chunk_rows(table_name, chunk_num) for chunk_num in chunk_nums), read)
+        scan.detail += self._zone_scan_detail(table_name, chunk_nums)
+        return scan
+
+    # the detail of a scan reading the chunks numbered chunk_nums of the table
+    def _zone_scan_detail(self, table_name: str, chunk_nums: list) -> str:
+        chunk_count = len(self.catalog.get_chunk_numbers(table_name))
+        if len(chunk_nums) == chunk_count:
+            return ""
+        return f" (zone maps skip {chunk_count - len(chunk_nums)} of {chunk_count} chunks)"
+
+    # return the numbers of the chunks of the table whose zone maps do not rule out the predicate
+    # (every chunk if the predicate is None), in ascending order
+    def _zone_chunks(self, table_name: str, predicate: Predicate or None) -> list:
+        chunk_nums = self.catalog.get_chunk_numbers(table_name)
+        if predicate is None:
+            return chunk_nums
+        return [chunk_num for chunk_num in chunk_nums if self._chunk_may_match(table_name, chunk_num, predicate)]
+
+    def _chunk_may_match(self, table_name: str, chunk_num: int, predicate: Predicate) -> bool:
+        zone = self.catalog.get_zone(table_name, chunk_num)
+        return zone is None or ZoneMap(zone).may_match(predicate)
+
+    # return the operator filtering the rows (or batches) of the child with the predicate
+    def _plan_filter(self, table_name: str, predicate: Predicate, child: Operator) -> Filter:
+        rows = round(self.catalog.get_row_count(table_name) * predicate.selectivity(lambda field_predicate: self._estimate_selectivity(table_name, field_predicate)))
+        if child.batched:
+            return BatchFilter(child, predicate, min(rows, child.rows))
+        return Filter(child, predicate, min(rows, child.rows))
+
+    # return the operator producing the rows of the table that meet the predicate,
+    # every row if the predicate is None
+    def _plan_rows(self, table_name: str, predicate: Predicate or None) -> Operator:
+        if predicate is None:
+            return self._plan_scan(table_name)
+        return self._plan_filter(table_name, predicate, self._plan_scan(table_name, predicate))
+
+    # return the number of worker processes scanning the table for rows meeting the predicate,
+    # 1 to scan it in this process (e.g. an index answers the predicate or there are few rows)
+    def _scan_workers(self, table_name: str, predicate: Predicate or None) -> int:
+        if predicate is not None and self._choose_index(table_name, predicate) is not None:
+            return 1
+        chunk_nums = self._zone_chunks(table_name, predicate)
+        return scan_workers(sum(self.catalog.get_chunk_rows(table_name, chunk_num) for chunk_num in chunk_nums), len(chunk_nums))
 
+    # return the paths of the chunks of the table a parallel scan for the predicate reads, in order
+    def _gather_chunk_paths(self, table_name: str, predicate: Predicate or None) -> list:
+        return [self.catalog.get_chunk_path(table_name, chunk_num) for chunk_num in self._zone_chunks(table_name, predicate)]
 
+    # return the operator running self.<task>(*args) for the args of every chunk in worker processes
+    # the task runs the worker plan on the chunk and returns (rows output by every operator
+    # of the worker plan from the top down, output), see Gather
+    def _plan_gather(self, worker_plan: PlanNode, workers: int, task: str, chunk_args: list, batched: bool = False, rows: int or None = None) -> Gather:
+        return Gather(worker_plan, workers, lambda: map_chunks(self, task, chunk_args, workers), batched, rows)
+
+    # return the rows output by the operators of a worker plan running a filter (if there is a
+    # predicate) on a chunk, from the top down: the top operator output, then the filter and the scan
+    def _worker_counts(self, output_rows: int, predicate: Predicate or None, selected_rows: int, scanned_rows: int) -> list:
+        if predicate is None:
+            return [output_rows, scanned_rows]
+        return [output_rows, selected_rows, scanned_rows]
+
+    # return the rows of the table that meet the predicate outside of a plan, every row if the predicate is None
+    def _filtered_rows(self, table_name: str, predicate: Predicate or None):
+        rows = self._scan_candidates(table_name, predicate)
+        return filter(predicate, rows) if predicate is not None else rows
+
+    # return the join operator of the strategy over scans of both tables
+    # join(left, right) returns the joined pairs of the input operators
+    def _plan_join(self, left: str, right: str, left_field: str, op: str, right_field: str, strategy: str, join) -> Join:
+        condition = f"{left}.{left_field}{op}{right}.{right_field}"
+        # the rows of a table outside the range of values of the other table cannot match,
+        # so each scan skips the chunks whose zone maps are outside that range
+        left_range = table_range([self.catalog.get_zone(left, chunk_num) for chunk_num in self.catalog.get_chunk_numbers(left)], left_field)
+        right_range = table_range([self.catalog.get_zone(right, chunk_num) for chunk_num in self.catalog.get_chunk_numbers(right)], right_field)
+        left_predicate, right_predicate = None, None
+        # only values of the same kind on both sides compare as in the predicates
+        if left_range is not None and right_range is not None and left_range[0] == right_range[0]:
+            left_predicate = self._join_range_predicate(left_field, op, right_range[1], right_range[2])
+            right_predicate = self._join_range_predicate(right_field, MIRRORED_JOIN_OPS[op], left_range[1], left_range[2])
+        left_input = self._plan_scan(left, left_predicate)
+        right_input = self._plan_scan(right, right_predicate)
+        if strategy == "sort merge":
+            left_order = "desc" if op in (">", ">=") else "asc"
+            return Join("Sort Merge Join", f"on {condition} (sorts {left_field} {left_order}, {right_field} asc)", left_input, right_input, join)
+        elif strategy == "hash":
+            build_rows = min(left_input.rows, right_input.rows)
+            operator = "Grace Hash Join" if build_rows > HASH_JOIN_MEMORY_ROWS else "Hash Join"
+            return Join(operator, f"on {condition} (build side: {left if left_input.rows <= right_input.rows else right})", left_input, right_input, join)
+        return Join("Nested Loop Join", f"on {condition}", left_input, right_input, join)
+
+    # return the predicate on the field of the rows for which <field> <op> <value> holds for
+    # some value between low and high, None if it can hold for any row
+    # the predicate only narrows the chunks (or index entries) a join reads
+    def _join_range_predicate(self, field: str, op: str, low, high) -> Predicate or None:
+        if op == "=":
+            return Between(field, low, high)
+        elif op in ("<", "<="):
+            return Comparison(field, op, high)
+        elif op in (">", ">="):
+            return Comparison(field, op, low)
+        return None
+
+    # parse the condition of a where clause into a tree (see Engine/condition.py)
+    # return None (after printing the error) if the condition is invalid
+    def parse_condition(self, condition: str, io_output=sys.stdout) -> tuple or None:
+        try:
+            return ConditionParser(condition).parse()
+        except ValueError as e:
+            print(f"invalid condition {condition}: {e}", file=io_output)
+            return None
+
+    # return the estimated fraction of rows of the table that meet the single field predicate
+    # from the index of its field, None if there is no index to tell
+    def _estimate_selectivity(self, table_name: str, predicate: Predicate) -> float or None:
+        if predicate.field not in self.catalog.get_indexes(table_name):
+            return None
+        ranges = predicate.index_ranges()
+        row_count = self.catalog.get_row_count(table_name)
+        if ranges is None or row_count == 0:
+            return None
+        return self.indexes.count_ranges(table_name, predicate.field, ranges) / row_count
+
+    # order the operands of and/or by their estimated selectivity, so that evaluation
+    # short-circuits as early as possible
+    def _reorder_predicate(self, table_name: str, predicate: Predicate) -> None:
+        predicate.reorder(lambda field_predicate: self._estimate_selectivity(table_name, field_predicate))
+
+    # return (matching entries, conjunct, ranges) of the most selective conjunct of the predicate
+    # that can be answered by an index, None if there is none
+    def _choose_index(self, table_name: str, predicate: Predicate) -> tuple or None:
+        index_fields = self.catalog.get_indexes(table_name)
+        best = None
+        for conjunct in predicate.conjuncts():
+            if conjunct.field not in index_fields:
+                continue
+            ranges = conjunct.index_ranges()
+            if ranges is None:
+                continue
+            count = self.indexes.count_ranges(table_name, conjunct.field, ranges)
+            if best is None or count < best[0]:
+                best = (count, conjunct, ranges)
+        return best
+
+    # return {chunk number: row offsets} of the rows that can meet the predicate according to
+    # the index of its most selective conjunct, None if no conjunct can be answered by an index
+    def _index_lookup(self, table_name: str, predicate: Predicate) -> dict or None:
+        index_choice = self._choose_index(table_name, predicate)
+        if index_choice is None:
+            return None
+        _, conjunct, ranges = index_choice
+        return self.indexes.lookup_ranges(table_name, conjunct.field, ranges)
+
+    # parse a comma separated list of sort fields into (field, order_method) tuples
+    # e.g. "year desc, score desc, name", the order method is asc by default
+    # return None (after printing the error) if a sort field is invalid
+    def parse_sort_fields(self, order_str: str, io_output=sys.stdout) -> list or None:
+        sort_fields = []
+        for sort_field in order_str.split(","):
+            words = sort_field.split()
+            if len(words) == 0 or len(words) > 2:
+                print("invalid query: check the format of the sort fields", file=io_output)
+                return None
+            order_method = words[1] if len(words) == 2 else "asc"
+            # check if order_method is valid
+            if order_method not in ['asc', 'desc']:
+                print("order method must be asc or desc", file=io_output)
+                return None
+            sort_fields.append((words[0], order_method))
+        return sort_fields
+
+    # return the sort fields as shown in the plan, e.g. "year desc, name asc"
+    def _sort_detail(self, sort_fields: list) -> str:
+        return ", ".join(f"{field} {order_method}" for field, order_method in sort_fields)
+
+    # parse a comma separated list of aggregations into (method, field, param) tuples
+    # e.g. "count(*),count(distinct genre),percentile(score,90)"
+    # return None (after printing the error) if an aggregation is invalid
+    def parse_aggregations(self, agg_str: str, io_output=sys.stdout) -> list or None:
+        # split on the commas outside of parentheses
+        aggs = []
+        depth = 0
+        cur_agg = ""
+        for char in agg_str:
+            if char == "," and depth == 0:
+                aggs.append(cur_agg)
+                cur_agg = ""
+                continue
+            if char == "(":
+                depth += 1
+            elif char == ")":
+                depth -= 1
+            cur_agg += char
+        aggs.append(cur_agg)
+        aggregations = []
+        for agg in aggs:
+            match = re.match(r'^\s*(\w+)\((.*?)\)\s*$', agg)
+            if match is None:
+                print("invalid query: check the format of the aggregation field", file=io_output)
+                return None
+            method = match.group(1)
+            args = [arg.strip() for arg in match.group(2).split(",")]
+            field = args[0]
+            param = None
+            # check if aggregation method is valid
+            if method not in self.aggregation_methods:
+                print(f"aggregation method must be one of {', '.join(self.aggregation_methods)}", file=io_output)
+                return None
+            if method == "count" and field.startswith("distinct "):
+                method = "count distinct"
+                field = field[len("distinct "):].strip()
+            if method == "percentile":
+                if len(args) != 2 or not re.match(r'^\d+(\.\d+)?$', args[1]) or float(args[1]) > 100:
+                    print("invalid query: use percentile(<field>,<0-100>)", file=io_output)
+                    return None
+                param = float(args[1])
+            elif len(args) != 1:
+                print(f"invalid query: {method} takes one field", file=io_output)
+                return None
+            if field == "" or (field == "*" and method != "count"):
+                print(f"invalid query: {method} needs a field", file=io_output)
+                return None
+            aggregations.append((method, field, param))
+        return aggregations
+
+    # the output column name of an aggregation
+    def aggregation_label(self, aggregation: tuple) -> str:
+        method, field, param = aggregation
+        if method == "count distinct":
+            return f"count(distinct {field})"
+        if method == "percentile":
+            return f"percentile({field},{param:g})"
+        return f"{method}({field})"
+
+    # choose the join strategy from the operator and the row counts of both tables
+    def _choose_join_strategy(self, op: str, left_rows: int, right_rows: int) -> str:
+        if op == "!=" or left_rows * right_rows <= NESTED_LOOP_JOIN_MAX_PAIRS:
+            return "nested loop"
+        if op == "=" and min(left_rows, right_rows) <= HASH_JOIN_MEMORY_ROWS:
+            return "hash"
+        # range conditions, and equality conditions too big to hash in memory
+        return "sort merge"
+
+
+
+    # yield the rows of the table that can meet the predicate (found by an index if possible),
+    # every row if the predicate is None
+    @abstractmethod
+    def _scan_candidates(self, table_name: str, predicate: Predicate or None):
+        pass
 
     @abstractmethod
     def show_tables(self, output) -> bool:
@@ -187,19 +642,19 @@ class BaseEngine():
         pass
 
     @abstractmethod
-    def projection(self, table_name: str, fields: list, output) -> bool:
+    def projection(self, table_name: str, fields: list, output, limit: int = None, offset: int = 0) -> bool:
         pass
 
     @abstractmethod
-    def filtering(self, table_name: str, fields: list, condition: str, output) -> bool:
+    def filtering(self, table_name: str, fields: list, condition: str, output, limit: int = None, offset: int = 0) -> bool:
         pass
 
     @abstractmethod
-    def join(self, left: str, right: str, condition: str, output) -> bool:
+    def join(self, left: str, right: str, condition: str, output, strategy: str = None) -> bool:
         pass
 
     @abstractmethod
-    def group(self, table_name: str, group_field: str, output) -> bool:
+    def group(self, table_name: str, group_field: str, output, condition: str = None) -> bool:
         pass
 
     @abstractmethod
@@ -211,10 +666,33 @@ class BaseEngine():
         pass
 
     @abstractmethod
-    def order(self, table_name: str, field: str, order_method: str, output) -> bool:
+    def multi_aggregate(self, table_name: str, aggregations: list, group_field: str or None, output, condition: str = None) -> bool:
+        pass
+
+    @abstractmethod
+    def order(self, table_name: str, sort_fields: list, output, condition: str = None, limit: int = None, offset: int = 0) -> bool:
         pass
 
     @abstractmethod
     def load_data(self, file_name: str, output) -> bool:
         pass
 
+    @abstractmethod
+    def set_chunk_size(self, table_name: str, chunk_size: int or None, chunk_bytes: int or None, output) -> bool:
+        pass
+
+    @abstractmethod
+    def compact_table(self, table_name: str, output) -> bool:
+        pass
+
+    @abstractmethod
+    def set_format(self, table_name: str, chunk_format: str, output) -> bool:
+        pass
+
+    @abstractmethod
+    def create_index(self, table_name: str, field: str, output) -> bool:
+        pass
+
+    @abstractmethod
+    def drop_index(self, table_name: str, field: str, output) -> bool:
+        pass
@@ -0,0 +1,242 @@
+import csv
+import json
+import os
+import threading
+from config import CHUNK_BYTES, CHUNK_SIZE
+
+MANIFEST_FILE = "manifest.json"
+
+
+class Catalog():
+    # manifests are cached per table path and shared by all engine instances
+    # so that metadata lookups do not parse the manifest again: table path -> (manifest file
+    # version, manifest), a manifest rewritten by another process has a new version
+    _cache = {}
+
+    def __init__(self, storage_path: str, chunk_suffix: str = "", format_suffixes: dict or None = None):
+        # storage_path: the directory holding one subdir per table
+        # chunk_suffix: the file extension of the chunks (".csv" for relational)
+        # format_suffixes: the file extension of the chunks of every other chunk format of the tables
+        self.storage_path = storage_path
+        self.chunk_suffix = chunk_suffix
+        self.format_suffixes = format_suffixes or {}
+
+    # ========================================================
+    #                   Manifest management
+    # ========================================================
+
+    # create the manifest of a new table
+    def create(self, table_name: str, schema: tuple or None = None, chunk_format: str or None = None) -> dict:
+        manifest = {
+            "schema": list(schema) if schema is not None else None,
+            "types": None,
+            "chunks": {},
+            "max_chunk": -1,
+            "format": chunk_format,
+            "zones": {},
+        }
+        self.save(table_name, manifest)
+        return manifest
+
+    # return the manifest of the table, loading (or building) it on a cache miss
+    def load(self, table_name: str) -> dict:
+        table_path = self._get_table_path(table_name)
+        manifest_path = f"{table_path}/{MANIFEST_FILE}"
+        version = file_version(manifest_path)
+        cached = self._cache.get(table_path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        if version is not None:
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+            # json keys are always strings, chunk numbers are ints
+            manifest["chunks"] = {int(chunk_num): rows for chunk_num, rows in manifest["chunks"].items()}
+            manifest["zones"] = {int(chunk_num): zone for chunk_num, zone in manifest.get("zones", {}).items()}
+            manifest["chunk_formats"] = {int(chunk_num): chunk_format
+                                         for chunk_num, chunk_format in manifest.get("chunk_formats", {}).items()}
+        else:
+            # tables created before the catalog existed
+            manifest = self._build_manifest(table_name)
+            version = self._write_manifest(table_path, manifest)
+        self._cache[table_path] = (version, manifest)
+        return manifest
+
+    # persist the manifest and refresh the cached copy
+    def save(self, table_name: str, manifest: dict) -> None:
+        table_path = self._get_table_path(table_name)
+        self._cache[table_path] = (self._write_manifest(table_path, manifest), manifest)
+
+    # forget the cached manifest, e.g. after the table is dropped
+    def invalidate(self, table_name: str) -> None:
+        self._cache.pop(self._get_table_path(table_name), None)
+
+    # ========================================================
+    #                     Metadata lookups
+    # ========================================================
+
+    def get_schema(self, table_name: str) -> tuple or None:
+        schema = self.load(table_name)["schema"]
+        return tuple(schema) if schema is not None else None
+
+    def get_types(self, table_name: str) -> list or None:
+        return self.load(table_name)["types"]
+
+    def set_types(self, table_name: str, types: list) -> None:
+        manifest = self.load(table_name)
+        manifest["types"] = list(types)
+        self.save(table_name, manifest)
+
+    # return the chunk numbers of the table in ascending order
+    def get_chunk_numbers(self, table_name: str) -> list:
+        return sorted(self.load(table_name)["chunks"])
+
+    def get_chunk_path(self, table_name: str, chunk_num: int) -> str:
+        return self.get_format_chunk_path(table_name, chunk_num, self.get_chunk_format(table_name, chunk_num))
+
+    # return the path of the chunk stored in the chunk format (None for the default format)
+    def get_format_chunk_path(self, table_name: str, chunk_num: int, chunk_format: str or None) -> str:
+        suffix = self.format_suffixes.get(chunk_format, self.chunk_suffix)
+        return f"{self._get_table_path(table_name)}/chunk_{chunk_num}{suffix}"
+
+    # return the chunk format of the table, None for the default format
+    def get_format(self, table_name: str) -> str or None:
+        return self.load(table_name).get("format")
+
+    # return the chunk format the chunk is stored in: the format of the table, unless the chunk is
+    # kept in another one (e.g. the row tail of a columnar table)
+    def get_chunk_format(self, table_name: str, chunk_num: int) -> str or None:
+        manifest = self.load(table_name)
+        return manifest.get("chunk_formats", {}).get(chunk_num, manifest.get("format"))
+
+    def get_chunk_rows(self, table_name: str, chunk_num: int) -> int:
+        return self.load(table_name)["chunks"].get(chunk_num, 0)
+
+    def get_max_chunk(self, table_name: str) -> int:
+        return self.load(table_name)["max_chunk"]
+
+    def get_row_count(self, table_name: str) -> int:
+        return sum(self.load(table_name)["chunks"].values())
+
+    # record the row count of the chunks in chunk_rows ({chunk_num: rows}) in one manifest write,
+    # their zone maps ({chunk_num: zone map or None if unknown}) and the chunk format they are
+    # stored in ({chunk_num: chunk format}) if given
+    def set_chunk_rows(self, table_name: str, chunk_rows: dict, zones: dict or None = None,
+                       chunk_formats: dict or None = None) -> None:
+        manifest = self.load(table_name)
+        for chunk_num, rows in chunk_rows.items():
+            manifest["chunks"][chunk_num] = rows
+            manifest["max_chunk"] = max(manifest["max_chunk"], chunk_num)
+        if zones is not None:
+            self._update_zones(manifest, zones)
+        manifest_formats = manifest.setdefault("chunk_formats", {})
+        for chunk_num, chunk_format in (chunk_formats or {}).items():
+            # only the chunks stored in another format than the table are listed
+            if chunk_format == manifest.get("format"):
+                manifest_formats.pop(chunk_num, None)
+            else:
+                manifest_formats[chunk_num] = chunk_format
+        self.save(table_name, manifest)
+
+    # replace the whole chunk list of the table, their zone maps and their chunk format in one
+    # manifest write, e.g. after compaction: every chunk is stored in the chunk format
+    def replace_chunks(self, table_name: str, chunk_rows: dict, zones: dict or None, chunk_format: str or None) -> None:
+        manifest = self.load(table_name)
+        manifest["format"] = chunk_format
+        manifest["chunk_formats"] = {}
+        manifest["chunks"] = dict(chunk_rows)
+        manifest["max_chunk"] = max(chunk_rows, default=-1)
+        manifest["zones"] = {}
+        self._update_zones(manifest, zones or {})
+        self.save(table_name, manifest)
+
+    # return the zone map (see Engine/zonemap.py) of the chunk, None if it has none,
+    # e.g. chunks written before zone maps were kept
+    def get_zone(self, table_name: str, chunk_num: int) -> dict or None:
+        return self.load(table_name).get("zones", {}).get(chunk_num)
+
+    # record the zone maps of the chunks in zones ({chunk_num: zone map or None if unknown})
+    def set_zones(self, table_name: str, zones: dict) -> None:
+        manifest = self.load(table_name)
+        self._update_zones(manifest, zones)
+        self.save(table_name, manifest)
+
+    # return (max rows, max bytes) of a chunk of the table, None means no limit
+    def get_chunk_limits(self, table_name: str) -> tuple:
+        manifest = self.load(table_name)
+        return manifest.get("chunk_size", CHUNK_SIZE), manifest.get("chunk_bytes", CHUNK_BYTES)
+
+    def set_chunk_limits(self, table_name: str, chunk_size: int or None, chunk_bytes: int or None) -> None:
+        manifest = self.load(table_name)
+        manifest["chunk_size"] = chunk_size
+        manifest["chunk_bytes"] = chunk_bytes
+        self.save(table_name, manifest)
+
+    # return the fields of the table that have an index
+    def get_indexes(self, table_name: str) -> list:
+        return self.load(table_name).get("indexes", [])
+
+    def set_indexes(self, table_name: str, fields: list) -> None:
+        manifest = self.load(table_name)
+        manifest["indexes"] = list(fields)
+        self.save(table_name, manifest)
+
+    # ========================================================
+    #                        Helpers
+    # ========================================================
+
+    def _get_table_path(self, table_name: str) -> str:
+        return f"{self.storage_path}/{table_name}"
+
+    def _update_zones(self, manifest: dict, zones: dict) -> None:
+        manifest_zones = manifest.setdefault("zones", {})
+        for chunk_num, zone in zones.items():
+            if zone is None:
+                manifest_zones.pop(chunk_num, None)
+            else:
+                manifest_zones[chunk_num] = zone
+
+    # return the version of the written manifest file
+    def _write_manifest(self, table_path: str, manifest: dict) -> tuple:
+        # write to a temp file and rename it so readers never see a partial manifest, the temp
+        # file is named after the writing thread (two readers may record the inferred types at once)
+        temp_path = f"{table_path}/{MANIFEST_FILE}.{os.getpid()}_{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, f"{table_path}/{MANIFEST_FILE}")
+        return file_version(f"{table_path}/{MANIFEST_FILE}")
+
+    # build the manifest from schema.txt and the chunk files of a legacy table
+    def _build_manifest(self, table_name: str) -> dict:
+        table_path = self._get_table_path(table_name)
+        manifest = {"schema": None, "types": None, "chunks": {}, "max_chunk": -1}
+        schema_path = f"{table_path}/schema.txt"
+        if os.path.exists(schema_path):
+            with open(schema_path, "r") as f:
+                csv_reader = csv.reader(f)
+                schema = next(csv_reader, [])
+                types = next(csv_reader, [])
+            manifest["schema"] = schema
+            if len(types) == len(schema) and len(schema) > 0:
+                manifest["types"] = [type_str.split("'")[1] for type_str in types]
+        for file in os.listdir(table_path):
+            if not file.startswith("chunk_") or not file.endswith(self.chunk_suffix):
+                continue
+            chunk_num = int(file[len("chunk_"):len(file) - len(self.chunk_suffix)])
+            with open(f"{table_path}/{file}", "r") as f:
+                if self.chunk_suffix == ".csv":
+                    rows = sum(1 for _ in csv.reader(f))
+                else:
+                    rows = sum(1 for _ in f)
+            manifest["chunks"][chunk_num] = rows
+            manifest["max_chunk"] = max(manifest["max_chunk"], chunk_num)
+        return manifest
+
+
+# return the version of the file (a rewritten file has a new inode, modification time or size),
+# None if it does not exist
+def file_version(path: str) -> tuple or None:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
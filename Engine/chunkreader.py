@@ -0,0 +1,126 @@
+import csv
+import mmap
+import os
+from array import array
+
+from .plan import chunk_stats
+
+
+# reads a chunk file (json lines or csv) through a read-only memory map: the lines are
+# sliced out of the mapped pages instead of going through a buffered, decoding file
+# object, and the pages are shared through the page cache by every query reading the chunk
+#
+#   with ChunkReader(path) as reader:
+#       for line in reader.raw_lines(): ...
+#
+# rows can also be read by their position in the chunk (the row offsets kept in the indexes):
+# the byte offsets where the rows start are found once per version of the file and cached
+#
+# a reader of a chunk of a table counts the chunk and the bytes it read (the lines it went
+# through, the rows it sliced) in the io counters of the query (explain analyze)
+class ChunkReader():
+    # path: (file version, array of the byte offsets where the rows start, plus the file size)
+    _row_starts_cache = {}
+
+    def __init__(self, path: str, csv_rows: bool = False):
+        self.path = path
+        # csv rows with quoted values can span several lines
+        self.csv_rows = csv_rows
+        self.file = None
+        self.map = None
+        # the io counters of the query if the file is a chunk of a table
+        self.stats = None
+        # the bytes sliced out of the map by position
+        self.bytes_read = 0
+
+    def __enter__(self):
+        self.file = open(self.path, "rb")
+        # empty files cannot be mapped
+        if os.fstat(self.file.fileno()).st_size > 0:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.stats = chunk_stats(self.path)
+        if self.stats is not None:
+            self.stats.chunks_read += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.map is not None:
+            self._rewind()
+            self.map.close()
+            self.map = None
+        if self.stats is not None:
+            self.stats.bytes_read += self.bytes_read
+            self.stats = None
+        self.file.close()
+        return False
+
+    # move to the start of the map, adding the bytes the last pass through the lines read
+    def _rewind(self) -> None:
+        self.bytes_read += self.map.tell()
+        self.map.seek(0)
+
+    # ========================================================
+    #                    Sequential reads
+    # ========================================================
+
+    # yield the lines of the chunk as bytes, with their line breaks
+    def raw_lines(self):
+        if self.map is None:
+            return iter(())
+        self._rewind()
+        return iter(self.map.readline, b"")
+
+    # yield the lines of the chunk as strings, with their line breaks (e.g. for csv.reader)
+    def lines(self):
+        return map(bytes.decode, self.raw_lines())
+
+    # ========================================================
+    #                    Reads by position
+    # ========================================================
+
+    # return the bytes of the row at the position in the chunk
+    def row_bytes(self, row_num: int) -> bytes:
+        row_starts = self._row_starts()
+        self.bytes_read += row_starts[row_num + 1] - row_starts[row_num]
+        return self.map[row_starts[row_num]:row_starts[row_num + 1]]
+
+    # yield the bytes of the rows at the positions in the chunk
+    def rows_at(self, row_nums):
+        row_starts = self._row_starts()
+        for row_num in row_nums:
+            self.bytes_read += row_starts[row_num + 1] - row_starts[row_num]
+            yield self.map[row_starts[row_num]:row_starts[row_num + 1]]
+
+    def row_count(self) -> int:
+        return len(self._row_starts()) - 1
+
+    def _row_starts(self) -> array:
+        stat = os.stat(self.path)
+        # a rewritten chunk has a new modification time or size
+        version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        cached = self._row_starts_cache.get(self.path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        row_starts = self._find_row_starts()
+        self._row_starts_cache[self.path] = (version, row_starts)
+        return row_starts
+
+    def _find_row_starts(self) -> array:
+        line_starts = array("q", [0])
+        if self.map is None:
+            return line_starts
+        # the last start is the end of the file
+        self._rewind()
+        for _ in iter(self.map.readline, b""):
+            line_starts.append(self.map.tell())
+        if not self.csv_rows or self.map.find(b'"', 0) == -1:
+            return line_starts
+        # a row starts at the first line the csv reader has not consumed yet
+        row_starts = array("q")
+        reader = csv.reader(self.lines())
+        lines_read = 0
+        for _ in reader:
+            row_starts.append(line_starts[lines_read])
+            lines_read = reader.line_num
+        row_starts.append(len(self.map))
+        return row_starts
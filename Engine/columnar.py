@@ -0,0 +1,226 @@
+import json
+import mmap
+import struct
+import sys
+from array import array
+
+from .plan import chunk_stats
+
+# the file extension of columnar chunks
+COLUMNAR_SUFFIX = ".col"
+# the first bytes of a columnar chunk
+MAGIC = b"RCOL"
+TYPE_NAMES = {int: "int", float: "float", str: "str"}
+TYPES = {"int": int, "float": float, "str": str}
+
+
+# convert the values of a column (strings or typed values) to a typed array,
+# a tuple for str columns
+def to_column(values, type: type):
+    if type == str:
+        return tuple(values)
+    # empty values are 0, like when a row is typed
+    if "" in values:
+        values = [value if value != "" else "0" for value in values]
+    if type == int:
+        try:
+            return array("q", map(int, values))
+        except OverflowError:
+            # too large for a 64-bit array
+            return list(map(int, values))
+    return array("d", map(float, values))
+
+
+# a relational chunk stored column by column in a typed binary layout:
+#
+#   MAGIC | header length (4 bytes) | header (json) | column 0 | column 1 | ...
+#
+# the header holds the row count and, for every column, its type, encoding, position, size
+# and min/max value. Numbers are stored as 8 byte arrays, strings as the end offsets (in bytes)
+# of their utf-8 values followed by the values concatenated, so reading a column is one read and
+# one decode, the columns a query does not need are never read, and the values of a row are
+# found by their position (e.g. for the rows an index points to)
+#
+# a ColumnarChunk read by a query counts the chunk once and the bytes it read (header and
+# columns) in the io counters of the query (explain analyze)
+class ColumnarChunk():
+    def __init__(self, path: str):
+        self.path = path
+        self.header = None
+        # the position of the first column in the file
+        self.data_start = None
+        # True once the chunk is counted as read
+        self.counted = False
+
+    # ========================================================
+    #                        Writing
+    # ========================================================
+
+    # write the typed rows (or the rows of strings) with the column types to the chunk
+    def write(self, types: tuple, rows: list) -> None:
+        raw_columns = list(zip(*rows)) if len(rows) > 0 else [() for _ in types]
+        column_headers = []
+        blocks = []
+        offset = 0
+        for values, column_type in zip(raw_columns, types):
+            column = to_column(values, column_type)
+            if isinstance(column, array):
+                encoding = column.typecode
+                block = column.tobytes()
+            else:
+                encoding = "utf8"
+                block = self._encode_strings([str(value) for value in column])
+            column_headers.append({
+                "type": TYPE_NAMES[column_type],
+                "encoding": encoding,
+                "offset": offset,
+                "length": len(block),
+                "min": min(column) if len(column) > 0 else None,
+                "max": max(column) if len(column) > 0 else None,
+            })
+            blocks.append(block)
+            offset += len(block)
+        self.header = {"rows": len(rows), "byteorder": sys.byteorder, "columns": column_headers}
+        header_bytes = json.dumps(self.header).encode()
+        self.data_start = len(MAGIC) + 4 + len(header_bytes)
+        with open(self.path, "wb") as f:
+            f.write(MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes)
+            for block in blocks:
+                f.write(block)
+
+    # the number of strings, the end offsets (in bytes) of their utf-8 values and the concatenated values
+    def _encode_strings(self, values: list) -> bytes:
+        encoded_values = [value.encode() for value in values]
+        ends = array("I")
+        end = 0
+        for encoded_value in encoded_values:
+            end += len(encoded_value)
+            ends.append(end)
+        return struct.pack("<I", len(values)) + ends.tobytes() + b"".join(encoded_values)
+
+    # ========================================================
+    #                        Reading
+    # ========================================================
+
+    # return the number of rows of the chunk
+    def row_count(self) -> int:
+        return self._load_header()["rows"]
+
+    # return the (min, max) value of every column, (None, None) for an empty chunk
+    def statistics(self) -> list:
+        return [(column["min"], column["max"]) for column in self._load_header()["columns"]]
+
+    # return {column index: typed column} of the columns, only their bytes are read
+    def read_columns(self, column_indexes: list) -> dict:
+        header = self._load_header()
+        columns = {}
+        with open(self.path, "rb") as f:
+            for column_index in column_indexes:
+                column = header["columns"][column_index]
+                f.seek(self.data_start + column["offset"])
+                columns[column_index] = self._decode(column, f.read(column["length"]))
+                self._count_read(column["length"])
+        return columns
+
+    # return the typed rows at the sorted row offsets with the columns at the column indexes (every
+    # column if None), only the bytes of their values are read
+    def read_rows_at(self, offsets: list, column_indexes: list or None = None) -> list:
+        header = self._load_header()
+        if len(offsets) == 0:
+            return []
+        if column_indexes is None:
+            column_indexes = range(len(header["columns"]))
+        columns = []
+        with open(self.path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for column_index in column_indexes:
+                    columns.append(self._values_at(header["columns"][column_index], data, offsets))
+        return [list(row) for row in zip(*columns)]
+
+    # return the typed rows of the chunk
+    def read_rows(self) -> list:
+        header = self._load_header()
+        if header["rows"] == 0:
+            return []
+        columns = self.read_columns(range(len(header["columns"])))
+        return [list(row) for row in zip(*(columns[column_index] for column_index in range(len(columns))))]
+
+    def _load_header(self) -> dict:
+        if self.header is not None:
+            return self.header
+        with open(self.path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise Exception(f"{self.path} is not a columnar chunk")
+            header_length = struct.unpack("<I", f.read(4))[0]
+            self.header = json.loads(f.read(header_length))
+        self.data_start = len(MAGIC) + 4 + header_length
+        self._count_read(self.data_start)
+        return self.header
+
+    # count the bytes read from the chunk, and the chunk on its first read, for the query
+    def _count_read(self, byte_count: int) -> None:
+        stats = chunk_stats(self.path)
+        if stats is None:
+            return
+        if not self.counted:
+            stats.chunks_read += 1
+            self.counted = True
+        stats.bytes_read += byte_count
+
+    def _decode(self, column: dict, block: bytes):
+        if column["encoding"] != "utf8":
+            values = array(column["encoding"])
+            values.frombytes(block)
+            if self.header["byteorder"] != sys.byteorder:
+                values.byteswap()
+            return values
+        count = struct.unpack("<I", block[:4])[0]
+        ends = array("I")
+        ends.frombytes(block[4:4 + 4 * count])
+        if self.header["byteorder"] != sys.byteorder:
+            ends.byteswap()
+        data = block[4 + 4 * count:]
+        text = data.decode()
+        starts = [0]
+        starts.extend(ends[:-1])
+        if len(text) == len(data):
+            # the byte offsets of ascii text are its character offsets
+            values = tuple(map(text.__getitem__, map(slice, starts, ends)))
+        else:
+            values = tuple(data[start:end].decode() for start, end in zip(starts, ends))
+        return self._typed_strings(column, values)
+
+    # return the values of the column at the sorted row offsets from the mapped chunk
+    def _values_at(self, column: dict, data: mmap.mmap, offsets: list):
+        start = self.data_start + column["offset"]
+        swap = self.header["byteorder"] != sys.byteorder
+        if column["encoding"] != "utf8":
+            values = array(column["encoding"])
+            for offset in offsets:
+                values.frombytes(data[start + values.itemsize * offset:start + values.itemsize * (offset + 1)])
+            if swap:
+                values.byteswap()
+            self._count_read(values.itemsize * len(offsets))
+            return values
+        count = struct.unpack_from("<I", data, start)[0]
+        ends_start = start + 4
+        text_start = ends_start + 4 * count
+        values = []
+        byte_count = 4
+        for offset in offsets:
+            # the end of the string before is the start of the string
+            bounds = array("I")
+            bounds.frombytes(data[ends_start + 4 * max(offset - 1, 0):ends_start + 4 * (offset + 1)])
+            if swap:
+                bounds.byteswap()
+            value_start = bounds[0] if offset > 0 else 0
+            values.append(data[text_start + value_start:text_start + bounds[-1]].decode())
+            byte_count += 4 * len(bounds) + bounds[-1] - value_start
+        self._count_read(byte_count)
+        return self._typed_strings(column, values)
+
+    def _typed_strings(self, column: dict, values):
+        if column["type"] == "str":
+            return values
+        # numbers too large for an array
+        return list(map(TYPES[column["type"]], values))
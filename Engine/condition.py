@@ -0,0 +1,184 @@
+# parser of the conditions of where clauses, shared by both engines
+#
+# condition := or_expr
+# or_expr   := and_expr (or and_expr)*
+# and_expr  := not_expr (and not_expr)*
+# not_expr  := not not_expr | ( condition ) | predicate
+# predicate := field <op> value
+#            | field [not] in ( value, value, ... )
+#            | field [not] between value and value
+#            | field [not] like pattern
+#
+# keywords are case insensitive. A value is either quoted ('...' or "...") or runs until
+# the next and/or keyword (or the end of the group), so values can contain spaces: name=The Shining
+#
+# the result is a tree of tuples:
+#   ("compare", field, op, value), ("in", field, [values]), ("between", field, low, high),
+#   ("like", field, pattern), ("not", node), ("and", [nodes]), ("or", [nodes])
+# where every value is still a string
+
+COMPARISON_OPS = ("!=", ">=", "<=", "=", ">", "<")
+KEYWORDS = ("and", "or", "not", "in", "between", "like")
+
+
+class ConditionParser():
+    def __init__(self, condition: str):
+        self.condition = condition
+        self.tokens = self._tokenize(condition)
+        self.pos = 0
+
+    # return the tree of the condition, raise ValueError if the condition is invalid
+    def parse(self) -> tuple:
+        if len(self.tokens) == 0:
+            raise ValueError("empty condition")
+        node = self._parse_or()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"unexpected '{self.tokens[self.pos][1]}'")
+        return node
+
+    # ========================================================
+    #                        Tokens
+    # ========================================================
+
+    # split the condition into (kind, text, start, end) tokens
+    # kinds: "quoted", "op", "(", ")", ",", "word"
+    def _tokenize(self, condition: str) -> list:
+        tokens = []
+        i = 0
+        while i < len(condition):
+            char = condition[i]
+            if char.isspace():
+                i += 1
+            elif char in "'\"":
+                end = condition.find(char, i + 1)
+                if end == -1:
+                    raise ValueError("unterminated quote")
+                tokens.append(("quoted", condition[i + 1:end], i, end + 1))
+                i = end + 1
+            elif condition[i:i + 2] in COMPARISON_OPS:
+                tokens.append(("op", condition[i:i + 2], i, i + 2))
+                i += 2
+            elif char in "=<>":
+                tokens.append(("op", char, i, i + 1))
+                i += 1
+            elif char in "(),":
+                tokens.append((char, char, i, i + 1))
+                i += 1
+            else:
+                start = i
+                while i < len(condition) and not condition[i].isspace() and condition[i] not in "=<>(),'\"" and condition[i:i + 2] != "!=":
+                    i += 1
+                tokens.append(("word", condition[start:i], start, i))
+        return tokens
+
+    def _peek(self) -> tuple or None:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _peek_keyword(self, keyword: str) -> bool:
+        token = self._peek()
+        return token is not None and token[0] == "word" and token[1].lower() == keyword
+
+    def _expect(self, kind: str) -> tuple:
+        token = self._peek()
+        if token is None or token[0] != kind:
+            raise ValueError(f"expected '{kind}'")
+        self.pos += 1
+        return token
+
+    # ========================================================
+    #                     Boolean operators
+    # ========================================================
+
+    def _parse_or(self) -> tuple:
+        nodes = [self._parse_and()]
+        while self._peek_keyword("or"):
+            self.pos += 1
+            nodes.append(self._parse_and())
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def _parse_and(self) -> tuple:
+        nodes = [self._parse_not()]
+        while self._peek_keyword("and"):
+            self.pos += 1
+            nodes.append(self._parse_not())
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def _parse_not(self) -> tuple:
+        if self._peek_keyword("not"):
+            self.pos += 1
+            return ("not", self._parse_not())
+        token = self._peek()
+        if token is not None and token[0] == "(":
+            self.pos += 1
+            node = self._parse_or()
+            self._expect(")")
+            return node
+        return self._parse_predicate()
+
+    # ========================================================
+    #                       Predicates
+    # ========================================================
+
+    def _parse_predicate(self) -> tuple:
+        token = self._peek()
+        if token is None or token[0] != "word" or token[1].lower() in KEYWORDS:
+            raise ValueError("expected a field")
+        field = token[1]
+        self.pos += 1
+        token = self._peek()
+        if token is not None and token[0] == "op":
+            self.pos += 1
+            return ("compare", field, token[1], self._parse_value())
+        negated = False
+        if self._peek_keyword("not"):
+            self.pos += 1
+            negated = True
+        if self._peek_keyword("in"):
+            self.pos += 1
+            self._expect("(")
+            values = [self._parse_value(in_list=True)]
+            while self._peek() is not None and self._peek()[0] == ",":
+                self.pos += 1
+                values.append(self._parse_value(in_list=True))
+            self._expect(")")
+            node = ("in", field, values)
+        elif self._peek_keyword("between"):
+            self.pos += 1
+            low = self._parse_value()
+            if not self._peek_keyword("and"):
+                raise ValueError("expected 'and' in between")
+            self.pos += 1
+            node = ("between", field, low, self._parse_value())
+        elif self._peek_keyword("like"):
+            self.pos += 1
+            node = ("like", field, self._parse_value())
+        else:
+            raise ValueError(f"expected an operator after {field}")
+        return ("not", node) if negated else node
+
+    # return the text of a value: a quoted string, or the tokens up to the next and/or keyword,
+    # the closing parenthesis of the group (or a comma in an in list)
+    def _parse_value(self, in_list: bool = False) -> str:
+        token = self._peek()
+        if token is not None and token[0] == "quoted":
+            self.pos += 1
+            return token[1]
+        start = end = None
+        depth = 0
+        while self.pos < len(self.tokens):
+            kind, text, token_start, token_end = self.tokens[self.pos]
+            if kind == "word" and text.lower() in ("and", "or") and depth == 0:
+                break
+            if kind == ")":
+                if depth == 0:
+                    break
+                depth -= 1
+            elif kind == "(":
+                depth += 1
+            elif kind == "," and in_list and depth == 0:
+                break
+            if start is None:
+                start = token_start
+            end = token_end
+            self.pos += 1
+        return self.condition[start:end] if start is not None else ""
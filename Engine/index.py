@@ -0,0 +1,248 @@
+import bisect
+import heapq
+import json
+import os
+
+from config import INDEX_LOG_MAX_ENTRIES
+from .catalog import file_version
+
+
+class IndexStore():
+    # indexes are cached per index file and shared by all engine instances
+    # so that lookups do not have to parse the index file again: index path ->
+    # ((index file version, log file version), index), an index rewritten (or logged to)
+    # by another process has a new version
+    _cache = {}
+
+    def __init__(self, storage_path: str, key=None, key_bounds=None):
+        # storage_path: the directory holding one subdir per table
+        # key: orders the indexed values (e.g. mix_key for NoSQL), None for the natural order
+        # key_bounds: returns the (low, high) sort keys of the values comparable with a value,
+        # None if all values are comparable
+        self.storage_path = storage_path
+        self.key = key
+        self.key_bounds = key_bounds
+
+    # ========================================================
+    #                   Index management
+    # ========================================================
+
+    # an index is a list of (value, chunk number, row offset) entries sorted by value,
+    # so looking up a range of values takes two binary searches
+    #
+    # the changes of inserts, updates and deletes are appended to the log of the index
+    # (index_<field>.log, one json line per change) instead of rewriting the index file, so
+    # a write costs the entries it changes. Lookups merge the log: the entries it adds are kept
+    # sorted apart from the entries of the index file, whose rewritten chunks it removes.
+    # Once the log holds INDEX_LOG_MAX_ENTRIES entries it is folded into a new index file.
+    # The index file has a generation and the log starts with the generation it applies to,
+    # so a log left behind by a fold that failed halfway is ignored
+
+    # create the index of the field from an iterable of (value, chunk number, row offset)
+    def create(self, table_name: str, field: str, entries) -> None:
+        generation = 0
+        if os.path.exists(self._get_index_path(table_name, field)):
+            generation = self._load(table_name, field)["generation"] + 1
+        self._save(table_name, field, sorted(entries, key=self._entry_key), generation)
+
+    # remove the index file of the field and its log
+    def drop(self, table_name: str, field: str) -> None:
+        index_path = self._get_index_path(table_name, field)
+        self._cache.pop(index_path, None)
+        # the log first, a log without its index file must not be applied to a new index
+        for path in (self._get_log_path(table_name, field), index_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    # forget the cached indexes of the table, e.g. after the table is dropped
+    def invalidate(self, table_name: str) -> None:
+        table_path = f"{self.storage_path}/{table_name}/"
+        for index_path in [path for path in list(self._cache) if path.startswith(table_path)]:
+            self._cache.pop(index_path, None)
+
+    # add new (value, chunk number, row offset) entries to the index
+    def add_entries(self, table_name: str, field: str, entries: list) -> None:
+        if len(entries) == 0:
+            return
+        self._log_change(table_name, field, [], entries)
+
+    # replace the entries of the rewritten chunks with the entries of their new rows
+    def replace_chunks(self, table_name: str, field: str, chunk_nums: set, entries: list) -> None:
+        self._log_change(table_name, field, sorted(chunk_nums), entries)
+
+    # ========================================================
+    #                        Lookups
+    # ========================================================
+
+    # ranges are (low, high, low inclusive, high inclusive) with None for an unbounded side
+
+    # return the number of entries with a value in one of the ranges
+    # the entries of the index file in chunks rewritten since are counted too, the count is an estimate
+    # until the log is folded into the index file
+    def count_ranges(self, table_name: str, field: str, ranges: list) -> int:
+        index = self._load(table_name, field)
+        count = 0
+        for value_range in ranges:
+            for keys in (index["keys"], index["log_keys"]):
+                lo, hi = self._find_range(keys, value_range)
+                count += hi - lo
+        return count
+
+    # return {chunk number: sorted row offsets} of the rows with a value in one of the ranges
+    def lookup_ranges(self, table_name: str, field: str, ranges: list) -> dict:
+        index = self._load(table_name, field)
+        removed = index["removed"]
+        positions = {}
+        for value_range in ranges:
+            lo, hi = self._find_range(index["keys"], value_range)
+            for _, chunk_num, offset in index["entries"][lo:hi]:
+                if chunk_num not in removed:
+                    positions.setdefault(chunk_num, set()).add(offset)
+            lo, hi = self._find_range(index["log_keys"], value_range)
+            for _, chunk_num, offset in index["log_entries"][lo:hi]:
+                positions.setdefault(chunk_num, set()).add(offset)
+        return {chunk_num: sorted(positions[chunk_num]) for chunk_num in sorted(positions)}
+
+    # ========================================================
+    #                        Helpers
+    # ========================================================
+
+    def _get_index_path(self, table_name: str, field: str) -> str:
+        return f"{self.storage_path}/{table_name}/index_{field}.json"
+
+    # return the (lo, hi) positions of the entries with a value in the range
+    def _find_range(self, keys: list, value_range: tuple) -> tuple:
+        low, high, low_inclusive, high_inclusive = value_range
+        lo, hi = 0, len(keys)
+        if self.key_bounds is not None:
+            # only values comparable with the bounds can be in the range
+            first_bound, end_bound = self.key_bounds(low if low is not None else high)
+            lo, hi = bisect.bisect_left(keys, first_bound), bisect.bisect_left(keys, end_bound)
+        if low is not None:
+            low_key = self.key(low) if self.key is not None else low
+            if low_inclusive:
+                lo = bisect.bisect_left(keys, low_key, lo, hi)
+            else:
+                lo = bisect.bisect_right(keys, low_key, lo, hi)
+        if high is not None:
+            high_key = self.key(high) if self.key is not None else high
+            if high_inclusive:
+                hi = bisect.bisect_right(keys, high_key, lo, hi)
+            else:
+                hi = bisect.bisect_left(keys, high_key, lo, hi)
+        return lo, max(lo, hi)
+
+    def _entry_key(self, entry):
+        value, chunk_num, offset = entry
+        return (self._value_key(value), chunk_num, offset)
+
+    def _get_log_path(self, table_name: str, field: str) -> str:
+        return f"{self.storage_path}/{table_name}/index_{field}.log"
+
+    # return the index with its log applied
+    def _load(self, table_name: str, field: str) -> dict:
+        index_path = self._get_index_path(table_name, field)
+        log_path = self._get_log_path(table_name, field)
+        version = (file_version(index_path), file_version(log_path))
+        cached = self._cache.get(index_path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        if cached is not None and cached[0][0] == version[0]:
+            # only the log changed, the entries of the index file are kept
+            index = self._make_index(cached[1]["entries"], cached[1]["keys"], cached[1]["generation"])
+        else:
+            with open(index_path, "r") as f:
+                index_file = json.load(f)
+            index = self._make_index([tuple(entry) for entry in index_file["entries"]], None, index_file.get("generation", 0))
+        if version[1] is not None:
+            with open(log_path, "r") as f:
+                lines = f.read().splitlines()
+            if len(lines) > 0 and self._log_generation(lines[0]) == index["generation"]:
+                index["logged"] = True
+                for line in lines[1:]:
+                    try:
+                        change = json.loads(line)
+                    except json.JSONDecodeError:
+                        # the last change was not written out
+                        break
+                    self._apply_change(index, change["remove"], [tuple(entry) for entry in change["add"]])
+        self._cache[index_path] = (version, index)
+        return index
+
+    # return the generation of the index file a log applies to, None if its first line was not written out
+    def _log_generation(self, line: str) -> int or None:
+        try:
+            return json.loads(line)["generation"]
+        except json.JSONDecodeError:
+            return None
+
+    # write the index file of the sorted entries and remove the log folded into it
+    def _save(self, table_name: str, field: str, entries: list, generation: int) -> None:
+        index_path = self._get_index_path(table_name, field)
+        log_path = self._get_log_path(table_name, field)
+        # write to a temp file and rename it so readers never see a partial index
+        with open(f"{index_path}.tmp", "w") as f:
+            json.dump({"field": field, "generation": generation, "entries": entries}, f)
+        os.replace(f"{index_path}.tmp", index_path)
+        if os.path.exists(log_path):
+            os.remove(log_path)
+        self._cache[index_path] = ((file_version(index_path), None), self._make_index(entries, None, generation))
+
+    # append a change (the chunks whose entries are removed, the entries added) to the log of the
+    # index, or fold the log into a new index file once it is long enough
+    def _log_change(self, table_name: str, field: str, removed_chunks: list, entries: list) -> None:
+        index = self._load(table_name, field)
+        self._apply_change(index, removed_chunks, entries)
+        if index["log_size"] >= INDEX_LOG_MAX_ENTRIES:
+            kept_entries = [entry for entry in index["entries"] if entry[1] not in index["removed"]]
+            self._save(table_name, field, list(heapq.merge(kept_entries, index["log_entries"], key=self._entry_key)), index["generation"] + 1)
+            return
+        index_path = self._get_index_path(table_name, field)
+        log_path = self._get_log_path(table_name, field)
+        lines = []
+        if not index["logged"]:
+            # a new log (or one left behind by a failed fold) starts with the generation of the index
+            lines.append(json.dumps({"generation": index["generation"]}))
+            index["logged"] = True
+        lines.append(json.dumps({"remove": removed_chunks, "add": entries}))
+        with open(log_path, "a" if len(lines) == 1 else "w") as f:
+            f.write("\n".join(lines) + "\n")
+        self._cache[index_path] = ((file_version(index_path), file_version(log_path)), index)
+
+    # apply a change of the log to the index
+    def _apply_change(self, index: dict, removed_chunks: list, entries: list) -> None:
+        log_entries = index["log_entries"]
+        if len(removed_chunks) > 0:
+            removed_chunks = set(removed_chunks)
+            index["removed"] |= removed_chunks
+            log_entries = [entry for entry in log_entries if entry[1] not in removed_chunks]
+        if len(entries) == 1 and log_entries is index["log_entries"]:
+            # a single row written
+            position = bisect.bisect_right(log_entries, self._entry_key(entries[0]), key=self._entry_key)
+            log_entries.insert(position, entries[0])
+            index["log_keys"].insert(position, self._value_key(entries[0][0]))
+        else:
+            index["log_entries"] = list(heapq.merge(log_entries, sorted(entries, key=self._entry_key), key=self._entry_key))
+            index["log_keys"] = [self._value_key(value) for value, _, _ in index["log_entries"]]
+        index["log_size"] += len(entries)
+
+    # keep the sort keys next to the entries for binary searches
+    # the entries added by the log and the chunks whose entries of the index file it removed are
+    # kept apart
+    def _make_index(self, entries: list, keys: list or None, generation: int) -> dict:
+        if keys is None:
+            keys = [self._value_key(value) for value, _, _ in entries]
+        return {
+            "keys": keys,
+            "entries": entries,
+            "generation": generation,
+            "logged": False,
+            "removed": set(),
+            "log_keys": [],
+            "log_entries": [],
+            # the entries the log added
+            "log_size": 0,
+        }
+
+    def _value_key(self, value):
+        return self.key(value) if self.key is not None else value
@@ -0,0 +1,166 @@
+import functools
+import inspect
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # no file locks (e.g. Windows): tables are only locked between the threads of a process
+    fcntl = None
+
+# the locks of the tables held by the current thread: lock path -> "read" or "write"
+_local = threading.local()
+
+
+# a readers-writer lock between the threads of a process: any number of readers or a single
+# writer. A waiting writer keeps new readers out, so writers are not starved by a stream of reads
+class ReadersWriterLock():
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writer = False
+        self.writers_waiting = 0
+
+    def acquire_read(self) -> None:
+        with self.condition:
+            while self.writer or self.writers_waiting > 0:
+                self.condition.wait()
+            self.readers += 1
+
+    def release_read(self) -> None:
+        with self.condition:
+            self.readers -= 1
+            if self.readers == 0:
+                self.condition.notify_all()
+
+    def acquire_write(self) -> None:
+        with self.condition:
+            self.writers_waiting += 1
+            while self.writer or self.readers > 0:
+                self.condition.wait()
+            self.writers_waiting -= 1
+            self.writer = True
+
+    def release_write(self) -> None:
+        with self.condition:
+            self.writer = False
+            self.condition.notify_all()
+
+
+# the readers-writer locks of the tables of an engine: queries reading a table share its lock,
+# a query writing a table (insert, update, delete, compaction, ...) holds it alone, so writes
+# only wait for the queries on the same table. Between processes (e.g. the workers of a WSGI
+# server), the lock of a table is also a shared / exclusive flock on the file .<table>.lock in
+# the storage directory
+#
+#   with locks.lock(read=["movies", "ratings"]):
+#       ...
+#
+class TableLocks():
+    # lock path -> ReadersWriterLock, shared by all engine instances of the process
+    _locks = {}
+    _locks_guard = threading.Lock()
+
+    def __init__(self, storage_path: str):
+        self.storage_path = storage_path
+
+    # return the context holding the read locks of the tables in read and the write locks of the
+    # tables in write, taken in the order of the table names so two queries cannot deadlock
+    def lock(self, read=(), write=()) -> "HeldLocks":
+        modes = {table_name: "read" for table_name in read}
+        modes.update({table_name: "write" for table_name in write})
+        return HeldLocks([(self._lock_path(table_name), modes[table_name]) for table_name in sorted(modes)])
+
+    def _lock_path(self, table_name: str) -> str:
+        return f"{self.storage_path}/.{table_name}.lock"
+
+    @classmethod
+    def _thread_lock(cls, lock_path: str) -> ReadersWriterLock:
+        with cls._locks_guard:
+            lock = cls._locks.get(lock_path)
+            if lock is None:
+                lock = cls._locks[lock_path] = ReadersWriterLock()
+            return lock
+
+
+# the table locks taken by a query, released when it ends
+# a thread already holding the lock of a table (e.g. aggregate calling multi_aggregate) does not
+# take it again
+class HeldLocks():
+    def __init__(self, locks: list):
+        # [(lock path, "read" or "write")] in the order they are taken
+        self.locks = locks
+        # [(lock path, mode, lock file or None)] taken by this context
+        self.taken = []
+
+    def __enter__(self):
+        held = _held_locks()
+        try:
+            for lock_path, mode in self.locks:
+                if lock_path in held:
+                    if mode == "write" and held[lock_path] == "read":
+                        raise Exception(f"cannot write the table of {lock_path} while reading it")
+                    continue
+                lock = TableLocks._thread_lock(lock_path)
+                if mode == "read":
+                    lock.acquire_read()
+                else:
+                    lock.acquire_write()
+                # the file lock is taken after the thread lock, so only one thread of the process waits on it
+                lock_file = None
+                if fcntl is not None:
+                    lock_file = open(lock_path, "a")
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_SH if mode == "read" else fcntl.LOCK_EX)
+                self.taken.append((lock_path, mode, lock_file))
+                held[lock_path] = mode
+        except BaseException:
+            self._release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        self._release()
+        return False
+
+    def _release(self) -> None:
+        held = _held_locks()
+        # release in the reverse order
+        while len(self.taken) > 0:
+            lock_path, mode, lock_file = self.taken.pop()
+            if lock_file is not None:
+                # closing the file releases the flock
+                lock_file.close()
+            lock = TableLocks._thread_lock(lock_path)
+            if mode == "read":
+                lock.release_read()
+            else:
+                lock.release_write()
+            held.pop(lock_path, None)
+
+
+def _held_locks() -> dict:
+    held = getattr(_local, "held", None)
+    if held is None:
+        held = _local.held = {}
+    return held
+
+
+# run the query method (of an engine) holding the read locks of the tables named by the parameters
+# in read and the write locks of the tables named by the parameters in write, e.g.
+#
+#   @locks_tables(read=("left", "right"))
+#   def join(self, left: str, right: str, condition: str, io_output=sys.stdout) -> bool:
+#
+def locks_tables(read=(), write=()):
+    def decorate(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def run_query(self, *args, **kwargs):
+            arguments = signature.bind(self, *args, **kwargs).arguments
+            read_tables = [arguments[param] for param in read if isinstance(arguments.get(param), str)]
+            write_tables = [arguments[param] for param in write if isinstance(arguments.get(param), str)]
+            with self.locks.lock(read=read_tables, write=write_tables):
+                return method(self, *args, **kwargs)
+        return run_query
+    return decorate
@@ -1,18 +1,38 @@
+import copy
 import csv
+import heapq
+import itertools
 import json
 import operator
 import os
-from queue import PriorityQueue
 import re
 import sys
+import time
 from Engine.base import BaseEngine
-from config import BASE_DIR, CHUNK_SIZE, TEMP_DIR
-from utils.DocElement import DocElement
-from utils.util import add_key, clear_temp_files, get_key_val, mix_key
+from Engine.catalog import Catalog
+from Engine.chunkreader import ChunkReader
+from Engine.index import IndexStore
+from Engine.operators import Aggregate, HashAggregate, Project, Sort, TopKSort
+from Engine.parallel import map_chunks, task_workers
+from Engine.locks import TableLocks, locks_tables
+from Engine.workspace import in_temp_workspace, temp_files, temp_path
+from Engine.runs import RunWriter, merge_runs, read_run, replacement_selection, write_runs
+from Engine.sortkey import SortKey, encode_mixed
+from Engine.plan import PlanNode
+from Engine.zonemap import ZoneMap
+from Engine.predicate import And, DocBetween, DocComparison, DocIn, DocLike, Not, Or, Predicate
+from config import BASE_DIR, CHUNK_SIZE, HASH_AGG_MEMORY_GROUPS, HASH_JOIN_MEMORY_ROWS, MERGE_FAN_IN, TOP_K_MAX_ROWS
+from utils.Accumulator import create_accumulator
+from utils.util import add_key, get_key_val, mix_key
 
 class NoSQL(BaseEngine):
     def __init__(self):
         super().__init__()
+        self.catalog = Catalog(f"{BASE_DIR}/Storage/NoSQL")
+        self.locks = TableLocks(f"{BASE_DIR}/Storage/NoSQL")
+        # indexed values are ordered like the rest of the engine: strings before numbers,
+        # and strings only compare with strings, numbers with numbers
+        self.indexes = IndexStore(f"{BASE_DIR}/Storage/NoSQL", key=mix_key, key_bounds=self._kind_bounds)
     
     def run(self):
         print("NoSQL Database selected")
@@ -27,6 +47,7 @@ class NoSQL(BaseEngine):
                 self._print_doc({"table": file}, io_output=io_output)
         return True
     
+    @locks_tables(write=("table_name",))
     def create_table(self, table_name: str, fields: list, io_output=sys.stdout) -> bool:
         # check if table already exists
         if self._table_exists(table_name):
@@ -37,9 +58,12 @@ class NoSQL(BaseEngine):
         table_storage_path = self._get_table_path(table_name)
         # create the table directory
         os.mkdir(table_storage_path)
+        # create the manifest of the table
+        self.catalog.create(table_name)
         print("table created", file=io_output)
         return True
 
+    @locks_tables(write=("table_name",))
     def drop_table(self, table_name: str, io_output=sys.stdout) -> bool:
         if not self._table_exists(table_name):
             print(f"Table {table_name} does not exist!", file=io_output)
@@ -49,6 +73,8 @@ class NoSQL(BaseEngine):
         for file in os.listdir(table_storage_path):
             os.remove(f"{table_storage_path}/{file}")
         os.rmdir(table_storage_path)
+        self.catalog.invalidate(table_name)
+        self.indexes.invalidate(table_name)
         print("table dropped", file=io_output)
         return True
 
@@ -57,30 +83,35 @@ class NoSQL(BaseEngine):
         if not file_name.endswith(".csv"):
             print("file must be a csv file", file=io_output)
             return True
-        print("loading data...")
+        print("loading data...", file=io_output)
         csv_file_path = f"{BASE_DIR}/ToBeLoaded/{file_name}"
         table_name = file_name.split(".")[0]
-        table_storage_path = f"{BASE_DIR}/Storage/NoSQL/{table_name}"
-        # create the table directory if not exists
-        if not os.path.exists(table_storage_path):
-            os.mkdir(table_storage_path)
-        else:
-            print("Cannot load dataset. Table already exists!", file=io_output)
-            return True
-        # read the first line of the csv to find the schema
-        with open(csv_file_path, 'r') as f:
-            csv_reader = csv.reader(f)
-            table_schema = next(csv_reader)
-            csv_row = next(csv_reader, None)
-            while csv_row is not None:
-                # convert csv row to json
-                doc = self._csv_row_to_doc(csv_row, table_schema)
-                # insert the doc into the table
-                self._insert_doc(table_name, doc)
-                csv_row = next(csv_reader, None)
-        print("loading succeeded", file=io_output)
-        return True
+        # the table is written alone while it is loaded
+        with self.locks.lock(write=[table_name]):
+            table_storage_path = f"{BASE_DIR}/Storage/NoSQL/{table_name}"
+            # create the table directory if not exists
+            if not os.path.exists(table_storage_path):
+                os.mkdir(table_storage_path)
+            else:
+                print("Cannot load dataset. Table already exists!", file=io_output)
+                return True
+            # create the manifest of the table
+            self.catalog.create(table_name)
+            # read the first line of the csv to find the schema
+            start_time = time.perf_counter()
+            with open(csv_file_path, 'r') as f:
+                csv_reader = csv.reader(f)
+                table_schema = next(csv_reader)
+                # convert csv rows to docs lazily so the csv is never held in memory
+                docs = (self._csv_row_to_doc(csv_row, table_schema) for csv_row in csv_reader)
+                doc_count = self._bulk_insert_docs(table_name, docs)
+            elapsed = time.perf_counter() - start_time
+            docs_per_sec = doc_count / elapsed if elapsed > 0 else float(doc_count)
+            print(f"loaded {doc_count} docs in {elapsed:.2f}s ({docs_per_sec:.0f} docs/sec)", file=io_output)
+            print("loading succeeded", file=io_output)
+            return True
     
+    @locks_tables(write=("table_name",))
     def insert_data(self, table_name: str, data: list, io_output=sys.stdout) -> bool:
         # check if table exists
         if not self._table_exists(table_name):
@@ -97,248 +128,263 @@ class NoSQL(BaseEngine):
         print("insertion succeeded", file=io_output)
         return True
     
+    @locks_tables(write=("table_name",))
     def delete_data(self, table_name: str, condition: str, io_output=sys.stdout) -> bool:
         # check if table exists
         if not self._table_exists(table_name):
             print(f"Table {table_name} does not exist!", file=io_output)
             return True
-        for chunk in self._get_table_chunks(table_name):
-            docs = self._read_docs_from_file(chunk)
-            self._clear_file(chunk)
-            filtered_docs = filter(lambda doc: not self._doc_meets_condition(doc, condition), docs)
-            self._write_docs_to_file(filtered_docs, chunk)
+        # parse the condition once for all docs
+        predicate = self._compile_condition(table_name, condition, io_output)
+        if predicate is None:
+            return True
+        scan = self._plan_scan(table_name, predicate)
+        filter_node = self._plan_filter(table_name, predicate, scan)
+        plan = PlanNode("Delete", f"on {table_name}", None, [filter_node])
+        if not self._begin_plan(plan):
+            return True
+        # only the chunks that can hold matching docs are read, using an index if there is one
+        chunk_docs = {}
+        rewritten_chunks = {}
+        for chunk_num, docs in self._read_candidate_chunks(table_name, predicate):
+            filtered_docs = [doc for doc in docs if not predicate(doc)]
+            scan.count(len(docs))
+            filter_node.count(len(docs) - len(filtered_docs))
+            plan.count(len(docs) - len(filtered_docs))
+            if len(filtered_docs) == len(docs):
+                continue
+            self._overwrite_docs_in_file(filtered_docs, self._get_chunk_path(table_name, chunk_num))
+            chunk_docs[chunk_num] = len(filtered_docs)
+            rewritten_chunks[chunk_num] = filtered_docs
+        # record the new doc counts and zone maps in the catalog and the new line positions in the indexes
+        if len(chunk_docs) > 0:
+            self.catalog.set_chunk_rows(table_name, chunk_docs, {chunk_num: self._zone_of_docs(docs) for chunk_num, docs in rewritten_chunks.items()})
+            self._reindex_chunks(table_name, rewritten_chunks)
         print("deletion succeeded", file=io_output)
         return True
     
+    @locks_tables(write=("table_name",))
     def update_data(self, table_name: str, condition: str, data: list, io_output=sys.stdout) -> bool:
         # check if table exists
         if not self._table_exists(table_name):
             print(f"Table {table_name} does not exist!", file=io_output)
             return True
-        for chunk in self._get_table_chunks(table_name):
-            docs = self._read_docs_from_file(chunk)
-            self._clear_file(chunk)
+        # parse the condition once for all docs
+        predicate = self._compile_condition(table_name, condition, io_output)
+        if predicate is None:
+            return True
+        scan = self._plan_scan(table_name, predicate)
+        filter_node = self._plan_filter(table_name, predicate, scan)
+        plan = PlanNode("Update", f"on {table_name} set {','.join(data)}", None, [filter_node])
+        if not self._begin_plan(plan):
+            return True
+        # only the chunks that can hold matching docs are read, using an index if there is one
+        rewritten_chunks = {}
+        for chunk_num, docs in self._read_candidate_chunks(table_name, predicate):
+            updated = False
+            scan.count(len(docs))
             for doc in docs:
-                if self._doc_meets_condition(doc, condition):
+                if predicate(doc):
+                    filter_node.count(1)
+                    plan.count(1)
                     for field_data in data:
                         field_name, field_value = field_data.split("=")
                         doc[field_name] = self._get_typed_value(field_value)
-                self._write_doc_to_file(doc, chunk)
+                    updated = True
+            if not updated:
+                continue
+            self._overwrite_docs_in_file(docs, self._get_chunk_path(table_name, chunk_num))
+            rewritten_chunks[chunk_num] = docs
+        # record the new values in the zone maps and the indexes
+        if len(rewritten_chunks) > 0:
+            self.catalog.set_zones(table_name, {chunk_num: self._zone_of_docs(docs) for chunk_num, docs in rewritten_chunks.items()})
+            self._reindex_chunks(table_name, rewritten_chunks)
         print("update succeeded", file=io_output)
         return True
     
-    def projection(self, table_name: str, fields: list, io_output=sys.stdout) -> bool:
+    @locks_tables(read=("table_name",))
+    def projection(self, table_name: str, fields: list, io_output=sys.stdout, limit: int = None, offset: int = 0) -> bool:
         # check if table exists
         if not self._table_exists(table_name):
             print(f"Table {table_name} does not exist!", file=io_output)
             return True
-        for chunk in self._get_table_chunks(table_name):
-            docs = self._read_docs_from_file(chunk)
-            for doc in docs:
-                projected_doc = {}
-                if len(fields) == 1 and fields[0] == "*":
-                    # if fields is *, return the whole doc
-                    projected_doc = doc
-                else:
-                    # else, return only the fields in fields
-                    for field in fields:
-                        if field in doc:
-                            projected_doc[field] = doc[field]
-                self._print_doc(projected_doc, io_output=io_output)
+        # a limited scan stops once it has its docs, in the process of the query
+        workers = self._scan_workers(table_name, None) if limit is None else 1
+        if workers > 1:
+            # every worker projects the docs of a chunk, the docs are printed in chunk order
+            worker_plan = Project(self._plan_scan(table_name), fields, None)
+            chunk_args = [(chunk, None, fields) for chunk in self._gather_chunk_paths(table_name, None)]
+            plan = self._plan_gather(worker_plan, workers, "_filter_chunk", chunk_args, batched=True)
+        else:
+            plan = Project(self._plan_scan(table_name), fields, lambda doc: self._project_doc(doc, fields))
+        plan = self._plan_limit(plan, limit, offset)
+        if not self._begin_plan(plan):
+            return True
+        for projected_doc in itertools.chain.from_iterable(plan) if plan.batched else plan:
+            self._print_doc(projected_doc, io_output=io_output)
         print("projection succeeded", file=io_output)
         return True
     
-    def filtering(self, table_name: str, fields: list, condition: str, io_output=sys.stdout) -> bool:
+    @locks_tables(read=("table_name",))
+    def filtering(self, table_name: str, fields: list, condition: str, io_output=sys.stdout, limit: int = None, offset: int = 0) -> bool:
         # check if table exists
         if not self._table_exists(table_name):
             print(f"Table {table_name} does not exist!", file=io_output)
             return True
-        for chunk in self._get_table_chunks(table_name):
-            docs = self._read_docs_from_file(chunk)
-            for doc in docs:
-                if self._doc_meets_condition(doc, condition):
-                    projected_doc = {}
-                    if len(fields) == 1 and fields[0] == "*":
-                        # if fields is *, return the whole doc
-                        projected_doc = doc
-                    else:
-                        # else, return only the fields in fields
-                        for field in fields:
-                            if field in doc:
-                                projected_doc[field] = doc[field]
-                    self._print_doc(projected_doc, io_output=io_output)
+        # parse the condition once for all docs
+        predicate = self._compile_condition(table_name, condition, io_output)
+        if predicate is None:
+            return True
+        # a limited scan stops once it has its docs, in the process of the query
+        workers = self._scan_workers(table_name, predicate) if limit is None else 1
+        if workers > 1:
+            # every worker filters the docs of a chunk, the docs are printed in chunk order
+            worker_plan = Project(self._plan_rows(table_name, predicate), fields, None)
+            chunk_args = [(chunk, predicate, fields) for chunk in self._gather_chunk_paths(table_name, predicate)]
+            plan = self._plan_gather(worker_plan, workers, "_filter_chunk", chunk_args, batched=True)
+        else:
+            # only the docs that can meet the condition are deserialized, using an index if there is one
+            plan = Project(self._plan_rows(table_name, predicate), fields, lambda doc: self._project_doc(doc, fields))
+        plan = self._plan_limit(plan, limit, offset)
+        if not self._begin_plan(plan):
+            return True
+        for projected_doc in itertools.chain.from_iterable(plan) if plan.batched else plan:
+            self._print_doc(projected_doc, io_output=io_output)
         print("filtering succeeded", file=io_output)
         return True
     
-    def order(self, table_name: str, field: str, order_method: str, io_output=sys.stdout) -> bool:
+    @locks_tables(read=("table_name",))
+    @in_temp_workspace
+    def order(self, table_name: str, sort_fields: list, io_output=sys.stdout, condition: str = None, limit: int = None, offset: int = 0) -> bool:
         # check if table exists
         if not self._table_exists(table_name):
             print(f"Table {table_name} does not exist!", file=io_output)
             return True
-        # do external sorting
-        temp_sorted_file = self._external_sort(table_name, field, order_method)
-        # print the sorted file
-        with open(temp_sorted_file, 'r') as f:
-            doc = self._next_doc(f)
-            while doc is not None:
-                self._print_doc(doc, io_output=io_output)
-                doc = self._next_doc(f)
-        clear_temp_files()
+        # only the docs meeting the condition are sorted
+        predicate = None
+        if condition is not None:
+            predicate = self._compile_condition(table_name, condition, io_output)
+            if predicate is None:
+                return True
+        # the docs are sorted ascending on the key of their sort fields, encoded once per doc
+        sort_key = self._doc_sort_key(sort_fields)
+        sort_detail = self._sort_detail(sort_fields)
+        workers = self._scan_workers(table_name, predicate)
+        if limit is not None and offset + limit <= TOP_K_MAX_ROWS:
+            # only the first offset + limit docs having the sort fields are kept, in a heap while the docs stream from the scan
+            top_k = offset + limit
+            top_docs = lambda docs: heapq.nsmallest(top_k, self._docs_with_sort_fields(docs, sort_key), key=sort_key)
+            plan = TopKSort(self._plan_rows(table_name, predicate), sort_detail, top_k, top_docs)
+        elif workers > 1:
+            # every worker sorts (the docs meeting the condition of) a chunk into a run, then the runs are merged
+            chunk_paths = self._gather_chunk_paths(table_name, predicate)
+            docs = self._plan_rows(table_name, predicate)
+            worker_plan = PlanNode("Partial Sort", f"{sort_detail} (a run per chunk)", docs.rows, [docs])
+            chunk_args = [(chunk, predicate, sort_key, self._temp_file_name(run_num, 0)) for run_num, chunk in enumerate(chunk_paths)]
+            runs = self._plan_gather(worker_plan, workers, "_sort_chunk", chunk_args, rows=len(chunk_paths))
+            plan = Sort(runs, sort_detail, self._merge_worker_runs)
+            plan.rows = docs.rows
+        else:
+            # the docs stream from the scan (and filter) into the runs of the external sort
+            plan = Sort(self._plan_rows(table_name, predicate), sort_detail, lambda docs: self._external_sort_docs(docs, sort_key))
+        # the merge of the external sort stops once it has output the docs
+        plan = self._plan_limit(plan, limit, offset)
+        if not self._begin_plan(plan):
+            return True
+        # print the sorted docs
+        for doc in plan:
+            self._print_doc(doc, io_output=io_output)
         print("order succeeded", file=io_output)
         return True
     
     def aggregate(self, table_name: str, aggregate_method: str, aggregate_field: str, group_field: str, io_output=sys.stdout) -> bool:
-        # check if table exists
-        if not self._table_exists(table_name):
-            print(f"Table {table_name} does not exist!", file=io_output)
-            return True
-        
-        # do external sorting
-        temp_sorted_file = self._external_sort(table_name, group_field, "asc")
-        # aggregate
-        with open(temp_sorted_file, 'r') as f:
-            doc = self._next_doc(f)
-            if doc is None:
-                print("No data to aggregate!", file=io_output)
-                return True
-            # initialize the group
-            cur_group_result = None
-            pre_group_by_field_value = None
-            while doc is not None:
-                # get the group_by_field value of the current doc
-                cur_group_by_field_value = doc[group_field]
-                # if the group_by_field value changes, output the aggregate result of the previous group
-                if cur_group_by_field_value != pre_group_by_field_value and pre_group_by_field_value is not None:
-                    if cur_group_result is not None and aggregate_method == "avg":
-                        cur_group_result = round(get_key_val(cur_group_result[0]) / cur_group_result[1], 2)
-                    elif cur_group_by_field_value is not None and (aggregate_method == "min" or aggregate_method == "max" or aggregate_method == "sum"):
-                        cur_group_result = get_key_val(cur_group_result)
-                    if cur_group_result is None:
-                        cur_group_result = 0
-                    self._print_doc({group_field: pre_group_by_field_value, f"{aggregate_method}({aggregate_field})": cur_group_result}, io_output=io_output)
-                    # reset the group result
-                    cur_group_result = None
-                # if the current row is in the same group as the previous row, update the aggregate result
-                if aggregate_field in doc:
-                    cur_aggregate_field_value = mix_key(doc[aggregate_field])
-                else:
-                    cur_aggregate_field_value = mix_key(0)
-                if aggregate_method == "sum":
-                    if cur_group_result is None:
-                        cur_group_result = mix_key(0)
-                    cur_group_result = add_key(cur_group_result, cur_aggregate_field_value)
-                elif aggregate_method == "avg":
-                    if cur_group_result is None:
-                        cur_group_result = [mix_key(0), 0]
-                    cur_group_result[0] = add_key(cur_group_result[0], cur_aggregate_field_value)
-                    cur_group_result[1] += 1
-                elif aggregate_method == "count":
-                    if cur_group_result is None:
-                        cur_group_result = 0
-                    cur_group_result += 1
-                elif aggregate_method == "max":
-                    if cur_group_result is None:
-                        cur_group_result = cur_aggregate_field_value
-                    else:
-                        cur_group_result = max(cur_group_result, cur_aggregate_field_value)
-                elif aggregate_method == "min":
-                    if cur_group_result is None:
-                        cur_group_result = cur_aggregate_field_value
-                    else:
-                        cur_group_result = min(cur_group_result, cur_aggregate_field_value)
-                doc = self._next_doc(f)
-                pre_group_by_field_value = cur_group_by_field_value
-            # output the aggregate result of the last group
-            if doc is None and pre_group_by_field_value is not None:
-                if cur_group_result is not None and aggregate_method == "avg":
-                    cur_group_result = round(get_key_val(cur_group_result[0]) / cur_group_result[1], 2)
-                elif cur_group_by_field_value is not None and (aggregate_method == "min" or aggregate_method == "max" or aggregate_method == "sum"):
-                    cur_group_result = get_key_val(cur_group_result)
-                if cur_group_result is None:
-                    cur_group_result = 0
-                self._print_doc({group_field: pre_group_by_field_value, f"{aggregate_method}({aggregate_field})": cur_group_result}, io_output=io_output)
-        clear_temp_files()
-        print("aggregation succeeded", file=io_output)
-        return True
+        return self.multi_aggregate(table_name, [(aggregate_method, aggregate_field, None)], group_field, io_output=io_output)
     
     def aggregate_table(self, table_name: str, aggregate_method: str, aggregate_field: str, io_output=sys.stdout) -> bool:
+        return self.multi_aggregate(table_name, [(aggregate_method, aggregate_field, None)], None, io_output=io_output)
+    
+    @locks_tables(read=("table_name",))
+    @in_temp_workspace
+    def multi_aggregate(self, table_name: str, aggregations: list, group_field: str or None, io_output=sys.stdout, condition: str = None) -> bool:
         # check if table exists
         if not self._table_exists(table_name):
             print(f"Table {table_name} does not exist!", file=io_output)
             return True
-        # directly iterate through all chunks and aggregate
-        cur_result = None
-        for chunk in self._get_table_chunks(table_name):
-            docs = self._read_docs_from_file(chunk)
-            for doc in docs:
-                if aggregate_field in doc:
-                    cur_aggregate_field_value = mix_key(doc[aggregate_field])
-                else:
-                    cur_aggregate_field_value = mix_key(0)
-                if aggregate_method == "sum":
-                    if cur_result is None:
-                        cur_result = mix_key(0)
-                    cur_result = add_key(cur_result, cur_aggregate_field_value)
-                elif aggregate_method == "avg":
-                    if cur_result is None:
-                        cur_result = [mix_key(0), 0]
-                    cur_result[0] = add_key(cur_result[0], cur_aggregate_field_value)
-                    cur_result[1] += 1
-                elif aggregate_method == "count":
-                    if cur_result is None:
-                        cur_result = 0
-                    cur_result += 1
-                elif aggregate_method == "max":
-                    if cur_result is None:
-                        cur_result = cur_aggregate_field_value
-                    else:
-                        cur_result = max(cur_result, cur_aggregate_field_value)
-                elif aggregate_method == "min":
-                    if cur_result is None:
-                        cur_result = cur_aggregate_field_value
-                    else:
-                        cur_result = min(cur_result, cur_aggregate_field_value)
-        if cur_result is not None and aggregate_method == "avg":
-            cur_result = round(get_key_val(cur_result[0]) / cur_result[1], 2)
-        elif aggregate_method == "sum" or aggregate_method == "max" or aggregate_method == "min":
-            cur_result = get_key_val(cur_result)
-        if cur_result is None:
-            cur_result = 0
-        self._print_doc({f"{aggregate_method}({aggregate_field})": cur_result}, io_output=io_output)
+        # only the docs meeting the condition are aggregated
+        predicate = None
+        if condition is not None:
+            predicate = self._compile_condition(table_name, condition, io_output)
+            if predicate is None:
+                return True
+        labels = [self.aggregation_label(aggregation) for aggregation in aggregations]
+        workers = self._scan_workers(table_name, predicate)
+        docs = self._plan_rows(table_name, predicate)
+        if workers > 1 and group_field is None:
+            # every worker aggregates a chunk into partial accumulators, which are merged
+            plan = self._plan_parallel_aggregate(table_name, predicate, labels, aggregations, workers)
+        elif workers > 1:
+            # every worker aggregates the groups of a chunk, the partial groups are merged
+            plan = self._plan_parallel_groups(table_name, predicate, group_field, labels, aggregations, workers)
+        elif group_field is None:
+            # compute all aggregations over the docs in one pass
+            plan = Aggregate(docs, labels, lambda docs: self._aggregate_docs(docs, aggregations))
+        else:
+            # aggregate every group with a hash aggregation and output the results in group order
+            plan = HashAggregate(docs, group_field, labels, lambda docs: self._hash_aggregate(docs, group_field, aggregations))
+        if not self._begin_plan(plan):
+            return True
+        if group_field is None:
+            for results in plan:
+                self._print_doc(dict(zip(labels, results)), io_output=io_output)
+            print("aggregation succeeded", file=io_output)
+            return True
+        group_count = 0
+        for group_value, group_results in plan:
+            result_doc = {group_field: group_value}
+            result_doc.update(zip(labels, group_results))
+            self._print_doc(result_doc, io_output=io_output)
+            group_count += 1
+        if group_count == 0:
+            print("No data to aggregate!", file=io_output)
+            return True
         print("aggregation succeeded", file=io_output)
         return True
     
-    def group(self, table_name: str, group_field: str, io_output=sys.stdout) -> bool:
+    @locks_tables(read=("table_name",))
+    @in_temp_workspace
+    def group(self, table_name: str, group_field: str, io_output=sys.stdout, condition: str = None) -> bool:
         # check if table exists
         if not self._table_exists(table_name):
             print(f"Table {table_name} does not exist!", file=io_output)
             return True
-        
-        # do external sorting
-        temp_sorted_file = self._external_sort(table_name, group_field, "asc")
-        # group
-        with open(temp_sorted_file, 'r') as f:
-            doc = self._next_doc(f)
-            if doc is None:
-                print("No data to group!", file=io_output)
+        # only the docs meeting the condition are grouped
+        predicate = None
+        if condition is not None:
+            predicate = self._compile_condition(table_name, condition, io_output)
+            if predicate is None:
                 return True
-            pre_group_by_field_value = None
-            while doc is not None:
-                # get the group_by_field value of the current doc
-                cur_group_by_field_value = doc[group_field]
-                # if the group_by_field value changes, output the group result of the previous group
-                if cur_group_by_field_value != pre_group_by_field_value and pre_group_by_field_value is not None:
-                    self._print_doc({group_field: pre_group_by_field_value}, io_output=io_output)
-                doc = self._next_doc(f)
-                pre_group_by_field_value = cur_group_by_field_value
-            # output the group result of the last group
-            if doc is None and pre_group_by_field_value is not None:
-                self._print_doc({group_field: pre_group_by_field_value}, io_output=io_output)
-        clear_temp_files()
+        workers = self._scan_workers(table_name, predicate)
+        if workers > 1:
+            # every worker finds the groups of a chunk, the partial groups are merged
+            plan = self._plan_parallel_groups(table_name, predicate, group_field, [], (), workers)
+        else:
+            # find the groups with a hash aggregation and output them in group order
+            plan = HashAggregate(self._plan_rows(table_name, predicate), group_field, [], lambda docs: self._hash_aggregate(docs, group_field))
+        if not self._begin_plan(plan):
+            return True
+        group_count = 0
+        for group_value, _ in plan:
+            self._print_doc({group_field: group_value}, io_output=io_output)
+            group_count += 1
+        if group_count == 0:
+            print("No data to group!", file=io_output)
+            return True
         print("grouping succeeded", file=io_output)
         return True
 
-    def join(self, left: str, right: str, condition: str, io_output=sys.stdout) -> bool:
+    @locks_tables(read=("left", "right"))
+    @in_temp_workspace
+    def join(self, left: str, right: str, condition: str, io_output=sys.stdout, strategy: str = None) -> bool:
         # check if tables exist
         if not self._table_exists(left):
             print(f"Table {left} does not exist!", file=io_output)
@@ -352,57 +398,425 @@ class NoSQL(BaseEngine):
             print(f"Invalid condition {condition}!", file=io_output)
             return True
         left_field, op, right_field = match.groups()
-        for right_chunk in self._get_table_chunks(right):
-            right_docs = self._read_docs_from_file(right_chunk)
-            for left_chunk in self._get_table_chunks(left):
-                left_docs = self._read_docs_from_file(left_chunk)
-                for right_doc in right_docs:
-                    for left_doc in left_docs:
-                        if not right_field in right_doc:
-                            continue
-                        if not left_field in left_doc:
-                            continue
-                        right_field_value = right_doc[right_field]
-                        if self._doc_meets_condition(left_doc, f"{left_field}{op}{right_field_value}"):
-                            joined_doc = {}
-                            for field in left_doc:
-                                joined_doc[f"{left}.{field}"] = left_doc[field]
-                            for field in right_doc:
-                                joined_doc[f"{right}.{field}"] = right_doc[field]
-                            self._print_doc(joined_doc, io_output=io_output)
+        # choose the join strategy unless the user forced one
+        if strategy is None:
+            strategy = self._choose_join_strategy(op, self.catalog.get_row_count(left), self.catalog.get_row_count(right))
+        elif op not in self.join_strategies[strategy]:
+            print(f"{strategy} join does not support the operator {op}", file=io_output)
+            return True
+        # the join pulls the docs of both tables from its input operators
+        if strategy == "hash":
+            join_docs = lambda left_input, right_input: self._hash_join(left, right, left_input, right_input, left_field, right_field)
+        elif strategy == "sort merge":
+            join_docs = lambda left_input, right_input: self._sort_merge_join(left_input, right_input, left_field, op, right_field)
+        else:
+            join_docs = lambda left_input, right_input: self._nested_loop_join(left_input, right_input, left_field, op, right_field)
+        plan = self._plan_join(left, right, left_field, op, right_field, strategy, join_docs)
+        if not self._begin_plan(plan):
+            return True
+        for left_doc, right_doc in plan:
+            joined_doc = {}
+            for field in left_doc:
+                joined_doc[f"{left}.{field}"] = left_doc[field]
+            for field in right_doc:
+                joined_doc[f"{right}.{field}"] = right_doc[field]
+            self._print_doc(joined_doc, io_output=io_output)
         print("join succeeded", file=io_output)
         return True
         
+    @locks_tables(write=("table_name",))
+    def set_chunk_size(self, table_name: str, chunk_size: int or None, chunk_bytes: int or None, io_output=sys.stdout) -> bool:
+        # check if table exists
+        if not self._table_exists(table_name):
+            print(f"Table {table_name} does not exist!", file=io_output)
+            return True
+        # new chunks follow the new limits, existing chunks are rewritten by compact table
+        self.catalog.set_chunk_limits(table_name, chunk_size, chunk_bytes)
+        print("chunk size updated", file=io_output)
+        return True
+
+    def set_format(self, table_name: str, chunk_format: str, io_output=sys.stdout) -> bool:
+        # docs have no fixed fields to store column by column
+        print("NoSQL tables are only stored as json lines", file=io_output)
+        return True
+
+    @locks_tables(write=("table_name",))
+    def compact_table(self, table_name: str, io_output=sys.stdout) -> bool:
+        # check if table exists
+        if not self._table_exists(table_name):
+            print(f"Table {table_name} does not exist!", file=io_output)
+            return True
+        old_chunks = self._get_table_chunks(table_name)
+        # write the new chunks after the old ones, the old chunks are read while writing and
+        # stay the chunks of the table until the new ones are written
+        first_chunk_num = self.catalog.get_max_chunk(table_name) + 1
+        chunk_docs = {}
+        zones = {}
+        index_entries = {field: [] for field in self.catalog.get_indexes(table_name)}
+        docs = (doc for chunk in old_chunks for doc in self._read_docs_from_file(chunk))
+        try:
+            self._write_docs_to_chunks(table_name, docs, first_chunk_num, 0, chunk_docs, zones, index_entries)
+        except BaseException:
+            # the table keeps its old chunks, remove the new ones
+            for chunk_num in range(first_chunk_num, max(chunk_docs, default=first_chunk_num) + 1):
+                if os.path.exists(self._get_chunk_path(table_name, chunk_num)):
+                    os.remove(self._get_chunk_path(table_name, chunk_num))
+            raise
+        # swap the new chunks in with one manifest write, then remove the old ones
+        self.catalog.replace_chunks(table_name, chunk_docs, zones, self.catalog.get_format(table_name))
+        for chunk in old_chunks:
+            os.remove(chunk)
+        # the docs moved to other chunks
+        for field, entries in index_entries.items():
+            self.indexes.create(table_name, field, entries)
+        print(f"compacted {len(old_chunks)} chunks into {len(chunk_docs)} chunks", file=io_output)
+        print("compaction succeeded", file=io_output)
+        return True
+
+    @locks_tables(write=("table_name",))
+    def create_index(self, table_name: str, field: str, io_output=sys.stdout) -> bool:
+        # check if table exists
+        if not self._table_exists(table_name):
+            print(f"Table {table_name} does not exist!", file=io_output)
+            return True
+        index_fields = self.catalog.get_indexes(table_name)
+        if field in index_fields:
+            print(f"Index on {field} already exists!", file=io_output)
+            return True
+        self._build_index(table_name, field)
+        self.catalog.set_indexes(table_name, index_fields + [field])
+        print("index created", file=io_output)
+        return True
+
+    @locks_tables(write=("table_name",))
+    def drop_index(self, table_name: str, field: str, io_output=sys.stdout) -> bool:
+        # check if table exists
+        if not self._table_exists(table_name):
+            print(f"Table {table_name} does not exist!", file=io_output)
+            return True
+        index_fields = self.catalog.get_indexes(table_name)
+        if field not in index_fields:
+            print(f"Index on {field} does not exist!", file=io_output)
+            return True
+        self.catalog.set_indexes(table_name, [index_field for index_field in index_fields if index_field != field])
+        self.indexes.drop(table_name, field)
+        print("index dropped", file=io_output)
+        return True
+        
     # ========================================================
     #                  ***** Helpers *****
     #
-    #                   For r/w json files 
+    #                    For aggregation
     # ========================================================
 
-    def _write_doc_to_file(self, doc: dict, file_path: str):
-        with open(file_path, 'a') as f:
-            f.write(json.dumps(doc) + "\n")
+    # return one new accumulator per aggregation, values are ordered as mix_keys
+    def _new_accumulators(self, aggregations: list) -> list:
+        return [create_accumulator(aggregation, key=mix_key, number=self._number_value) for aggregation in aggregations]
+
+    def _update_accumulators(self, accumulators: list, aggregations: list, doc: dict) -> None:
+        for accumulator, (aggregate_method, aggregate_field, _) in zip(accumulators, aggregations):
+            if aggregate_field == "*":
+                accumulator.add(None)
+            elif aggregate_field in doc:
+                accumulator.add(doc[aggregate_field])
+            elif aggregate_method != "count distinct":
+                # a missing field counts as 0
+                accumulator.add(0)
+
+    # return the results of the accumulators, 0 for no result
+    def _final_results(self, accumulators: list) -> list:
+        results = []
+        for accumulator in accumulators:
+            result = accumulator.result()
+            results.append(result if result is not None else 0)
+        return results
+
+    # numeric aggregations add strings as 0, like adding mix_keys
+    # (a static method, so the accumulators of parallel aggregations can be sent between processes)
+    @staticmethod
+    def _number_value(value) -> int or float:
+        return get_key_val(add_key(mix_key(0), mix_key(value)))
+
+    # yield the results of the aggregations over all docs
+    def _aggregate_docs(self, docs, aggregations: list):
+        accumulators = self._new_accumulators(aggregations)
+        for doc in docs:
+            self._update_accumulators(accumulators, aggregations, doc)
+        yield self._final_results(accumulators)
+
+    # yield the results of the aggregations merged from the partial accumulators of every chunk
+    def _merge_aggregates(self, partials, aggregations: list):
+        accumulators = self._new_accumulators(aggregations)
+        for partial_accumulators in partials:
+            for accumulator, partial_accumulator in zip(accumulators, partial_accumulators):
+                accumulator.merge(partial_accumulator)
+        yield self._final_results(accumulators)
+
+    # yield (group value, aggregate results) for every group in ascending mix_key order, merged
+    # from the partial groups ({group value: accumulators}) of every chunk
+    # if the groups do not fit in HASH_AGG_MEMORY_GROUPS, the docs are aggregated again
+    # by the groups of aggregate_docs(), which spills groups to Temp
+    def _merge_groups(self, partials, aggregations: list, aggregate_docs):
+        groups = {}
+        for partial_groups in partials:
+            for group_value, partial_accumulators in partial_groups.items():
+                accumulators = groups.get(group_value)
+                if accumulators is None:
+                    if len(groups) >= HASH_AGG_MEMORY_GROUPS:
+                        yield from aggregate_docs()
+                        return
+                    groups[group_value] = partial_accumulators
+                    continue
+                for accumulator, partial_accumulator in zip(accumulators, partial_accumulators):
+                    accumulator.merge(partial_accumulator)
+        yield from sorted(((group_value, self._final_results(accumulators)) for group_value, accumulators in groups.items()), key=lambda group: mix_key(group[0]))
+
+    # yield (group value, aggregate results) for every group of the docs in ascending mix_key order,
+    # docs without the group field are not grouped
+    # the groups are aggregated in a dict during one pass over the docs. Once there are
+    # HASH_AGG_MEMORY_GROUPS groups, docs of new groups are spilled to Temp and
+    # aggregated by sorting, and the two sorted group streams are merged
+    def _hash_aggregate(self, docs, group_field: str, aggregations: list = ()):
+        groups = {}
+        spill_files = []
+        spill_docs = []
+        try:
+            for doc in docs:
+                if group_field not in doc:
+                    continue
+                group_value = doc[group_field]
+                accumulators = groups.get(group_value)
+                if accumulators is None:
+                    if len(groups) >= HASH_AGG_MEMORY_GROUPS:
+                        # no memory for a new group -> spill the doc into chunk-sized spill files
+                        spill_docs.append(doc)
+                        if len(spill_docs) >= CHUNK_SIZE:
+                            spill_files.append(temp_path(f"spill_{len(spill_files)}.part"))
+                            self._write_docs_to_file(spill_docs, spill_files[-1])
+                            spill_docs = []
+                        continue
+                    accumulators = groups[group_value] = self._new_accumulators(aggregations)
+                self._update_accumulators(accumulators, aggregations, doc)
+            if len(spill_docs) > 0:
+                spill_files.append(temp_path(f"spill_{len(spill_files)}.part"))
+                self._write_docs_to_file(spill_docs, spill_files[-1])
+            in_memory_groups = sorted(((group_value, self._final_results(accumulators)) for group_value, accumulators in groups.items()), key=lambda group: mix_key(group[0]))
+            if len(spill_files) == 0:
+                yield from in_memory_groups
+                return
+            # the spilled docs belong to groups that are not in memory
+            spilled_docs = itertools.chain.from_iterable(self._scan_docs_from_file(spill_file) for spill_file in spill_files)
+            sorted_docs = self._external_sort_docs(spilled_docs, self._doc_sort_key([(group_field, "asc")]))
+            spilled_groups = self._sort_aggregate(sorted_docs, group_field, aggregations)
+            yield from heapq.merge(in_memory_groups, spilled_groups, key=lambda group: mix_key(group[0]))
+        finally:
+            for spill_file in spill_files:
+                os.remove(spill_file)
+
+    # yield (group value, aggregate results) for every group of docs sorted on the group field
+    def _sort_aggregate(self, sorted_docs, group_field: str, aggregations: list):
+        accumulators = None
+        pre_group_value = None
+        for doc in sorted_docs:
+            group_value = doc[group_field]
+            # if the group value changes, output the result of the previous group
+            if pre_group_value is None or group_value != pre_group_value:
+                if pre_group_value is not None:
+                    yield pre_group_value, self._final_results(accumulators)
+                accumulators = self._new_accumulators(aggregations)
+            self._update_accumulators(accumulators, aggregations, doc)
+            pre_group_value = group_value
+        # output the result of the last group
+        if pre_group_value is not None:
+            yield pre_group_value, self._final_results(accumulators)
+
+    # ========================================================
+    #                  ***** Helpers *****
+    #
+    #                       For joins
+    # ========================================================
+
+    # yield (left_doc, right_doc) pairs where left_field op right_field
+    # left_input and right_input are the operators producing the docs of the tables
+    def _nested_loop_join(self, left_input, right_input, left_field: str, op: str, right_field: str):
+        right_docs = iter(right_input)
+        # the right docs are read in blocks of CHUNK_SIZE docs and the left table is
+        # scanned once per block
+        while True:
+            right_block = list(itertools.islice(right_docs, CHUNK_SIZE))
+            if len(right_block) == 0:
+                return
+            right_block = [right_doc for right_doc in right_block if right_field in right_doc]
+            if len(right_block) == 0:
+                continue
+            # convert the condition id=id to id=4 for the left docs
+            predicates = [DocComparison(left_field, op, self._get_typed_value(f"{right_doc[right_field]}")) for right_doc in right_block]
+            for left_doc in left_input:
+                for right_doc, predicate in zip(right_block, predicates):
+                    if predicate(left_doc):
+                        yield left_doc, right_doc
+
+    # yield (left_doc, right_doc) pairs where left_field = right_field
+    # the smaller table (by doc count in the catalog) is loaded into a hash table
+    # and the larger one probes it in a single pass, docs without the field never match
+    def _hash_join(self, left: str, right: str, left_input, right_input, left_field: str, right_field: str):
+        left_docs = self.catalog.get_row_count(left)
+        right_docs = self.catalog.get_row_count(right)
+        build_is_left = left_docs <= right_docs
+        if build_is_left:
+            build_input, build_field, probe_input, probe_field = left_input, left_field, right_input, right_field
+        else:
+            build_input, build_field, probe_input, probe_field = right_input, right_field, left_input, left_field
+        build_docs = min(left_docs, right_docs)
+        if build_docs > HASH_JOIN_MEMORY_ROWS:
+            # the build side does not fit the memory budget
+            joined_docs = self._grace_hash_join(build_input, build_field, probe_input, probe_field, build_docs)
+        else:
+            hash_table = self._build_hash_table(build_input, build_field)
+            joined_docs = self._probe_hash_table(hash_table, probe_input, probe_field)
+        for build_doc, probe_doc in joined_docs:
+            if build_is_left:
+                yield build_doc, probe_doc
+            else:
+                yield probe_doc, build_doc
+
+    # Grace hash join: partition both inputs by the hash of the join key into Temp,
+    # then join each pair of partitions in memory
+    def _grace_hash_join(self, build_input, build_field: str, probe_input, probe_field: str, build_docs: int):
+        num_partitions = build_docs // HASH_JOIN_MEMORY_ROWS + 1
+        build_partitions = self._partition_docs(build_input, build_field, num_partitions, "build")
+        probe_partitions = self._partition_docs(probe_input, probe_field, num_partitions, "probe")
+        try:
+            for build_partition, probe_partition in zip(build_partitions, probe_partitions):
+                hash_table = self._build_hash_table(self._read_docs_from_file(build_partition), build_field)
+                yield from self._probe_hash_table(hash_table, self._read_docs_from_file(probe_partition), probe_field)
+        finally:
+            for partition in build_partitions + probe_partitions:
+                os.remove(partition)
+
+    def _build_hash_table(self, docs, field: str) -> dict:
+        hash_table = {}
+        for doc in docs:
+            if field in doc:
+                hash_table.setdefault(doc[field], []).append(doc)
+        return hash_table
+
+    def _probe_hash_table(self, hash_table: dict, docs, field: str):
+        for doc in docs:
+            if field not in doc:
+                continue
+            for build_doc in hash_table.get(doc[field], ()):
+                yield build_doc, doc
+
+    # yield (left_doc, right_doc) pairs where left_field op right_field
+    # both inputs are sorted with the external sort and then merged in a single pass,
+    # values are ordered by mix_key and strings never match numbers
+    def _sort_merge_join(self, left_input, right_input, left_field: str, op: str, right_field: str):
+        # the left docs matching a right doc are a prefix of the left table sorted
+        # in descending order for > and >=, and in ascending order otherwise
+        left_order = "desc" if op in (">", ">=") else "asc"
+        left_sorted = temp_path("merge_join_left.part")
+        right_sorted = temp_path("merge_join_right.part")
+        try:
+            self._sort_docs_to_file(left_input, self._doc_sort_key([(left_field, left_order)]), left_sorted)
+            self._sort_docs_to_file(right_input, self._doc_sort_key([(right_field, "asc")]), right_sorted)
+            right_docs = read_run(right_sorted)
+            if op == "=":
+                yield from self._merge_equal_docs(read_run(left_sorted), left_field, right_docs, right_field)
+                return
+            op_func = self.join_ops[op]
+            first_left_doc = next(read_run(left_sorted), None)
+            for right_doc in right_docs:
+                right_key = mix_key(right_doc[right_field])
+                if first_left_doc is None or not op_func(mix_key(first_left_doc[left_field]), right_key):
+                    if op in (">", ">="):
+                        # the right docs only grow, no later right doc can match either
+                        break
+                    continue
+                # output the prefix of the sorted left table that meets the condition
+                for left_doc in read_run(left_sorted):
+                    left_key = mix_key(left_doc[left_field])
+                    if not op_func(left_key, right_key):
+                        break
+                    if left_key[0] == right_key[0]:
+                        yield left_doc, right_doc
+        finally:
+            for sorted_file in (left_sorted, right_sorted):
+                if os.path.exists(sorted_file):
+                    os.remove(sorted_file)
+
+    # merge two doc streams sorted in ascending order on their fields and yield the pairs with equal values
+    def _merge_equal_docs(self, left_docs, left_field: str, right_docs, right_field: str):
+        left_doc = next(left_docs, None)
+        group_key = None
+        group = []
+        for right_doc in right_docs:
+            right_key = mix_key(right_doc[right_field])
+            if len(group) == 0 or right_key != group_key:
+                # skip the left docs with smaller values and collect the group with an equal value
+                while left_doc is not None and mix_key(left_doc[left_field]) < right_key:
+                    left_doc = next(left_docs, None)
+                group_key = right_key
+                group = []
+                while left_doc is not None and mix_key(left_doc[left_field]) == right_key:
+                    group.append(left_doc)
+                    left_doc = next(left_docs, None)
+            for group_doc in group:
+                yield group_doc, right_doc
+
+    # sort the docs having the sort fields into the run file output_file and clear the runs of the sort
+    def _sort_docs_to_file(self, docs, sort_key: SortKey, output_file: str) -> None:
+        with RunWriter(output_file) as writer:
+            writer.write_all(self._external_sort_docs(docs, sort_key))
+        for temp_chunk in self._get_temp_chunks():
+            os.remove(temp_chunk)
+
+    # write the docs that have the field into num_partitions files by the hash of the field
+    # and return the file paths
+    def _partition_docs(self, docs, field: str, num_partitions: int, side: str) -> list:
+        partitions = [temp_path(f"partition_{side}_{i}.part") for i in range(num_partitions)]
+        opened_files = [open(partition, "w", buffering=1 << 16) for partition in partitions]
+        try:
+            for doc in docs:
+                if field in doc:
+                    opened_files[hash(doc[field]) % num_partitions].write(json.dumps(doc) + "\n")
+        finally:
+            for opened_file in opened_files:
+                opened_file.close()
+        return partitions
+
+    # ========================================================
+    #                  ***** Helpers *****
+    #
+    #                   For r/w json files 
+    # ========================================================
 
     def _write_docs_to_file(self, docs: list, file_path: str):
+        # serialize all docs first and append them with a single write
+        self._write_lines_to_file([json.dumps(doc) + "\n" for doc in docs], file_path)
+
+    def _write_lines_to_file(self, lines: list, file_path: str):
+        # the file is created even if there are no lines
         with open(file_path, 'a') as f:
-            for doc in docs:
-                 f.write(json.dumps(doc) + "\n")
+            f.write("".join(lines))
 
+    # json.loads takes the lines as bytes, line breaks included
     def _read_docs_from_file(self, file_path: str) -> list:
-        docs_data = []
-        with open(file_path, 'r') as f:
-            docs_data = [json.loads(line.rstrip("\n")) for line in f.readlines()]
-        return docs_data
-    
-    def _next_doc(self, opened_file) -> dict or None:
-        line = next(opened_file, None)
-        if line is None:
-            return None
-        return json.loads(line.rstrip("\n"))
+        with ChunkReader(file_path) as reader:
+            return list(map(json.loads, reader.raw_lines()))
     
-    def _clear_file(self, file_path: str) -> None:
-        with open(file_path, 'r+') as f:
-            f.truncate(0)
+    # yield the docs of a json lines file one by one
+    def _scan_docs_from_file(self, file_path: str):
+        with ChunkReader(file_path) as reader:
+            yield from map(json.loads, reader.raw_lines())
+
+    # replace the docs of the file: they are written to a temp file renamed over it, so a failed
+    # write (e.g. of a delete or update) leaves the old docs
+    def _overwrite_docs_in_file(self, docs: list, file_path: str) -> None:
+        temp_file_path = f"{file_path}.tmp"
+        with open(temp_file_path, 'w') as f:
+            f.write("".join([json.dumps(doc) + "\n" for doc in docs]))
+        os.replace(temp_file_path, file_path)
 
     def _get_typed_value(self, val: str) -> int or float or str:
         if val.isdigit():
@@ -431,18 +845,11 @@ class NoSQL(BaseEngine):
         return int(chunk_path.split("/")[-1].split(".")[0].split("_")[-1])
     
     def _get_chunk_path(self, table_name: str, chunk_num: int) -> str:
-        return f"{self._get_table_path(table_name)}/chunk_{chunk_num}"
+        return self.catalog.get_chunk_path(table_name, chunk_num)
     
-    def _get_chunk_size(self, chunk_path: str) -> int:
-        with open(chunk_path, 'r') as f:
-            return len(f.readlines())
-        
+    # return a list of chunk paths ordered by chunk number
     def _get_table_chunks(self, table_name: str) -> list:
-        table_storage_path = self._get_table_path(table_name)
-        chunks = []
-        for file in os.listdir(table_storage_path):
-            chunks.append(f"{table_storage_path}/{file}")
-        return chunks
+        return [self._get_chunk_path(table_name, chunk_num) for chunk_num in self.catalog.get_chunk_numbers(table_name)]
         
     # ========================================================
     #                  ***** Helpers *****
@@ -457,54 +864,201 @@ class NoSQL(BaseEngine):
         return doc
     
     def _insert_doc(self, table_name: str, doc: dict) -> None:
-         # iterate through all chunks in this directory and find the chunk_num with max num, -1 if no chunks
-        max_chunk_num = max([self._get_chunk_number(chunk) for chunk in self._get_table_chunks(table_name)], default=-1)
-        if max_chunk_num == -1:
-            # if no chunks, create a new chunk
-            chunk_path = self._get_chunk_path(table_name, 0)
-            self._write_doc_to_file(doc, chunk_path)
-        else:
-            # if chunks exist, find the chunk with max num
-            chunk_path = self._get_chunk_path(table_name, max_chunk_num)
-            # check if chunk is full
-            if self._get_chunk_size(chunk_path) < CHUNK_SIZE:
-                # if not full, append to the chunk
-                self._write_doc_to_file(doc, chunk_path)
-            else:
-                # if full, create a new chunk
-                chunk_path = self._get_chunk_path(table_name, max_chunk_num + 1)
-                self._write_doc_to_file(doc, chunk_path)
+        self._bulk_insert_docs(table_name, [doc])
 
-    def _doc_meets_condition(self, doc: dict, condition: str) -> bool:
-        match = re.match(r"(.*?)\s*(!=|=|>=|<=|>|<)\s*(.*)", condition)
-        field, op, value = match.groups()
-        value = self._get_typed_value(value)
-        # check if doc has the field
-        if field not in doc:
+    # append an iterable (or iterator) of docs to the table and return the number of docs written
+    def _bulk_insert_docs(self, table_name: str, docs) -> int:
+        # the last chunk (-1 if no chunks) and its doc count come from the catalog
+        max_chunk_num = self.catalog.get_max_chunk(table_name)
+        chunk_docs = {}
+        zones = {}
+        index_entries = {field: [] for field in self.catalog.get_indexes(table_name)}
+        doc_count = self._write_docs_to_chunks(table_name, docs, max(max_chunk_num, 0), self.catalog.get_chunk_rows(table_name, max_chunk_num), chunk_docs, zones, index_entries)
+        # record the new doc counts and zone maps in the catalog and the new docs in the indexes
+        if len(chunk_docs) > 0:
+            self.catalog.set_chunk_rows(table_name, chunk_docs, zones)
+        for field, entries in index_entries.items():
+            self.indexes.add_entries(table_name, field, entries)
+        return doc_count
+
+    # write the docs to the chunks of the table from the chunk first_chunk_num, holding first_chunk_size
+    # docs, on and return the number of docs written. The doc counts, zone maps and index entries
+    # ({field: [(value, chunk number, line offset)]}) of the chunks are added to chunk_docs, zones and
+    # index_entries, the catalog is left to the caller
+    # docs are grouped into chunk-sized batches, each doc is serialized once
+    # and every batch is written to its chunk file with a single write
+    def _write_docs_to_chunks(self, table_name: str, docs, first_chunk_num: int, first_chunk_size: int, chunk_docs: dict, zones: dict, index_entries: dict) -> int:
+        cur_chunk_num = first_chunk_num
+        cur_chunk_size = first_chunk_size
+        max_chunk_size, max_chunk_bytes = self.catalog.get_chunk_limits(table_name)
+        cur_chunk_bytes = 0
+        if max_chunk_bytes is not None and cur_chunk_size > 0:
+            cur_chunk_bytes = os.path.getsize(self._get_chunk_path(table_name, cur_chunk_num))
+        doc_count = 0
+        batch = []
+        # the new docs of the current chunk and its doc count before them, for its zone map
+        zone_docs = []
+        zone_start_size = cur_chunk_size
+        for doc in docs:
+            if self._chunk_is_full(cur_chunk_size, cur_chunk_bytes, max_chunk_size, max_chunk_bytes):
+                # if full, write the batch and move on to a new chunk
+                self._write_chunk_batch(table_name, cur_chunk_num, batch, zone_start_size)
+                batch = []
+                zones[cur_chunk_num] = self._chunk_zone_with_docs(table_name, cur_chunk_num, zone_start_size, zone_docs)
+                zone_docs = []
+                zone_start_size = 0
+                cur_chunk_num += 1
+                cur_chunk_size = 0
+                cur_chunk_bytes = 0
+            line = json.dumps(doc) + "\n"
+            batch.append(line)
+            zone_docs.append(doc)
+            for field in index_entries:
+                if self._is_indexable(doc, field):
+                    index_entries[field].append((doc[field], cur_chunk_num, cur_chunk_size))
+            cur_chunk_size += 1
+            cur_chunk_bytes += len(line)
+            chunk_docs[cur_chunk_num] = cur_chunk_size
+            doc_count += 1
+        # write the last batch
+        if len(batch) > 0:
+            self._write_chunk_batch(table_name, cur_chunk_num, batch, zone_start_size)
+            zones[cur_chunk_num] = self._chunk_zone_with_docs(table_name, cur_chunk_num, zone_start_size, zone_docs)
+        return doc_count
+
+    # append the lines to the chunk holding old_docs docs, a new chunk overwrites the file
+    # a failed write may have left behind
+    def _write_chunk_batch(self, table_name: str, chunk_num: int, lines: list, old_docs: int) -> None:
+        with open(self._get_chunk_path(table_name, chunk_num), "a" if old_docs > 0 else "w") as f:
+            f.write("".join(lines))
+
+    # a chunk is full once it reaches either the doc or the byte limit (None means no limit)
+    def _chunk_is_full(self, chunk_size: int, chunk_bytes: int, max_chunk_size: int or None, max_chunk_bytes: int or None) -> bool:
+        if chunk_size == 0:
             return False
-        # get the doc field value
-        doc_field_value = doc[field]
-        # check if doc field value is of the same type as value
-        if type(doc_field_value) != type(value):
-            if type(doc_field_value) == str or type(value) == str:
-                return False
-            elif type(doc_field_value) == float or type(value) == float:
-                # if one of them is float, convert both to float
-                value = float(value)
-                doc_field_value = float(doc_field_value)
-        # get the operator function
-        ops = {
-            "=": operator.eq,
-            "!=": operator.ne,
-            ">": operator.gt,
-            "<": operator.lt,
-            ">=": operator.ge,
-            "<=": operator.le,
-        }
-        op_func = ops.get(op)
-        # check if doc field value meets the condition
-        return op_func(doc_field_value, value)
+        if max_chunk_size is not None and chunk_size >= max_chunk_size:
+            return True
+        if max_chunk_bytes is not None and chunk_bytes >= max_chunk_bytes:
+            return True
+        return False
+
+    # compile the condition into a predicate on docs: the operator functions and the typed
+    # values are resolved once instead of for every doc, and the operands of and/or are
+    # ordered by their estimated selectivity
+    # return None (after printing the error) if the condition is invalid
+    def _compile_condition(self, table_name: str, condition: str, io_output=sys.stdout) -> Predicate or None:
+        node = self.parse_condition(condition, io_output)
+        if node is None:
+            return None
+        predicate = self._compile_node(node)
+        self._reorder_predicate(table_name, predicate)
+        return predicate
+
+    def _compile_node(self, node: tuple) -> Predicate:
+        if node[0] == "and":
+            return And([self._compile_node(child_node) for child_node in node[1]])
+        elif node[0] == "or":
+            return Or([self._compile_node(child_node) for child_node in node[1]])
+        elif node[0] == "not":
+            return Not(self._compile_node(node[1]))
+        elif node[0] == "compare":
+            return DocComparison(node[1], node[2], self._get_typed_value(node[3]))
+        elif node[0] == "in":
+            return DocIn(node[1], [self._get_typed_value(value) for value in node[2]])
+        elif node[0] == "between":
+            return DocBetween(node[1], self._get_typed_value(node[2]), self._get_typed_value(node[3]))
+        # like patterns are always strings
+        return DocLike(node[1], node[2])
     
+    # ========================================================
+    #                  ***** Helpers *****
+    #
+    #                      For indexes
+    # ========================================================
+
+    # docs without the field are not indexed, neither are values that are not numbers or strings
+    def _is_indexable(self, doc: dict, field: str) -> bool:
+        return type(doc.get(field)) in (int, float, str)
+
+    # return the (low, high) mix_keys of the values of the same kind as the value
+    def _kind_bounds(self, value) -> tuple:
+        kind = mix_key(value)[0]
+        return (kind,), (kind + 1,)
+
+    # build the index of the field from all docs of the table
+    def _build_index(self, table_name: str, field: str) -> None:
+        entries = []
+        for chunk_num in self.catalog.get_chunk_numbers(table_name):
+            for offset, doc in enumerate(self._scan_docs_from_file(self._get_chunk_path(table_name, chunk_num))):
+                if self._is_indexable(doc, field):
+                    entries.append((doc[field], chunk_num, offset))
+        self.indexes.create(table_name, field, entries)
+
+    # replace the index entries of the rewritten chunks ({chunk number: docs})
+    def _reindex_chunks(self, table_name: str, chunk_docs: dict) -> None:
+        for field in self.catalog.get_indexes(table_name):
+            entries = []
+            for chunk_num, docs in chunk_docs.items():
+                for offset, doc in enumerate(docs):
+                    if self._is_indexable(doc, field):
+                        entries.append((doc[field], chunk_num, offset))
+            self.indexes.replace_chunks(table_name, field, set(chunk_docs), entries)
+
+    # yield (chunk number, docs) of the chunks that can hold docs meeting the predicate:
+    # the chunks found by an index, or every chunk
+    def _read_candidate_chunks(self, table_name: str, predicate: Predicate):
+        positions = self._index_lookup(table_name, predicate)
+        chunk_nums = positions.keys() if positions is not None else self._zone_chunks(table_name, predicate)
+        for chunk_num in chunk_nums:
+            yield chunk_num, self._read_docs_from_file(self._get_chunk_path(table_name, chunk_num))
+
+    # yield the docs that can meet the predicate: the docs found by an index, or the docs
+    # of the chunks whose zone maps do not rule the predicate out
+    def _scan_candidates(self, table_name: str, predicate: Predicate or None):
+        positions = self._index_lookup(table_name, predicate) if predicate is not None else None
+        if positions is None:
+            for chunk_num in self._zone_chunks(table_name, predicate):
+                yield from self._read_docs_from_file(self._get_chunk_path(table_name, chunk_num))
+            return
+        for chunk_num, offsets in positions.items():
+            yield from self._read_docs_at(self._get_chunk_path(table_name, chunk_num), offsets)
+
+    # yield the docs at the sorted line offsets of a chunk, only these lines are deserialized
+    def _read_docs_at(self, chunk_path: str, offsets: list):
+        with ChunkReader(chunk_path) as reader:
+            yield from map(json.loads, reader.rows_at(offsets))
+
+    # ========================================================
+    #                  ***** Helpers *****
+    #
+    #                     For zone maps
+    # ========================================================
+
+    # return the zone map of the chunk with the docs added to its first old_docs docs,
+    # None if the zone map of the old docs is unknown
+    def _chunk_zone_with_docs(self, table_name: str, chunk_num: int, old_docs: int, docs: list) -> dict or None:
+        zone = None
+        if old_docs > 0:
+            zone = self.catalog.get_zone(table_name, chunk_num)
+            if zone is None:
+                return None
+            zone = copy.deepcopy(zone)
+        zone = ZoneMap(zone)
+        self._add_docs_to_zone(zone, docs)
+        return zone.to_dict()
+
+    # return the zone map of a chunk holding the docs
+    def _zone_of_docs(self, docs: list) -> dict:
+        zone = ZoneMap()
+        self._add_docs_to_zone(zone, docs)
+        return zone.to_dict()
+
+    # add the docs to the zone map, docs without the field (or with None) are nulls
+    def _add_docs_to_zone(self, zone: ZoneMap, docs: list) -> None:
+        zone.add_rows(len(docs))
+        for field in set().union(*docs):
+            zone.add_values(field, [doc[field] for doc in docs if doc.get(field) is not None])
+
     # ========================================================
     #                  ***** Helpers *****
     #
@@ -512,23 +1066,20 @@ class NoSQL(BaseEngine):
     # ========================================================
     
     def _temp_file_name(self, chunk_num: int, pass_num: int) -> str:
-        return f"{TEMP_DIR}/chunk_{chunk_num}_pass_{pass_num}"
+        return temp_path(f"chunk_{chunk_num}_pass_{pass_num}.run")
     
     def _get_chunk_number_from_temp_file(self, temp_file_name: str) -> int:
-        # example: Temp/chunk_0_pass_0
+        # example: Temp/query_<id>/chunk_0_pass_0.run
         return int(temp_file_name.split("/")[-1].split(".")[0].split("_")[1])
     
     def _get_pass_number_from_temp_file(self, temp_file_name: str) -> int:
-        # example: Temp/chunk_0_pass_0
+        # example: Temp/query_<id>/chunk_0_pass_0.run
         return int(temp_file_name.split("/")[-1].split(".")[0].split("_")[3])
     
+    # return the runs of the external sort in the temp workspace of the query
     def _get_temp_chunks(self) -> list:
-        temp_chunks = []
-        for file in os.listdir(TEMP_DIR):
-            if file.endswith(".gitkeep") or file.endswith(".keep"):
-                continue
-            temp_chunks.append(f"{TEMP_DIR}/{file}")
-        return temp_chunks
+        # skip the other temp files (e.g. join partitions)
+        return [temp_file for temp_file in temp_files() if os.path.basename(temp_file).startswith("chunk_")]
     
     # ========================================================
     #                  ***** Helpers *****
@@ -536,72 +1087,165 @@ class NoSQL(BaseEngine):
     #                   For external sort
     # ========================================================
 
-    def _external_sort(self, table_name: str, field: str, order_method: str) -> str:
-        # sorting phase
-        for chunk in self._get_table_chunks(table_name):
-            docs = self._read_docs_from_file(chunk)
-            # ignore docs that don't have the field
-            docs = filter(lambda doc: field in doc, docs)
-            sorted_docs = sorted(docs, key=lambda doc: mix_key(doc[field]), reverse=order_method == "desc")
-            # write the sorted docs to the temp directory
-            chunk_num = self._get_chunk_number(chunk)
-            self._write_docs_to_file(sorted_docs, self._temp_file_name(chunk_num, 0))
-        # merge the sorted chunks
-        return self._merge_sorted_chunks(field, order_method, 0)
-
-    def _merge_sorted_chunks(self, field, order_method, pass_num) -> str:
+    # return the sort key of the docs for the sort fields [(field, order_method)], the values
+    # are ordered like mix_key
+    def _doc_sort_key(self, sort_fields: list) -> SortKey:
+        return SortKey([field for field, _ in sort_fields], [encode_mixed] * len(sort_fields), [order_method for _, order_method in sort_fields])
+
+    # yield the docs that have every sort field of the sort key
+    def _docs_with_sort_fields(self, docs, sort_key: SortKey):
+        if len(sort_key.fields) == 1:
+            field = sort_key.fields[0]
+            return (doc for doc in docs if field in doc)
+        return (doc for doc in docs if all(field in doc for field in sort_key.fields))
+
+    # yield the docs that have the sort fields, sorted on the sort key
+    # the key of a doc is computed once, the runs keep it with the doc
+    def _external_sort_docs(self, docs, sort_key: SortKey):
+        self._sort_docs_to_runs(docs, sort_key)
+        yield from self._merge_sorted_chunks(0)
+
+    # yield the docs of the sorted runs (one per chunk) written by the workers, merged
+    def _merge_worker_runs(self, runs):
+        # wait for every run
+        for _ in runs:
+            pass
+        yield from self._merge_sorted_chunks(0)
+
+    # sort the docs that have the sort fields into the runs of pass 0 in the temp directory with
+    # replacement selection: a heap of CHUNK_SIZE docs is in memory at a time and the runs of
+    # random docs are about 2 * CHUNK_SIZE docs long
+    def _sort_docs_to_runs(self, docs, sort_key: SortKey) -> None:
+        # ignore docs that don't have the sort fields
+        docs = self._docs_with_sort_fields(docs, sort_key)
+        numbered_docs = replacement_selection(((sort_key(doc), doc) for doc in docs), CHUNK_SIZE)
+        write_runs(numbered_docs, lambda run_num: self._temp_file_name(run_num, 0))
+
+    # sort the docs of a run on the sort key and write them with their keys to the run file
+    def _write_sorted_run(self, run: list, sort_key: SortKey, run_file: str) -> None:
+        keyed_docs = sorted(zip(map(sort_key, run), run), key=operator.itemgetter(0))
+        # write the sorted run to the temp directory
+        with RunWriter(run_file) as writer:
+            writer.write_all(keyed_docs)
+
+    # yield the docs of the sorted runs of the pass in the temp directory, merged
+    # while there are more than MERGE_FAN_IN runs, every group of MERGE_FAN_IN runs is merged into
+    # a run of the next pass, the groups of a pass at the same time in worker processes. The last
+    # MERGE_FAN_IN runs (or fewer) are merged straight into the output instead of another file
+    def _merge_sorted_chunks(self, pass_num):
         # find the max chunk number under the temp directory and skip the chunks not in the current pass
         # return -1 if no chunks
         max_chunk_num = max([self._get_chunk_number_from_temp_file(chunk) for chunk in self._get_temp_chunks() if self._get_pass_number_from_temp_file(chunk) == pass_num], default=-1)
         if max_chunk_num == -1:
             raise Exception("No data in the temp directory!")
-        
-        if max_chunk_num == 0:
-            # return the final run
-            return self._temp_file_name(0, pass_num)
-        
-        # Use CHUNK_SIZE-way merging
-        next_chunk_num = 0 # the chunk number of the merged file in the next pass
-        start_chunk_num = 0 # the starting chunk of current merge group
-        end_chunk_num = min(start_chunk_num + CHUNK_SIZE, max_chunk_num + 1) # the ending chunk of current merge group
-
-        while start_chunk_num <= max_chunk_num:
-            merged_file_path = self._temp_file_name(next_chunk_num, pass_num + 1)
-            opened_files = {}
-            loaded_docs = PriorityQueue() # pq of DocElement
-            for chunk_num in range(start_chunk_num, end_chunk_num):
-                opened_files[chunk_num] = open(self._temp_file_name(chunk_num, pass_num), 'r')
-            # load the first doc from each file
-            for chunk_num in range(start_chunk_num, end_chunk_num):
-                doc = self._next_doc(opened_files[chunk_num])
-                if doc is not None:
-                    loaded_docs.put(DocElement(chunk_num, doc, field, order_method))
-            # output until the pq is empty
-            while not loaded_docs.empty():
-                doc_element = loaded_docs.get()
-                # write the doc to the merged file
-                self._write_doc_to_file(doc_element.doc, merged_file_path)
-                # load the next doc from the same file that the doc was read from
-                next_doc = self._next_doc(opened_files[doc_element.get_chunk_num()])
-                if next_doc is not None:
-                    loaded_docs.put(DocElement(doc_element.get_chunk_num(), next_doc, field, order_method))
-            # close all opened files
-            for _, opened_file in opened_files.items():
-                opened_file.close()
-            opened_files.clear()
-            # update the start/end_chunk_num and next_chunk_num and proceed to the next merge group
-            start_chunk_num = end_chunk_num
-            end_chunk_num = min(start_chunk_num + CHUNK_SIZE, max_chunk_num + 1)
-            next_chunk_num += 1
-        # proceed to the next pass
-        return self._merge_sorted_chunks(field, order_method, pass_num + 1)
-                
+
+        run_count = max_chunk_num + 1
+        while run_count > MERGE_FAN_IN:
+            # the runs of a merge group and the run of the next pass it is merged into
+            group_args = []
+            for next_chunk_num, start_chunk_num in enumerate(range(0, run_count, MERGE_FAN_IN)):
+                run_files = [self._temp_file_name(chunk_num, pass_num) for chunk_num in range(start_chunk_num, min(start_chunk_num + MERGE_FAN_IN, run_count))]
+                group_args.append((run_files, self._temp_file_name(next_chunk_num, pass_num + 1)))
+            for _ in map_chunks(self, "_merge_run_group", group_args, task_workers(len(group_args))):
+                pass
+            # proceed to the next pass
+            run_count = len(group_args)
+            pass_num += 1
+        # the keys are dropped from the output
+        run_files = [self._temp_file_name(chunk_num, pass_num) for chunk_num in range(run_count)]
+        yield from map(operator.itemgetter(1), merge_runs(run_files))
+
+    # merge the sorted runs into the output file, the task of a merge group
+    def _merge_run_group(self, run_files: list, output_file: str) -> None:
+        with RunWriter(output_file) as writer:
+            writer.write_all(merge_runs(run_files))
+
+    # ========================================================
+    #                  ***** Helpers *****
+    #
+    #                   For parallel scans
+    # ========================================================
+
+    # return the operator merging the partial accumulators of the aggregations computed by the workers on every chunk
+    def _plan_parallel_aggregate(self, table_name: str, predicate: Predicate or None, labels: list, aggregations: list, workers: int) -> Aggregate:
+        chunk_paths = self._gather_chunk_paths(table_name, predicate)
+        worker_plan = PlanNode("Partial Aggregate", ",".join(labels), len(chunk_paths), [self._plan_rows(table_name, predicate)])
+        chunk_args = [(chunk, predicate, aggregations) for chunk in chunk_paths]
+        plan = Aggregate(self._plan_gather(worker_plan, workers, "_aggregate_chunk", chunk_args), labels, lambda partials: self._merge_aggregates(partials, aggregations))
+        plan.operator = "Finalize Aggregate"
+        return plan
+
+    # return the operator merging the partial groups of the aggregations computed by the workers on every chunk
+    def _plan_parallel_groups(self, table_name: str, predicate: Predicate or None, group_field: str, labels: list, aggregations: list, workers: int) -> HashAggregate:
+        worker_plan = PlanNode("Partial Hash Aggregate", f"group by {group_field}", None, [self._plan_rows(table_name, predicate)])
+        chunk_args = [(chunk, predicate, group_field, aggregations) for chunk in self._gather_chunk_paths(table_name, predicate)]
+        # too many groups to merge in memory are aggregated again from the docs in this process
+        aggregate_docs = lambda: self._hash_aggregate(self._filtered_rows(table_name, predicate), group_field, aggregations)
+        plan = HashAggregate(self._plan_gather(worker_plan, workers, "_group_chunk", chunk_args, batched=True), group_field, labels, lambda partials: self._merge_groups(partials, aggregations, aggregate_docs))
+        plan.operator = "Finalize Hash Aggregate"
+        return plan
+
+    # the tasks run on a chunk by the worker processes of parallel scans, they return the docs
+    # output by the operators of their worker plan and their output (see Gather)
+
+    # return (docs scanned, docs meeting the predicate) of the chunk
+    def _select_chunk_docs(self, chunk_path: str, predicate: Predicate or None) -> tuple:
+        docs = self._read_docs_from_file(chunk_path)
+        if predicate is None:
+            return len(docs), docs
+        return len(docs), [doc for doc in docs if predicate(doc)]
+
+    # the fields of the docs of the chunk meeting the predicate, for projection and filtering
+    def _filter_chunk(self, chunk_path: str, predicate: Predicate or None, fields: list) -> tuple:
+        scanned, docs = self._select_chunk_docs(chunk_path, predicate)
+        projected_docs = [self._project_doc(doc, fields) for doc in docs]
+        return self._worker_counts(len(projected_docs), predicate, len(docs), scanned), projected_docs
+
+    # the partial accumulators of the aggregations over the docs of the chunk meeting the predicate
+    def _aggregate_chunk(self, chunk_path: str, predicate: Predicate or None, aggregations: list) -> tuple:
+        scanned, docs = self._select_chunk_docs(chunk_path, predicate)
+        accumulators = self._new_accumulators(aggregations)
+        for doc in docs:
+            self._update_accumulators(accumulators, aggregations, doc)
+        return self._worker_counts(1, predicate, len(docs), scanned), accumulators
+
+    # the partial groups {group value: accumulators} of the docs of the chunk meeting the predicate
+    def _group_chunk(self, chunk_path: str, predicate: Predicate or None, group_field: str, aggregations: list) -> tuple:
+        scanned, docs = self._select_chunk_docs(chunk_path, predicate)
+        groups = {}
+        for doc in docs:
+            if group_field not in doc:
+                continue
+            accumulators = groups.get(doc[group_field])
+            if accumulators is None:
+                accumulators = groups[doc[group_field]] = self._new_accumulators(aggregations)
+            self._update_accumulators(accumulators, aggregations, doc)
+        return self._worker_counts(len(groups), predicate, len(docs), scanned), groups
+
+    # sort the docs of the chunk meeting the predicate that have the sort fields into the run file,
+    # the output is the run size
+    def _sort_chunk(self, chunk_path: str, predicate: Predicate or None, sort_key: SortKey, run_file: str) -> tuple:
+        scanned, docs = self._select_chunk_docs(chunk_path, predicate)
+        run = list(self._docs_with_sort_fields(docs, sort_key))
+        self._write_sorted_run(run, sort_key, run_file)
+        return self._worker_counts(len(run), predicate, len(docs), scanned), len(run)
+
     # ========================================================
     #                  ***** Helpers *****
     #
     #                   For printing docs
     # ========================================================
     
+    # return the doc with only the fields, the whole doc for *
+    def _project_doc(self, doc: dict, fields: list) -> dict:
+        if len(fields) == 1 and fields[0] == "*":
+            return doc
+        projected_doc = {}
+        for field in fields:
+            if field in doc:
+                projected_doc[field] = doc[field]
+        return projected_doc
+
     def _print_doc(self, doc: dict, io_output=sys.stdout) -> None:
         print(json.dumps(doc, indent=4), file=io_output)
             
\ No newline at end of file
@@ -0,0 +1,193 @@
+import itertools
+
+from .plan import PlanNode
+
+
+# pull-based (Volcano) operators shared by both engines: every operator is a node of the
+# query plan, and iterating it pulls rows (or docs) from its inputs one at a time, so operators
+# compose into a pipeline without materializing intermediate tables
+# the engine-specific work (reading chunks, external sorts, aggregations, joins) is passed in
+# as functions over row streams, which keep their memory bounded by spilling to Temp
+class Operator(PlanNode):
+    def __iter__(self):
+        return iter(self.track(self.produce()))
+
+    # return the output rows of the operator
+    def produce(self):
+        return iter(())
+
+
+class Scan(Operator):
+    # read() returns the rows of the table
+    def __init__(self, table_name: str, rows: int, read):
+        super().__init__("Scan", f"on {table_name}", rows)
+        self.read = read
+
+    def produce(self):
+        return self.read()
+
+
+# a batch of the rows of a chunk for vectorized execution: the typed column arrays of the
+# fields the query reads (by column index) and the positions of the rows in the batch
+# that are still selected
+class Batch():
+    def __init__(self, columns: dict, selection):
+        self.columns = columns
+        self.selection = selection
+
+    def __len__(self):
+        return len(self.selection)
+
+    # return the values of the column at the selected positions
+    def values(self, column_index: int):
+        column = self.columns[column_index]
+        if len(self.selection) == len(column):
+            return column
+        return list(map(column.__getitem__, self.selection))
+
+
+class ColumnScan(Scan):
+    # read() returns a Batch per chunk of the table with the columns of the fields
+    def __init__(self, table_name: str, fields: list, rows: int, read):
+        super().__init__(table_name, rows, read)
+        self.operator = "Column Scan"
+        self.detail = f"on {table_name} ({','.join(fields)})" if len(fields) > 0 else f"on {table_name}"
+        self.batched = True
+
+
+class IndexScan(Scan):
+    # read() returns the rows of the table found by the index on the field of the conjunct
+    def __init__(self, table_name: str, conjunct, rows: int, read):
+        super().__init__(table_name, rows, read)
+        self.operator = "Index Scan"
+        self.detail = f"on {table_name} using index on {conjunct.field}: {conjunct}"
+
+
+class Gather(Operator):
+    # runs the plan below it on every chunk of a table in worker processes. gather() yields per chunk,
+    # in chunk order, the rows output by every operator of the worker plan from the top down (to
+    # report them when analyzing) and the output of the worker plan, a list of rows if batched
+    def __init__(self, child: PlanNode, workers: int, gather, batched: bool = False, rows: int or None = None):
+        super().__init__("Gather", f"(workers={workers})", child.rows if rows is None else rows, [child])
+        self.gather = gather
+        self.batched = batched
+
+    def produce(self):
+        for counts, output in self.gather():
+            node = self.children[0]
+            for rows in counts:
+                node.count(rows)
+                node = node.children[0] if len(node.children) > 0 else None
+            yield output
+
+
+class Filter(Operator):
+    def __init__(self, child: Operator, predicate, rows: int):
+        super().__init__("Filter", str(predicate), rows, [child])
+        self.predicate = predicate
+
+    def produce(self):
+        predicate = self.predicate
+        return (row for row in self.children[0] if predicate(row))
+
+
+class BatchFilter(Filter):
+    # evaluates the predicate over the column arrays of every batch at once
+    def __init__(self, child: Operator, predicate, rows: int):
+        super().__init__(child, predicate, rows)
+        self.operator = "Vectorized Filter"
+        self.batched = True
+
+    def produce(self):
+        predicate = self.predicate
+        for batch in self.children[0]:
+            selection = predicate.select(batch.columns, batch.selection)
+            if len(selection) > 0:
+                yield Batch(batch.columns, selection)
+
+
+class Project(Operator):
+    # project(row) returns the projected row, or the list of projected rows of a batch
+    def __init__(self, child: Operator, fields: list, project):
+        super().__init__("Project", ",".join(fields), child.rows, [child])
+        self.project = project
+        self.batched = child.batched
+
+    def produce(self):
+        return map(self.project, self.children[0])
+
+
+class Sort(Operator):
+    # sort(rows) returns the rows sorted on the sort key
+    def __init__(self, child: Operator, sort_key: str, sort):
+        super().__init__("Sort", f"{sort_key} (external merge sort)", child.rows, [child])
+        self.sort = sort
+
+    def produce(self):
+        return self.sort(iter(self.children[0]))
+
+
+class TopKSort(Sort):
+    # sort(rows) returns the first k rows sorted on the sort key, kept in a heap of k rows while
+    # the rows stream in, so nothing is written to Temp
+    def __init__(self, child: Operator, sort_key: str, k: int, sort):
+        super().__init__(child, sort_key, sort)
+        self.operator = "Top-K Sort"
+        self.detail = f"{sort_key} (heap of {k} rows)"
+        self.rows = min(child.rows, k) if child.rows is not None else None
+
+    def produce(self):
+        # the rows are selected when the first row is pulled, so the time of the sort includes its input
+        yield from self.sort(iter(self.children[0]))
+
+
+class Limit(Operator):
+    # outputs the rows of its input after the first offset rows, at most limit rows (None for no
+    # limit), and stops pulling rows once it has them, so a scan below stops reading chunks
+    # the rows of batches are output one by one
+    def __init__(self, child: Operator, limit: int or None, offset: int = 0):
+        detail = f"{limit}" if limit is not None else "all"
+        if offset > 0:
+            detail += f" offset {offset}"
+        rows = None
+        if child.rows is not None:
+            rows = max(child.rows - offset, 0)
+            rows = min(rows, limit) if limit is not None else rows
+        super().__init__("Limit", detail, rows, [child])
+        self.limit = limit
+        self.offset = offset
+
+    def produce(self):
+        rows = itertools.chain.from_iterable(self.children[0]) if self.children[0].batched else self.children[0]
+        return itertools.islice(rows, self.offset, self.offset + self.limit if self.limit is not None else None)
+
+
+class Aggregate(Operator):
+    # aggregate(rows) returns the row of the results of the aggregations
+    def __init__(self, child: Operator, labels: list, aggregate):
+        super().__init__("Aggregate", ",".join(labels), 1, [child])
+        self.aggregate = aggregate
+
+    def produce(self):
+        return self.aggregate(iter(self.children[0]))
+
+
+class HashAggregate(Aggregate):
+    # aggregate(rows) returns (group value, aggregate results) for every group
+    def __init__(self, child: Operator, group_field: str, labels: list, aggregate):
+        super().__init__(child, labels, aggregate)
+        self.operator = "Hash Aggregate"
+        self.detail = f"group by {group_field}" + (f": {','.join(labels)}" if len(labels) > 0 else "")
+        self.rows = None
+
+
+class Join(Operator):
+    # join(left, right) returns the (left row, right row) pairs meeting the join condition
+    # the inputs are operators, so a join can iterate an input several times
+    # (e.g. the inner input of a nested loop join)
+    def __init__(self, operator: str, detail: str, left: Operator, right: Operator, join):
+        super().__init__(operator, detail, None, [left, right])
+        self.join = join
+
+    def produce(self):
+        return self.join(self.children[0], self.children[1])
@@ -0,0 +1,81 @@
+import concurrent.futures
+import multiprocessing
+import threading
+from collections import deque
+
+from config import PARALLEL_MIN_ROWS, PARALLEL_WORKERS
+from .plan import QueryStats, current_query_stats
+
+# the pool of worker processes shared by the queries (of every thread), started by the first parallel scan
+_pool = None
+_pool_lock = threading.Lock()
+# engine class -> the engine running the tasks in a worker process
+_engines = {}
+
+
+# return the number of worker processes scanning chunks rows in parallel, 1 to scan in this process
+def scan_workers(rows: int, chunks: int) -> int:
+    if rows < PARALLEL_MIN_ROWS:
+        return 1
+    return task_workers(chunks)
+
+
+# return the number of worker processes running tasks independent tasks, 1 to run them in this process
+def task_workers(tasks: int) -> int:
+    if PARALLEL_WORKERS is None or PARALLEL_WORKERS <= 1 or tasks < 2:
+        return 1
+    return min(PARALLEL_WORKERS, tasks)
+
+
+# yield engine.<task>(*args) for the args of every chunk (or other unit of work, e.g. a merge
+# of sorted runs), in order
+# with several workers, the tasks run in the worker processes of the pool: a task gets its chunk
+# path and everything it needs (types, predicate, ...) as arguments, since a worker has its own
+# engine and catalog. At most two results per worker wait to be consumed, so a slow consumer
+# (e.g. printing) keeps the memory bounded
+def map_chunks(engine, task: str, chunk_args: list, workers: int):
+    if workers <= 1:
+        for args in chunk_args:
+            yield getattr(engine, task)(*args)
+        return
+    pool = _get_pool()
+    stats = current_query_stats()
+    pending = deque()
+    try:
+        for args in chunk_args:
+            pending.append(pool.submit(_run_task, type(engine), task, args))
+            if len(pending) >= 2 * workers:
+                yield _task_result(pending.popleft(), stats)
+        while len(pending) > 0:
+            yield _task_result(pending.popleft(), stats)
+    finally:
+        # the consumer stopped early or a task failed
+        for future in pending:
+            future.cancel()
+
+
+def _get_pool() -> concurrent.futures.ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawned workers import the engines fresh instead of copying the state of this process
+            _pool = concurrent.futures.ProcessPoolExecutor(PARALLEL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+# the result of a task, with its io counted in the stats of the query (if any)
+def _task_result(future: concurrent.futures.Future, stats: QueryStats or None):
+    result, task_stats = future.result()
+    if stats is not None:
+        stats.merge(task_stats)
+    return result
+
+
+# run a task in a worker process, return its result and its io counters
+def _run_task(engine_class: type, task: str, args: tuple) -> tuple:
+    engine = _engines.get(engine_class)
+    if engine is None:
+        engine = _engines[engine_class] = engine_class()
+    with QueryStats() as stats:
+        result = getattr(engine, task)(*args)
+    return result, stats
@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+
+from config import BASE_DIR
+
+STORAGE_DIR = os.path.abspath(f"{BASE_DIR}/Storage")
+
+
+# ========================================================
+#                       Plan nodes
+# ========================================================
+
+# a node of the physical plan of a query: an operator (scan, index scan, filter, project, sort,
+# aggregate, join, ...) with its details, its estimated output rows and its input nodes
+# when the plan is analyzed, the engine reports what the operator actually output through
+# track() (a row stream, timed including its inputs) or count() (rows handled in batches)
+class PlanNode():
+    def __init__(self, operator: str, detail: str = "", rows: int or None = None, children: list = ()):
+        self.operator = operator
+        self.detail = detail
+        # estimated output rows, None if unknown
+        self.rows = rows
+        self.children = list(children)
+        self.analyze = False
+        self.actual_rows = None
+        self.time = None
+        # the times the operator was run, e.g. the inner input of a nested loop join runs once per outer row
+        self.loops = 0
+        # True if the operator outputs batches of rows (vectorized execution), whose lengths are counted
+        self.batched = False
+
+    def set_analyze(self, analyze: bool) -> None:
+        self.analyze = analyze
+        for child in self.children:
+            child.set_analyze(analyze)
+
+    # return the row stream, counting and timing the rows when the plan is analyzed
+    def track(self, rows):
+        if not self.analyze:
+            return rows
+        return self._track(rows)
+
+    def _track(self, rows):
+        if self.actual_rows is None:
+            self.actual_rows = 0
+            self.time = 0.0
+        self.loops += 1
+        iterator = iter(rows)
+        while True:
+            start = time.perf_counter()
+            try:
+                row = next(iterator)
+            except StopIteration:
+                self.time += time.perf_counter() - start
+                return
+            self.time += time.perf_counter() - start
+            self.actual_rows += len(row) if self.batched else 1
+            yield row
+
+    # add rows the operator output when it does not produce a row stream
+    def count(self, rows: int) -> None:
+        if self.analyze:
+            self.actual_rows = (self.actual_rows or 0) + rows
+
+    # return the lines of the plan, the inputs of an operator indented below it
+    def render(self, depth: int = 0) -> list:
+        line = self.operator
+        if len(self.detail) > 0:
+            line += f" {self.detail}"
+        if self.rows is not None:
+            line += f"  (est. rows={self.rows})"
+        if self.actual_rows is not None:
+            line += f"  (actual rows={self.actual_rows}"
+            if self.time is not None:
+                line += f" time={self.time * 1000:.3f} ms"
+            line += f" loops={self.loops})" if self.loops > 1 else ")"
+        if depth > 0:
+            line = "     " * (depth - 1) + "  -> " + line
+        lines = [line]
+        for child in self.children:
+            lines.extend(child.render(depth + 1))
+        return lines
+
+
+# ========================================================
+#                      I/O counters
+# ========================================================
+
+# the counters of the query running in the current thread
+_local = threading.local()
+
+
+# io counters of a query: the chunks and bytes of the tables it read and the temp files it wrote
+# the chunk readers (ChunkReader, ColumnarChunk) count the bytes they actually read from a chunk
+# and a chunk once per scan, the temp workspace counts the temp files it names
+class QueryStats():
+    def __init__(self):
+        self.chunks_read = 0
+        self.bytes_read = 0
+        self.temp_files = set()
+
+    def __enter__(self):
+        _local.stats = self
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.stats = None
+        return False
+
+    # add the counters of work done for the query elsewhere (e.g. in a worker process)
+    def merge(self, other: "QueryStats") -> None:
+        self.chunks_read += other.chunks_read
+        self.bytes_read += other.bytes_read
+        self.temp_files |= other.temp_files
+
+
+# return the counters of the query running in the current thread, None if none are active
+def current_query_stats() -> QueryStats or None:
+    return getattr(_local, "stats", None)
+
+
+# return the counters a reader of the file counts its reads in: those of the query running in
+# the current thread if the file is a chunk of a table (not e.g. a temp run or partition), else None
+def chunk_stats(path: str) -> QueryStats or None:
+    stats = current_query_stats()
+    if stats is None:
+        return None
+    path = os.path.abspath(path)
+    if path.startswith(STORAGE_DIR + os.sep) and os.path.basename(path).startswith("chunk_"):
+        return stats
+    return None
@@ -0,0 +1,423 @@
+import itertools
+import operator
+import re
+
+# operator functions of conditions
+COMPARISON_OPS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    "<": operator.lt,
+    ">=": operator.ge,
+    "<=": operator.le,
+}
+# the largest character, used as the upper bound of a like prefix
+MAX_CHAR = "\U0010ffff"
+
+
+# the text of a value in a condition, strings are quoted
+def format_value(value) -> str:
+    return repr(value) if type(value) == str else str(value)
+
+
+# a condition compiled once per query: everything that does not depend on the row
+# is resolved up front and the scan loops only call the predicate on every row (or doc)
+class Predicate():
+    # the field of a predicate on a single field, None otherwise
+    field = None
+
+    def __call__(self, row) -> bool:
+        return True
+
+    # the text of the predicate, e.g. for query plans
+    def __str__(self) -> str:
+        return "true"
+
+    # the estimated fraction of rows that meet the predicate
+    # estimate(predicate) can return a better estimate of a single field predicate
+    # (e.g. from an index), None to use the default
+    def selectivity(self, estimate=None) -> float:
+        return 1.0
+
+    # the predicates that must all hold
+    def conjuncts(self) -> list:
+        return [self]
+
+    # the fields the predicate reads
+    def fields(self) -> set:
+        return set()
+
+    # return the positions of the selection (a list of row positions) whose rows meet the predicate,
+    # for vectorized execution over the typed column arrays of a batch of rows
+    def select(self, columns: dict, selection) -> list:
+        return list(selection)
+
+    # the (low, high, low inclusive, high inclusive) value ranges holding every matching value,
+    # used to look the predicate up in an index (None bounds are unbounded), None if there are none
+    def index_ranges(self) -> list or None:
+        return None
+
+    # False if no row of a chunk can meet the predicate, from the zone map of the chunk:
+    # bounds(field, value) returns the (min, max) of the values of the field in the chunk
+    # that compare with the value, None if the chunk has none
+    def may_match(self, bounds) -> bool:
+        return True
+
+    # reorder the operands of and/or for short-circuit evaluation
+    def reorder(self, estimate=None) -> None:
+        pass
+
+
+class And(Predicate):
+    def __init__(self, children: list):
+        self.children = children
+
+    def __call__(self, row) -> bool:
+        for child in self.children:
+            if not child(row):
+                return False
+        return True
+
+    def selectivity(self, estimate=None) -> float:
+        result = 1.0
+        for child in self.children:
+            result *= child.selectivity(estimate)
+        return result
+
+    def __str__(self) -> str:
+        return " and ".join(f"({child})" if isinstance(child, Or) else str(child) for child in self.children)
+
+    def conjuncts(self) -> list:
+        return [conjunct for child in self.children for conjunct in child.conjuncts()]
+
+    def fields(self) -> set:
+        return set().union(*(child.fields() for child in self.children))
+
+    def select(self, columns: dict, selection) -> list:
+        # every operand only checks the rows the previous operands kept
+        for child in self.children:
+            if len(selection) == 0:
+                break
+            selection = child.select(columns, selection)
+        return list(selection)
+
+    def may_match(self, bounds) -> bool:
+        return all(child.may_match(bounds) for child in self.children)
+
+    def reorder(self, estimate=None) -> None:
+        for child in self.children:
+            child.reorder(estimate)
+        # the operand most likely to be false goes first
+        self.children.sort(key=lambda child: child.selectivity(estimate))
+
+
+class Or(Predicate):
+    def __init__(self, children: list):
+        self.children = children
+
+    def __call__(self, row) -> bool:
+        for child in self.children:
+            if child(row):
+                return True
+        return False
+
+    def __str__(self) -> str:
+        return " or ".join(str(child) for child in self.children)
+
+    def fields(self) -> set:
+        return set().union(*(child.fields() for child in self.children))
+
+    def select(self, columns: dict, selection) -> list:
+        # every operand only checks the rows the previous operands did not select
+        selected = set()
+        remaining = selection
+        for child in self.children:
+            if len(remaining) == 0:
+                break
+            matches = child.select(columns, remaining)
+            if len(matches) > 0:
+                selected.update(matches)
+                remaining = [position for position in remaining if position not in selected]
+        return [position for position in selection if position in selected]
+
+    def may_match(self, bounds) -> bool:
+        return any(child.may_match(bounds) for child in self.children)
+
+    def selectivity(self, estimate=None) -> float:
+        result = 1.0
+        for child in self.children:
+            result *= 1.0 - child.selectivity(estimate)
+        return 1.0 - result
+
+    def reorder(self, estimate=None) -> None:
+        for child in self.children:
+            child.reorder(estimate)
+        # the operand most likely to be true goes first
+        self.children.sort(key=lambda child: child.selectivity(estimate), reverse=True)
+
+
+class Not(Predicate):
+    def __init__(self, child: Predicate):
+        self.child = child
+
+    def __call__(self, row) -> bool:
+        return not self.child(row)
+
+    def __str__(self) -> str:
+        return f"not ({self.child})"
+
+    def fields(self) -> set:
+        return self.child.fields()
+
+    def select(self, columns: dict, selection) -> list:
+        matches = set(self.child.select(columns, selection))
+        return [position for position in selection if position not in matches]
+
+    def selectivity(self, estimate=None) -> float:
+        return 1.0 - self.child.selectivity(estimate)
+
+    def reorder(self, estimate=None) -> None:
+        self.child.reorder(estimate)
+
+
+# ========================================================
+#              Predicates on a single field
+# ========================================================
+
+class FieldPredicate(Predicate):
+    # the default selectivity when there is no better estimate
+    default_selectivity = 1.0
+
+    def fields(self) -> set:
+        return {self.field}
+
+    def may_match(self, bounds) -> bool:
+        ranges = self.index_ranges()
+        if ranges is None:
+            return True
+        # a chunk can match if one of the value ranges of the predicate overlaps its values
+        for low, high, low_inclusive, high_inclusive in ranges:
+            chunk_bounds = bounds(self.field, low if low is not None else high)
+            if chunk_bounds is None:
+                continue
+            chunk_min, chunk_max = chunk_bounds
+            if low is not None and (chunk_max < low or (chunk_max == low and not low_inclusive)):
+                continue
+            if high is not None and (chunk_min > high or (chunk_min == high and not high_inclusive)):
+                continue
+            return True
+        return False
+
+    def selectivity(self, estimate=None) -> float:
+        if estimate is not None:
+            result = estimate(self)
+            if result is not None:
+                return result
+        return self.default_selectivity
+
+
+class Comparison(FieldPredicate):
+    # <field> <op> <value>
+    def __init__(self, field: str, op: str, value):
+        self.field = field
+        self.op = op
+        self.value = value
+        self.op_func = COMPARISON_OPS[op]
+        # the usual guesses: one in ten rows for =, one in three for ranges
+        self.default_selectivity = {"=": 0.1, "!=": 0.9}.get(op, 1 / 3)
+
+    def may_match(self, bounds) -> bool:
+        if self.op == "!=":
+            # only a chunk whose values all equal the value cannot match
+            return bounds(self.field, self.value) != [self.value, self.value]
+        return super().may_match(bounds)
+
+    def __str__(self) -> str:
+        return f"{self.field}{self.op}{format_value(self.value)}"
+
+    def index_ranges(self) -> list or None:
+        if self.op == "=":
+            return [(self.value, self.value, True, True)]
+        elif self.op in (">", ">="):
+            return [(self.value, None, self.op == ">=", True)]
+        elif self.op in ("<", "<="):
+            return [(None, self.value, True, self.op == "<=")]
+        return None
+
+
+class In(FieldPredicate):
+    # <field> in (<value>, ...)
+    def __init__(self, field: str, values: list):
+        self.field = field
+        self.values = set(values)
+        self.default_selectivity = min(0.5, 0.1 * len(self.values))
+
+    def __str__(self) -> str:
+        return f"{self.field} in ({', '.join(sorted(format_value(value) for value in self.values))})"
+
+    def index_ranges(self) -> list or None:
+        return [(value, value, True, True) for value in self.values]
+
+
+class Between(FieldPredicate):
+    # <field> between <low> and <high>, both inclusive
+    default_selectivity = 0.25
+
+    def __init__(self, field: str, low, high):
+        self.field = field
+        self.low = low
+        self.high = high
+
+    def __str__(self) -> str:
+        return f"{self.field} between {format_value(self.low)} and {format_value(self.high)}"
+
+    def index_ranges(self) -> list or None:
+        return [(self.low, self.high, True, True)]
+
+
+class Like(FieldPredicate):
+    # <field> like <pattern> where % matches any characters and _ matches one character
+    def __init__(self, field: str, pattern: str):
+        self.field = field
+        self.pattern = pattern
+        regex = "".join(".*" if char == "%" else "." if char == "_" else re.escape(char) for char in pattern)
+        self.regex = re.compile(regex, re.DOTALL)
+        # the characters before the first wildcard
+        self.prefix = re.split(r"[%_]", pattern, maxsplit=1)[0]
+        self.default_selectivity = 0.1 if len(self.prefix) > 0 else 0.25
+
+    def __str__(self) -> str:
+        return f"{self.field} like {format_value(self.pattern)}"
+
+    def index_ranges(self) -> list or None:
+        if self.prefix == self.pattern:
+            return [(self.pattern, self.pattern, True, True)]
+        if len(self.prefix) == 0:
+            return None
+        # every value starting with the prefix
+        return [(self.prefix, self.prefix + MAX_CHAR, True, True)]
+
+
+# ========================================================
+#                 Relational predicates
+# ========================================================
+
+# predicates on the typed rows of a relational table
+# column_index: the position of the field in the rows
+# the values are already converted to the type of the column
+# select() maps the comparison over the column values of the selection and compresses
+# the selection with the results, so the loop over the rows runs in C
+
+
+# return the values of the column at the positions of the selection
+def selected_values(column, selection):
+    if len(selection) == len(column):
+        return column
+    return map(column.__getitem__, selection)
+
+class ColumnComparison(Comparison):
+    def __init__(self, field: str, op: str, value, column_index: int):
+        super().__init__(field, op, value)
+        self.column_index = column_index
+
+    def __call__(self, row) -> bool:
+        return self.op_func(row[self.column_index], self.value)
+
+    def select(self, columns: dict, selection) -> list:
+        values = selected_values(columns[self.column_index], selection)
+        return list(itertools.compress(selection, map(self.op_func, values, itertools.repeat(self.value))))
+
+
+class ColumnIn(In):
+    def __init__(self, field: str, values: list, column_index: int):
+        super().__init__(field, values)
+        self.column_index = column_index
+
+    def __call__(self, row) -> bool:
+        return row[self.column_index] in self.values
+
+    def select(self, columns: dict, selection) -> list:
+        values = selected_values(columns[self.column_index], selection)
+        return list(itertools.compress(selection, map(self.values.__contains__, values)))
+
+
+class ColumnBetween(Between):
+    def __init__(self, field: str, low, high, column_index: int):
+        super().__init__(field, low, high)
+        self.column_index = column_index
+
+    def __call__(self, row) -> bool:
+        return self.low <= row[self.column_index] <= self.high
+
+    def select(self, columns: dict, selection) -> list:
+        column = columns[self.column_index]
+        values = selected_values(column, selection)
+        selection = list(itertools.compress(selection, map(operator.le, itertools.repeat(self.low), values)))
+        values = selected_values(column, selection)
+        return list(itertools.compress(selection, map(operator.le, values, itertools.repeat(self.high))))
+
+
+class ColumnLike(Like):
+    def __init__(self, field: str, pattern: str, column_index: int):
+        super().__init__(field, pattern)
+        self.column_index = column_index
+
+    def __call__(self, row) -> bool:
+        return self.regex.fullmatch(row[self.column_index]) is not None
+
+    def select(self, columns: dict, selection) -> list:
+        values = selected_values(columns[self.column_index], selection)
+        return list(itertools.compress(selection, map(self.regex.fullmatch, values)))
+
+
+# ========================================================
+#                   NoSQL predicates
+# ========================================================
+
+# predicates on NoSQL docs: docs without the field never match, strings only
+# match strings, and ints are compared with floats as floats
+
+class DocComparison(Comparison):
+    def __init__(self, field: str, op: str, value):
+        super().__init__(field, op, value)
+        self.value_type = type(value)
+
+    def __call__(self, doc) -> bool:
+        if self.field not in doc:
+            return False
+        doc_value = doc[self.field]
+        value = self.value
+        # check if doc field value is of the same type as value
+        if type(doc_value) != self.value_type:
+            if type(doc_value) == str or self.value_type == str:
+                return False
+            elif type(doc_value) == float or self.value_type == float:
+                # if one of them is float, convert both to float
+                value = float(value)
+                doc_value = float(doc_value)
+        return self.op_func(doc_value, value)
+
+
+class DocIn(In):
+    def __call__(self, doc) -> bool:
+        if self.field not in doc:
+            return False
+        doc_value = doc[self.field]
+        # 1 and 1.0 are equal set members, "1" is not
+        return type(doc_value) in (int, float, str) and doc_value in self.values
+
+
+class DocBetween(Between):
+    def __init__(self, field: str, low, high):
+        super().__init__(field, low, high)
+        self.low_comparison = DocComparison(field, ">=", low)
+        self.high_comparison = DocComparison(field, "<=", high)
+
+    def __call__(self, doc) -> bool:
+        return self.low_comparison(doc) and self.high_comparison(doc)
+
+
+class DocLike(Like):
+    def __call__(self, doc) -> bool:
+        doc_value = doc.get(self.field)
+        return type(doc_value) == str and self.regex.fullmatch(doc_value) is not None
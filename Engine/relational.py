@@ -1,17 +1,36 @@
 import sys
-from utils.RowElement import RowElement
-from utils.util import clear_temp_files
+from utils.Accumulator import NUMERIC_METHODS, create_accumulator
 from .base import BaseEngine
-from config import BASE_DIR, CHUNK_SIZE, FIELD_PRINT_LEN, TEMP_DIR
+from .catalog import Catalog
+from .chunkreader import ChunkReader
+from .columnar import COLUMNAR_SUFFIX, ColumnarChunk, to_column
+from .index import IndexStore
+from .operators import Aggregate, Batch, ColumnScan, HashAggregate, Operator, Project, Sort, TopKSort
+from .parallel import map_chunks, task_workers
+from .locks import TableLocks, locks_tables
+from .workspace import in_temp_workspace, temp_files, temp_path
+from .runs import RunWriter, merge_runs, read_run, replacement_selection, write_runs
+from .sortkey import TYPE_ENCODERS, SortKey
+from .plan import PlanNode
+from .zonemap import ZoneMap
+from .predicate import And, ColumnBetween, ColumnComparison, ColumnIn, ColumnLike, Not, Or, Predicate
+from config import BASE_DIR, CHUNK_FORMATS, CHUNK_SIZE, FIELD_PRINT_LEN, HASH_AGG_MEMORY_GROUPS, HASH_JOIN_MEMORY_ROWS, MERGE_FAN_IN, RELATIONAL_CHUNK_FORMAT, TOP_K_MAX_ROWS, VECTORIZED_EXECUTION
 import os
 import re
-import operator
+import copy
 import csv
-from queue import PriorityQueue
+import heapq
+import io
+import itertools
+import operator
+import time
 
 class Relational(BaseEngine):
     def __init__(self):
         super().__init__()
+        self.catalog = Catalog(f"{BASE_DIR}/Storage/Relational", ".csv", {"columnar": COLUMNAR_SUFFIX})
+        self.locks = TableLocks(f"{BASE_DIR}/Storage/Relational")
+        self.indexes = IndexStore(f"{BASE_DIR}/Storage/Relational")
 
     def run(self):
         print("Relational Database selected")
@@ -35,6 +54,7 @@ class Relational(BaseEngine):
                 self._print_row({"tables": file}, header_schema, format_str, FIELD_PRINT_LEN, io_output=io_output)
         return True
 
+    @locks_tables(write=("table_name",))
     def create_table(self, table_name, fields, io_output=sys.stdout) -> bool:
         if self._table_exists(table_name):
             print(f"Cannot create table. Table {table_name} already exists!", file=io_output)
@@ -43,13 +63,12 @@ class Relational(BaseEngine):
         table_storage_path = self._get_table_path(table_name)
         # create the table directory
         os.mkdir(table_storage_path)
-        # create the schema.txt
-        with open(f"{table_storage_path}/schema.txt", "w") as f:
-            csv_writer = csv.writer(f)
-            csv_writer.writerow(table_schema)
+        # create the manifest holding the schema
+        self.catalog.create(table_name, table_schema, RELATIONAL_CHUNK_FORMAT)
         print("table created", file=io_output)
         return True
 
+    @locks_tables(write=("table_name",))
     def drop_table(self, table_name, io_output=sys.stdout) -> bool:
         if not self._table_exists(table_name):
             print(f"Table {table_name} does not exist!", file=io_output)
@@ -59,6 +78,8 @@ class Relational(BaseEngine):
         for file in os.listdir(table_storage_path):
             os.remove(f"{table_storage_path}/{file}")
         os.rmdir(table_storage_path)
+        self.catalog.invalidate(table_name)
+        self.indexes.invalidate(table_name)
         print("table dropped", file=io_output)
         return True
     
@@ -67,34 +88,37 @@ class Relational(BaseEngine):
         if not file_name.endswith(".csv"):
             print(f"File {file_name} is not a csv file", file=io_output)
             return True
-        print("loading...")
+        print("loading...", file=io_output)
         csv_file_path = f"{BASE_DIR}/ToBeLoaded/{file_name}"
         table_name = file_name.split(".")[0]
-        table_storage_path = f"{BASE_DIR}/Storage/Relational/{table_name}"
-        # create the table directory if not exists
-        if not os.path.exists(table_storage_path):
-            os.mkdir(table_storage_path)
-        else:
-            print("Cannot load dataset. Table already exists!", file=io_output)
-            return True
-        # read the first line of the csv to find the schema
-        with open(csv_file_path, "r") as f:
-            csv_reader = csv.reader(f)
-            table_schema = next(csv_reader)
-            # write the schema to the schema.txt
-            with open(f"{table_storage_path}/schema.txt", "w") as f:
-                csv_writer = csv.writer(f)
-                csv_writer.writerow(table_schema)
-        
-        # load the rest of the data to the storage using _insert_row
-        with open(csv_file_path, "r") as f:
-            csv_reader = csv.reader(f)
-            next(csv_reader) # skip the first line
-            for row in csv_reader:
-                self._insert_row(table_name, row)
-        print("loading succeeded", file=io_output)
-        return True
+        # the table is written alone while it is loaded
+        with self.locks.lock(write=[table_name]):
+            table_storage_path = f"{BASE_DIR}/Storage/Relational/{table_name}"
+            # create the table directory if not exists
+            if not os.path.exists(table_storage_path):
+                os.mkdir(table_storage_path)
+            else:
+                print("Cannot load dataset. Table already exists!", file=io_output)
+                return True
+            # read the first line of the csv to find the schema
+            with open(csv_file_path, "r") as f:
+                csv_reader = csv.reader(f)
+                table_schema = next(csv_reader)
+            # create the manifest holding the schema
+            self.catalog.create(table_name, table_schema, RELATIONAL_CHUNK_FORMAT)
+            # stream the rest of the data to the storage in whole chunks
+            start_time = time.perf_counter()
+            with open(csv_file_path, "r") as f:
+                csv_reader = csv.reader(f)
+                next(csv_reader) # skip the first line
+                row_count = self._bulk_insert_rows(table_name, csv_reader, io_output)
+            elapsed = time.perf_counter() - start_time
+            rows_per_sec = row_count / elapsed if elapsed > 0 else float(row_count)
+            print(f"loaded {row_count} rows in {elapsed:.2f}s ({rows_per_sec:.0f} rows/sec)", file=io_output)
+            print("loading succeeded", file=io_output)
+            return True
 
+    @locks_tables(write=("table_name",))
     def insert_data(self, table_name: str, data: list, io_output=sys.stdout) -> bool:
         # check if the table exists
         if not self._table_exists(table_name):
@@ -115,10 +139,11 @@ class Relational(BaseEngine):
         # build the new row to be inserted
         row = self._dict_to_row(table_schema, data_dict)
         # insert the new row
-        self._insert_row(table_name, row)
+        self._insert_row(table_name, row, io_output)
         print("insertion succeeded", file=io_output)
         return True
 
+    @locks_tables(write=("table_name",))
     def delete_data(self, table_name: str, condition: str, io_output=sys.stdout) -> bool:
         # check if the table exists
         if not self._table_exists(table_name):
@@ -126,22 +151,38 @@ class Relational(BaseEngine):
             return True
         table_schema = self._get_table_schema(table_name)
         table_types = self._get_table_types(table_name)
-        # iterate through all chunks and delete rows that meet the condition
-        for chunk in self._get_table_chunks(table_name):
-            with open(chunk, "r+") as c:
-                csv_reader = csv.reader(c)
-                typed_rows = self._read_typed_rows(table_types, csv_reader)
-                # clear the file for replacement
-                c.truncate(0)
-            with open(chunk, "w") as c:
-                csv_writer = csv.writer(c)
-                for typed_row in typed_rows:
-                    # leave the rows that are not supposed to be deleted
-                    if not self._row_meets_condition(table_schema, typed_row, condition):
-                        csv_writer.writerow(typed_row)
+        # parse the condition once for all rows
+        predicate = self._compile_condition(table_name, condition, io_output)
+        if predicate is None:
+            return True
+        scan = self._plan_scan(table_name, predicate)
+        filter_node = self._plan_filter(table_name, predicate, scan)
+        plan = PlanNode("Delete", f"on {table_name}", None, [filter_node])
+        if not self._begin_plan(plan):
+            return True
+        # iterate through the chunks that can hold matching rows and delete rows that meet the condition
+        chunk_rows = {}
+        rewritten_chunks = {}
+        for chunk_num, typed_rows in self._read_candidate_chunks(table_name, predicate):
+            # leave the rows that are not supposed to be deleted
+            kept_rows = [typed_row for typed_row in typed_rows if not predicate(typed_row)]
+            scan.count(len(typed_rows))
+            filter_node.count(len(typed_rows) - len(kept_rows))
+            plan.count(len(typed_rows) - len(kept_rows))
+            if len(kept_rows) == len(typed_rows):
+                continue
+            self._write_typed_rows(self.catalog.get_chunk_path(table_name, chunk_num), kept_rows, table_types)
+            chunk_rows[chunk_num] = len(kept_rows)
+            rewritten_chunks[chunk_num] = kept_rows
+        # record the new row counts and zone maps in the catalog and the new row offsets in the indexes
+        if len(chunk_rows) > 0:
+            zones = {chunk_num: self._zone_of_rows(table_schema, table_types, typed_rows) for chunk_num, typed_rows in rewritten_chunks.items()}
+            self.catalog.set_chunk_rows(table_name, chunk_rows, zones)
+            self._reindex_chunks(table_name, rewritten_chunks)
         print("deletion succeeded", file=io_output)
         return True
                             
+    @locks_tables(write=("table_name",))
     def update_data(self, table_name: str, condition: str, data: list, io_output=sys.stdout) -> bool:
         # check if the table exists
         if not self._table_exists(table_name):
@@ -149,35 +190,51 @@ class Relational(BaseEngine):
             return True
         table_schema = self._get_table_schema(table_name)
         table_types = self._get_table_types(table_name)
-        # iterate through all chunks and update rows that meet the condition
-        for chunk in self._get_table_chunks(table_name):
-            with open(chunk, "r+") as c:
-                csv_reader = csv.reader(c)
-                typed_rows = self._read_typed_rows(table_types, csv_reader)
-                # clear the file for replacement
-                c.truncate(0)
-            with open(chunk, "w") as c:
-                csv_writer = csv.writer(c)
-                for typed_row in typed_rows:
-                    # if meets the condition, update the row
-                    if self._row_meets_condition(table_schema, typed_row, condition):
-                        # dict containing old values
-                        data_dict = self._row_to_dict(table_schema, typed_row)
-                        # update the values in data_dict
-                        for field_data in data:
-                            field_name, field_value = field_data.split("=")
-                            field_value = self._convert_to_type(field_value, self._get_field_type_from_types(table_schema, table_types, field_name))
-                            data_dict[field_name] = field_value
-                        # build the new row
-                        new_row = self._dict_to_row(table_schema, data_dict)
-                        # insert the new row
-                        csv_writer.writerow(new_row)
-                    else:
-                        csv_writer.writerow(typed_row)
+        # parse the condition once for all rows
+        predicate = self._compile_condition(table_name, condition, io_output)
+        if predicate is None:
+            return True
+        scan = self._plan_scan(table_name, predicate)
+        filter_node = self._plan_filter(table_name, predicate, scan)
+        plan = PlanNode("Update", f"on {table_name} set {','.join(data)}", None, [filter_node])
+        if not self._begin_plan(plan):
+            return True
+        # iterate through the chunks that can hold matching rows and update rows that meet the condition
+        rewritten_chunks = {}
+        for chunk_num, typed_rows in self._read_candidate_chunks(table_name, predicate):
+            new_rows = []
+            updated = False
+            scan.count(len(typed_rows))
+            for typed_row in typed_rows:
+                # if meets the condition, update the row
+                if predicate(typed_row):
+                    filter_node.count(1)
+                    plan.count(1)
+                    # dict containing old values
+                    data_dict = self._row_to_dict(table_schema, typed_row)
+                    # update the values in data_dict
+                    for field_data in data:
+                        field_name, field_value = field_data.split("=")
+                        field_value = self._convert_to_type(field_value, self._get_field_type_from_types(table_schema, table_types, field_name))
+                        data_dict[field_name] = field_value
+                    # build the new row
+                    new_rows.append(self._dict_to_row(table_schema, data_dict))
+                    updated = True
+                else:
+                    new_rows.append(typed_row)
+            if not updated:
+                continue
+            self._write_typed_rows(self.catalog.get_chunk_path(table_name, chunk_num), new_rows, table_types)
+            rewritten_chunks[chunk_num] = new_rows
+        # record the new values in the zone maps and the indexes
+        if len(rewritten_chunks) > 0:
+            self.catalog.set_zones(table_name, {chunk_num: self._zone_of_rows(table_schema, table_types, typed_rows) for chunk_num, typed_rows in rewritten_chunks.items()})
+            self._reindex_chunks(table_name, rewritten_chunks)
         print("update succeeded", file=io_output)
         return True
 
-    def projection(self, table_name: str, fields: list, io_output=sys.stdout) -> bool:
+    @locks_tables(read=("table_name",))
+    def projection(self, table_name: str, fields: list, io_output=sys.stdout, limit: int = None, offset: int = 0) -> bool:
         # check if the table exists
         if not self._table_exists(table_name):
             print(f"Table {table_name} does not exist!", file=io_output)
@@ -196,22 +253,39 @@ class Relational(BaseEngine):
             # add the fields to the projection schema
             for field in fields:
                 projection_schema.append(field)
+        # a limited scan stops once it has its rows, in the process of the query
+        workers = self._scan_workers(table_name, None) if limit is None else 1
+        if workers > 1:
+            # every worker reads the fields of a chunk, the rows are printed in chunk order
+            column_indexes = [table_schema.index(field) for field in projection_schema]
+            worker_plan = Project(self._plan_scan(table_name), projection_schema, None)
+            chunk_args = [(chunk, self._get_table_types(table_name), list(projection_schema), column_indexes) for chunk in self._gather_chunk_paths(table_name, None)]
+            plan = self._plan_gather(worker_plan, workers, "_project_chunk", chunk_args, batched=True)
+        elif self.catalog.get_format(table_name) == "columnar":
+            # only the columns of the fields are read
+            column_indexes = [table_schema.index(field) for field in projection_schema]
+            scan = ColumnScan(table_name, list(projection_schema), self.catalog.get_row_count(table_name), lambda: self._scan_column_batches(table_name, column_indexes))
+            plan = Project(scan, projection_schema, lambda batch: self._batch_to_dicts(batch, projection_schema, column_indexes))
+        else:
+            # the fields are printed as stored, so the rows are not typed
+            scan = self._plan_scan(table_name, read=lambda: self._read_raw_rows(self._get_table_chunks(table_name)))
+            plan = Project(scan, projection_schema, lambda row: self._row_to_dict(table_schema, row))
+        plan = self._plan_limit(plan, limit, offset)
+        if not self._begin_plan(plan):
+            return True
         # get the format string for printing
         format_str = self._get_format_str(projection_schema, FIELD_PRINT_LEN)
         # print the header
         self._print_table_header(projection_schema, format_str, io_output=io_output)
         # iterate through all chunks and print the specified fields to console
-        for chunk in self._get_table_chunks(table_name):
-            with open(chunk, "r") as c:
-                csv_reader = csv.reader(c)
-                for row in csv_reader:
-                    row_dict = self._row_to_dict(table_schema, row)
-                    # print the row
-                    self._print_row(row_dict, projection_schema, format_str, FIELD_PRINT_LEN, io_output=io_output)
+        for row_dict in itertools.chain.from_iterable(plan) if plan.batched else plan:
+            # print the row
+            self._print_row(row_dict, projection_schema, format_str, FIELD_PRINT_LEN, io_output=io_output)
         print("selection succeeded", file=io_output)
         return True
 
-    def filtering(self, table_name: str, fields: list, condition: str, io_output=sys.stdout) -> bool:
+    @locks_tables(read=("table_name",))
+    def filtering(self, table_name: str, fields: list, condition: str, io_output=sys.stdout, limit: int = None, offset: int = 0) -> bool:
         # check if the table exists
         if not self._table_exists(table_name):
             print(f"Table {table_name} does not exist!", file=io_output)
@@ -230,56 +304,100 @@ class Relational(BaseEngine):
             # create a schema for the projection table
             for field in fields:
                 projection_schema.append(field)
+        # parse the condition once for all rows
+        predicate = self._compile_condition(table_name, condition, io_output)
+        if predicate is None:
+            return True
+        # a limited scan stops once it has its rows, in the process of the query
+        workers = self._scan_workers(table_name, predicate) if limit is None else 1
+        # a full scan reads the needed columns of a chunk at a time and filters them vectorized
+        batches = self._plan_batches(table_name, predicate, projection_schema)
+        if workers > 1:
+            # every worker filters a chunk, the rows are printed in chunk order
+            projection_indexes = [table_schema.index(field) for field in projection_schema]
+            read_indexes = self._read_column_indexes(table_schema, predicate, projection_schema)
+            worker_plan = Project(batches if batches is not None else self._plan_rows(table_name, predicate), projection_schema, None)
+            chunk_args = [(chunk, table_types, predicate, list(projection_schema), projection_indexes, read_indexes) for chunk in self._gather_chunk_paths(table_name, predicate)]
+            plan = self._plan_gather(worker_plan, workers, "_filter_chunk", chunk_args, batched=True)
+        elif batches is not None:
+            projection_indexes = [table_schema.index(field) for field in projection_schema]
+            plan = Project(batches, projection_schema, lambda batch: self._batch_to_dicts(batch, projection_schema, projection_indexes))
+        else:
+            # the rows that can meet the condition are read (using an index if possible) and filtered
+            plan = Project(self._plan_rows(table_name, predicate), projection_schema, lambda typed_row: self._row_to_dict(table_schema, typed_row))
+        plan = self._plan_limit(plan, limit, offset)
+        if not self._begin_plan(plan):
+            return True
         # get the format string for printing
         format_str = self._get_format_str(projection_schema, FIELD_PRINT_LEN)
         # print the header
         self._print_table_header(projection_schema, format_str, io_output=io_output)
-        # iterate through all chunks and print the specified fields to console
-        for chunk in self._get_table_chunks(table_name):
-            with open(chunk, "r") as c:
-                csv_reader = csv.reader(c)
-                typed_rows = self._read_typed_rows(table_types, csv_reader)
-                for typed_row in typed_rows:
-                    # skip the rows that do not meet the condition
-                    if not self._row_meets_condition(table_schema, typed_row, condition):
-                        continue
-                    row_dict = self._row_to_dict(table_schema, typed_row)
-                    # print the row
-                    self._print_row(row_dict, projection_schema, format_str, FIELD_PRINT_LEN, io_output=io_output)
+        # print the specified fields of the rows that meet the condition to console
+        for row_dict in itertools.chain.from_iterable(plan) if plan.batched else plan:
+            # print the row
+            self._print_row(row_dict, projection_schema, format_str, FIELD_PRINT_LEN, io_output=io_output)
         print("filtering succeeded", file=io_output)
         return True
 
 
-    def order(self, table_name: str, field: str, order_method: str, io_output=sys.stdout) -> bool:
+    @locks_tables(read=("table_name",))
+    @in_temp_workspace
+    def order(self, table_name: str, sort_fields: list, io_output=sys.stdout, condition: str = None, limit: int = None, offset: int = 0) -> bool:
         # check if the table exists
         if not self._table_exists(table_name):
             print(f"Table {table_name} does not exist!", file=io_output)
             return True
-        # check if the field is in the table schema
+        # check if the fields are in the table schema
         table_schema = self._get_table_schema(table_name)
-        if field not in table_schema:
-            print(f"field {field} not in table schema", file=io_output)
+        table_types = self._get_table_types(table_name)
+        for field, _ in sort_fields:
+            if field not in table_schema:
+                print(f"field {field} not in table schema", file=io_output)
+                return True
+        # only the rows meeting the condition are sorted
+        predicate = None
+        if condition is not None:
+            predicate = self._compile_condition(table_name, condition, io_output)
+            if predicate is None:
+                return True
+        # the rows are sorted ascending on the key of their sort fields, encoded once per row
+        sort_key = self._row_sort_key(table_schema, table_types, sort_fields)
+        sort_detail = self._sort_detail(sort_fields)
+        workers = self._scan_workers(table_name, predicate)
+        if limit is not None and offset + limit <= TOP_K_MAX_ROWS:
+            # only the first offset + limit rows are kept, in a heap while the rows stream from the scan
+            top_k = offset + limit
+            top_rows = lambda typed_rows: heapq.nsmallest(top_k, typed_rows, key=sort_key)
+            plan = TopKSort(self._plan_rows(table_name, predicate), sort_detail, top_k, top_rows)
+        elif workers > 1:
+            # every worker sorts (the rows meeting the condition of) a chunk into a run, then the runs are merged
+            chunk_paths = self._gather_chunk_paths(table_name, predicate)
+            rows = self._plan_rows(table_name, predicate)
+            worker_plan = PlanNode("Partial Sort", f"{sort_detail} (a run per chunk)", rows.rows, [rows])
+            chunk_args = [(chunk, table_types, predicate, sort_key, self._temp_file_name(run_num, 0)) for run_num, chunk in enumerate(chunk_paths)]
+            runs = self._plan_gather(worker_plan, workers, "_sort_chunk", chunk_args, rows=len(chunk_paths))
+            plan = Sort(runs, sort_detail, self._merge_worker_runs)
+            plan.rows = rows.rows
+        else:
+            # the rows stream from the scan (and filter) into the runs of the external sort
+            plan = Sort(self._plan_rows(table_name, predicate), sort_detail, lambda typed_rows: self._external_sort_rows(typed_rows, sort_key))
+        # the merge of the external sort stops once it has output the rows
+        plan = self._plan_limit(plan, limit, offset)
+        if not self._begin_plan(plan):
             return True
-        # do external sorting
-        temp_sorted_file = self._external_sort(table_name, field, order_method)
-        # print the merged file
+        # print the sorted rows
         format_str = self._get_format_str(table_schema, FIELD_PRINT_LEN)
         self._print_table_header(table_schema, format_str, io_output=io_output)
-        with open(temp_sorted_file, "r") as f:
-            csv_reader = csv.reader(f)
-            for row in csv_reader:
-                row_dict = {}
-                for field in table_schema:
-                    row_dict[field] = row[table_schema.index(field)]
-                # print the row
-                self._print_row(row_dict, table_schema, format_str, FIELD_PRINT_LEN, io_output=io_output)
-        # clear the Temp directory
-        clear_temp_files()
+        for typed_row in plan:
+            row_dict = self._row_to_dict(table_schema, typed_row)
+            # print the row
+            self._print_row(row_dict, table_schema, format_str, FIELD_PRINT_LEN, io_output=io_output)
         print("sorting succeeded", file=io_output)
         return True
 
-    # Using Nested Loop Join
-    def join(self, left: str, right: str, condition: str, io_output=sys.stdout) -> bool:
+    @locks_tables(read=("left", "right"))
+    @in_temp_workspace
+    def join(self, left: str, right: str, condition: str, io_output=sys.stdout, strategy: str = None) -> bool:
         # check if the table exists
         if not self._table_exists(left):
             print(f"Table {left} does not exist!", file=io_output)
@@ -310,6 +428,22 @@ class Relational(BaseEngine):
         if left_field_type != right_field_type:
             print(f"field {left_field} and field {right_field} have different types", file=io_output)
             return True
+        # choose the join strategy unless the user forced one
+        if strategy is None:
+            strategy = self._choose_join_strategy(op, self.catalog.get_row_count(left), self.catalog.get_row_count(right))
+        elif op not in self.join_strategies[strategy]:
+            print(f"{strategy} join does not support the operator {op}", file=io_output)
+            return True
+        # the join pulls the rows of both tables from its input operators
+        if strategy == "hash":
+            join_rows = lambda left_input, right_input: self._hash_join(left, right, left_input, right_input, left_field, right_field)
+        elif strategy == "sort merge":
+            join_rows = lambda left_input, right_input: self._sort_merge_join(left, right, left_input, right_input, left_field, op, right_field)
+        else:
+            join_rows = lambda left_input, right_input: self._nested_loop_join(left, right, left_input, right_input, left_field, op, right_field)
+        plan = self._plan_join(left, right, left_field, op, right_field, strategy, join_rows)
+        if not self._begin_plan(plan):
+            return True
         # joined schema
         joined_schema = []
         for field in left_schema:
@@ -321,38 +455,26 @@ class Relational(BaseEngine):
         format_str = self._get_format_str(joined_schema, FIELD_PRINT_LEN)
         # print the header
         self._print_table_header(joined_schema, format_str, io_output=io_output)
-        # for each chunk in the right table, iterate through all rows in the right table
-        # and output matching rows to console
-        # * we choose right table as the outter table because using the left table as the outter table
-        # * will cause new condition to have reversed operator than the one user specified
-        for right_chunk in self._get_table_chunks(right):
-            with open(right_chunk, "r") as right_c:
-                right_csv_reader = csv.reader(right_c)
-                typed_right_rows = self._read_typed_rows(right_types, right_csv_reader)
-                for typed_right_row in typed_right_rows:
-                    right_field_value = self._get_row_value(right_schema, typed_right_row, right_field)
-                    # convert the condition id=id to id=4 for the left table
-                    new_condition = f"{left_field}{op}{right_field_value}"
-                    # loop through inner table
-                    for left_chunk in self._get_table_chunks(left):
-                        with open(left_chunk, "r") as left_c:
-                            left_csv_reader = csv.reader(left_c)
-                            typed_left_rows = self._read_typed_rows(left_types, left_csv_reader)
-                            for typed_left_row in typed_left_rows:
-                                # check if the row meets the condition
-                                if not self._row_meets_condition(left_schema, typed_left_row, new_condition):
-                                    continue
-                                # print the row
-                                row_dict = {}
-                                for field in left_schema:
-                                    row_dict[f"{left}.{field}"] = self._get_row_value(left_schema, typed_left_row, field)
-                                for field in right_schema:
-                                    row_dict[f"{right}.{field}"] = self._get_row_value(right_schema, typed_right_row, field)
-                                self._print_row(row_dict, joined_schema, format_str, FIELD_PRINT_LEN, io_output=io_output)
+        for typed_left_row, typed_right_row in plan:
+            # print the row
+            row_dict = {}
+            for field in left_schema:
+                row_dict[f"{left}.{field}"] = self._get_row_value(left_schema, typed_left_row, field)
+            for field in right_schema:
+                row_dict[f"{right}.{field}"] = self._get_row_value(right_schema, typed_right_row, field)
+            self._print_row(row_dict, joined_schema, format_str, FIELD_PRINT_LEN, io_output=io_output)
         print("join succeeded", file=io_output)
         return True
 
     def aggregate(self, table_name, aggregate_method, aggregate_field, group_by_field, io_output=sys.stdout) -> bool:
+        return self.multi_aggregate(table_name, [(aggregate_method, aggregate_field, None)], group_by_field, io_output=io_output)
+
+    def aggregate_table(self, table_name, aggregate_method, aggregate_field, io_output=sys.stdout) -> bool:
+        return self.multi_aggregate(table_name, [(aggregate_method, aggregate_field, None)], None, io_output=io_output)
+
+    @locks_tables(read=("table_name",))
+    @in_temp_workspace
+    def multi_aggregate(self, table_name, aggregations, group_by_field, io_output=sys.stdout, condition: str = None) -> bool:
         # check if the table exists
         if not self._table_exists(table_name):
             print(f"Table {table_name} does not exist!", file=io_output)
@@ -360,77 +482,68 @@ class Relational(BaseEngine):
         table_schema = self._get_table_schema(table_name)
         table_types = self._get_table_types(table_name)
         # check if the fields are in the table schema
-        if not self._field_exists_in_schema(table_schema, group_by_field):
+        if group_by_field is not None and not self._field_exists_in_schema(table_schema, group_by_field):
             print(f"Field {group_by_field} does not exist.", file=io_output)
             return True
-        if not self._field_exists_in_schema(table_schema, aggregate_field):
-            print(f"Field {aggregate_field} does not exist.", file=io_output)
-            return True
-        # sort the table by group_by_field
-        temp_sorted_file = self._external_sort(table_name, group_by_field, "asc")
+        for aggregate_method, aggregate_field, _ in aggregations:
+            if aggregate_field == "*" and aggregate_method == "count":
+                continue
+            if not self._field_exists_in_schema(table_schema, aggregate_field):
+                print(f"Field {aggregate_field} does not exist.", file=io_output)
+                return True
+            if aggregate_method in NUMERIC_METHODS and self._get_field_type_from_types(table_schema, table_types, aggregate_field) == str:
+                print(f"{aggregate_method} needs a numeric field, {aggregate_field} is a string field.", file=io_output)
+                return True
+        # only the rows meeting the condition are aggregated
+        predicate = None
+        if condition is not None:
+            predicate = self._compile_condition(table_name, condition, io_output)
+            if predicate is None:
+                return True
         # output schema
-        output_schema = (group_by_field, f"{aggregate_method}({aggregate_field})")
+        labels = tuple(self.aggregation_label(aggregation) for aggregation in aggregations)
+        output_schema = (group_by_field,) + labels if group_by_field is not None else labels
+        workers = self._scan_workers(table_name, predicate)
+        batches = None
+        if group_by_field is None:
+            batches = self._plan_batches(table_name, predicate, [field for _, field, _ in aggregations if field != "*"])
+        if workers > 1 and group_by_field is None:
+            # every worker aggregates a chunk into partial accumulators, which are merged
+            plan = self._plan_parallel_aggregate(table_name, predicate, labels, aggregations, workers, batches)
+        elif workers > 1:
+            # every worker aggregates the groups of a chunk, the partial groups are merged
+            plan = self._plan_parallel_groups(table_name, predicate, group_by_field, labels, aggregations, workers)
+        elif batches is not None:
+            # compute all aggregations over the column arrays of a chunk at a time
+            plan = Aggregate(batches, labels, lambda batches: self._aggregate_batches(table_schema, batches, aggregations))
+        elif group_by_field is None:
+            # compute all aggregations over the rows in one pass
+            plan = Aggregate(self._plan_rows(table_name, predicate), labels, lambda rows: self._aggregate_rows(table_schema, rows, aggregations))
+        else:
+            # aggregate every group with a hash aggregation and output the results in group order
+            typed_rows = self._plan_rows(table_name, predicate)
+            plan = HashAggregate(typed_rows, group_by_field, labels, lambda rows: self._hash_aggregate(table_name, rows, group_by_field, aggregations))
+        if not self._begin_plan(plan):
+            return True
         # get the format string for printing
         format_str = self._get_format_str(output_schema, FIELD_PRINT_LEN)
         # print the header
         self._print_table_header(output_schema, format_str, io_output=io_output)
-        # iterate through the sorted table and output the aggregate result
-        with open(temp_sorted_file, "r") as f:
-            csv_reader = csv.reader(f)
-            typed_row = self._next_typed_row(table_types, csv_reader)
-            cur_group_result = None
-            pre_group_by_field_value = None
-            while typed_row is not None:
-                # get the group_by_field value of the current typed row
-                cur_group_by_field_value = self._get_row_value(table_schema, typed_row, group_by_field)
-                # if the group_by_field value changes, output the aggregate result of the previous group
-                if cur_group_by_field_value != pre_group_by_field_value and pre_group_by_field_value is not None:
-                    if cur_group_result is not None and aggregate_method == "avg":
-                        cur_group_result = round(cur_group_result[0] / cur_group_result[1], 2)
-                    if cur_group_result is None:
-                        cur_group_result = "0"
-                    self._print_row({group_by_field: pre_group_by_field_value, f"{aggregate_method}({aggregate_field})": str(cur_group_result)}, output_schema, format_str, FIELD_PRINT_LEN, io_output=io_output)
-                    # reset the aggregate result
-                    cur_group_result = None
-                # if the current row is in the same group as the previous row, update the aggregate result
-                cur_aggregate_field_value = self._get_row_value(table_schema, typed_row, aggregate_field)
-                if aggregate_method == "sum":
-                    if cur_group_result is None:
-                        cur_group_result = 0
-                    cur_group_result += cur_aggregate_field_value
-                elif aggregate_method == "avg":
-                    if cur_group_result is None:
-                        cur_group_result = [0, 0]
-                    cur_group_result[0] += cur_aggregate_field_value
-                    cur_group_result[1] += 1
-                elif aggregate_method == "count":
-                    if cur_group_result is None:
-                        cur_group_result = 0
-                    cur_group_result += 1
-                elif aggregate_method == "max":
-                    if cur_group_result is None:
-                        cur_group_result = cur_aggregate_field_value
-                    cur_group_result = max(cur_group_result, cur_aggregate_field_value)
-                elif aggregate_method == "min":
-                    if cur_group_result is None:
-                        cur_group_result = cur_aggregate_field_value
-                    cur_group_result = min(cur_group_result, cur_aggregate_field_value)
-                # get the next row
-                typed_row = self._next_typed_row(table_types, csv_reader)
-                # update the prev_group_by_field_value
-                pre_group_by_field_value = cur_group_by_field_value
-            # output the aggregate result of the last group
-            if typed_row is None and pre_group_by_field_value is not None:
-                if cur_group_result is not None and aggregate_method == "avg":
-                    cur_group_result = round(cur_group_result[0] / cur_group_result[1], 2)
-                if cur_group_result is None:
-                    cur_group_result = "0"
-                self._print_row({group_by_field: pre_group_by_field_value, f"{aggregate_method}({aggregate_field})": str(cur_group_result)}, output_schema, format_str, FIELD_PRINT_LEN, io_output=io_output)
-        clear_temp_files()
+        if group_by_field is None:
+            for results in plan:
+                row_dict = dict(zip(labels, results))
+                self._print_row(row_dict, output_schema, format_str, FIELD_PRINT_LEN, io_output=io_output)
+        else:
+            for group_value, group_results in plan:
+                row_dict = dict(zip(labels, group_results))
+                row_dict[group_by_field] = group_value
+                self._print_row(row_dict, output_schema, format_str, FIELD_PRINT_LEN, io_output=io_output)
         print("aggregate succeeded", file=io_output)
         return True
 
-    def aggregate_table(self, table_name, aggregate_method, aggregate_field, io_output=sys.stdout) -> bool:
+    @locks_tables(read=("table_name",))
+    @in_temp_workspace
+    def group(self, table_name, group_by_field, io_output=sys.stdout, condition: str = None) -> bool:
         # check if the table exists
         if not self._table_exists(table_name):
             print(f"Table {table_name} does not exist!", file=io_output)
@@ -438,91 +551,134 @@ class Relational(BaseEngine):
         table_schema = self._get_table_schema(table_name)
         table_types = self._get_table_types(table_name)
         # check if the fields are in the table schema
-        if not self._field_exists_in_schema(table_schema, aggregate_field):
-            print(f"Field {aggregate_field} does not exist.", file=io_output)
+        if not self._field_exists_in_schema(table_schema, group_by_field):
+            print(f"Field {group_by_field} does not exist.", file=io_output)
+            return True
+        # only the rows meeting the condition are grouped
+        predicate = None
+        if condition is not None:
+            predicate = self._compile_condition(table_name, condition, io_output)
+            if predicate is None:
+                return True
+        workers = self._scan_workers(table_name, predicate)
+        if workers > 1:
+            # every worker finds the groups of a chunk, the partial groups are merged
+            plan = self._plan_parallel_groups(table_name, predicate, group_by_field, (), (), workers)
+        else:
+            # find the groups with a hash aggregation and output them in group order
+            plan = HashAggregate(self._plan_rows(table_name, predicate), group_by_field, (), lambda rows: self._hash_aggregate(table_name, rows, group_by_field))
+        if not self._begin_plan(plan):
             return True
         # output schema
-        output_schema = (f"{aggregate_method}({aggregate_field})",)
+        output_schema = (group_by_field,)
         # get the format string for printing
         format_str = self._get_format_str(output_schema, FIELD_PRINT_LEN)
         # print the header
         self._print_table_header(output_schema, format_str, io_output=io_output)
-        # iterate through all chunks and output the aggregate result
-        cur_result = None
-        for chunk in self._get_table_chunks(table_name):
-            with open(chunk, "r") as c:
-                csv_reader = csv.reader(c)
-                typed_rows = self._read_typed_rows(table_types, csv_reader)
-                for typed_row in typed_rows:
-                    # get the aggregate_field value
-                    cur_aggregate_field_value = self._get_row_value(table_schema, typed_row, aggregate_field)
-                    if aggregate_method == "sum":
-                        if cur_result is None:
-                            cur_result = 0
-                        cur_result += cur_aggregate_field_value
-                    elif aggregate_method == "avg":
-                        if cur_result is None:
-                            cur_result = (0, 0)
-                        cur_result = (cur_result[0] + cur_aggregate_field_value, cur_result[1] + 1)
-                    elif aggregate_method == "count":
-                        if cur_result is None:
-                            cur_result = 0
-                        cur_result += 1
-                    elif aggregate_method == "max":
-                        if cur_result is None:
-                            cur_result = cur_aggregate_field_value
-                        cur_result = max(cur_result, cur_aggregate_field_value)
-                    elif aggregate_method == "min":
-                        if cur_result is None:
-                            cur_result = cur_aggregate_field_value
-                        cur_result = min(cur_result, cur_aggregate_field_value)
-        if aggregate_method == "avg" and cur_result is not None:
-            cur_result = round(cur_result[0] / cur_result[1], 2)
-        if cur_result is None:
-            cur_result = "0"
-        self._print_row({f"{aggregate_method}({aggregate_field})": str(cur_result)}, output_schema, format_str, FIELD_PRINT_LEN, io_output=io_output)
-        print("aggregate succeeded", file=io_output)
+        for group_value, _ in plan:
+            self._print_row({group_by_field: group_value}, output_schema, format_str, FIELD_PRINT_LEN, io_output=io_output)
+        print("group succeeded", file=io_output)
         return True
 
-    def group(self, table_name, group_by_field, io_output=sys.stdout) -> bool:
+    @locks_tables(write=("table_name",))
+    def set_chunk_size(self, table_name: str, chunk_size: int or None, chunk_bytes: int or None, io_output=sys.stdout) -> bool:
         # check if the table exists
         if not self._table_exists(table_name):
             print(f"Table {table_name} does not exist!", file=io_output)
             return True
-        table_schema = self._get_table_schema(table_name)
-        table_types = self._get_table_types(table_name)
-        # check if the fields are in the table schema
-        if not self._field_exists_in_schema(table_schema, group_by_field):
-            print(f"Field {group_by_field} does not exist.", file=io_output)
+        # new chunks follow the new limits, existing chunks are rewritten by compact table
+        self.catalog.set_chunk_limits(table_name, chunk_size, chunk_bytes)
+        print("chunk size updated", file=io_output)
+        return True
+
+    @locks_tables(write=("table_name",))
+    def compact_table(self, table_name: str, io_output=sys.stdout) -> bool:
+        # check if the table exists
+        if not self._table_exists(table_name):
+            print(f"Table {table_name} does not exist!", file=io_output)
             return True
-        # sort the table by group_by_field
-        temp_sorted_file = self._external_sort(table_name, group_by_field, "asc")
-        # output schema
-        output_schema = (group_by_field,)
-        # get the format string for printing
-        format_str = self._get_format_str(output_schema, FIELD_PRINT_LEN)
-        # print the header
-        self._print_table_header(output_schema, format_str, io_output=io_output)
-        # iterate through the sorted table and output the aggregate result
-        with open(temp_sorted_file, "r") as f:
-            csv_reader = csv.reader(f)
-            typed_row = self._next_typed_row(table_types, csv_reader)
-            pre_group_by_field_value = None
-            while typed_row is not None:
-                # get the group_by_field value of the current typed row
-                cur_group_by_field_value = self._get_row_value(table_schema, typed_row, group_by_field)
-                # if the group_by_field value changes, output the aggregate result of the previous group
-                if cur_group_by_field_value != pre_group_by_field_value and pre_group_by_field_value is not None:
-                    self._print_row({group_by_field: pre_group_by_field_value}, output_schema, format_str, FIELD_PRINT_LEN, io_output=io_output)
-                # get the next row
-                typed_row = self._next_typed_row(table_types, csv_reader)
-                # update the prev_group_by_field_value
-                pre_group_by_field_value = cur_group_by_field_value
-            # output the aggregate result of the last group
-            if typed_row is None and pre_group_by_field_value is not None:
-                self._print_row({group_by_field: pre_group_by_field_value}, output_schema, format_str, FIELD_PRINT_LEN, io_output=io_output)
-        clear_temp_files()
-        print("group succeeded", file=io_output)
+        old_chunks = self._get_table_chunks(table_name)
+        new_chunks = self._rewrite_chunks(table_name, old_chunks, self.catalog.get_format(table_name), io_output)
+        print(f"compacted {len(old_chunks)} chunks into {new_chunks} chunks", file=io_output)
+        print("compaction succeeded", file=io_output)
+        return True
+
+    @locks_tables(write=("table_name",))
+    def set_format(self, table_name: str, chunk_format: str, io_output=sys.stdout) -> bool:
+        # check if the table exists
+        if not self._table_exists(table_name):
+            print(f"Table {table_name} does not exist!", file=io_output)
+            return True
+        if chunk_format not in CHUNK_FORMATS:
+            print(f"Unknown chunk format {chunk_format}, the formats are {', '.join(CHUNK_FORMATS)}", file=io_output)
+            return True
+        if (self.catalog.get_format(table_name) or "csv") == chunk_format:
+            print(f"Table {table_name} is already stored as {chunk_format}", file=io_output)
+            return True
+        # rewrite every chunk in the new format so a table never mixes formats
+        self._rewrite_chunks(table_name, self._get_table_chunks(table_name), chunk_format, io_output)
+        print("format updated", file=io_output)
+        return True
+
+    # rewrite the rows of the old chunks into full chunks of the current limits in the chunk format
+    # and return the number of new chunks
+    def _rewrite_chunks(self, table_name: str, old_chunks: list, chunk_format: str or None, io_output=sys.stdout) -> int:
+        # write the new chunks after the old ones, the old chunks are read while writing and
+        # stay the chunks of the table until the new ones are written
+        first_chunk_num = self.catalog.get_max_chunk(table_name) + 1
+        chunk_rows = {}
+        zones = {}
+        index_entries = {field: [] for field in self.catalog.get_indexes(table_name)}
+        try:
+            self._write_rows_to_chunks(table_name, self._read_raw_rows(old_chunks), first_chunk_num, 0, chunk_format, False, chunk_rows, zones, {}, index_entries, io_output)
+        except BaseException:
+            # the table keeps its old chunks, remove the new ones
+            for chunk_num in range(first_chunk_num, max(chunk_rows, default=first_chunk_num) + 1):
+                chunk_path = self.catalog.get_format_chunk_path(table_name, chunk_num, chunk_format)
+                if os.path.exists(chunk_path):
+                    os.remove(chunk_path)
+            raise
+        # swap the new chunks (and their format) in with one manifest write, then remove the old ones
+        self.catalog.replace_chunks(table_name, chunk_rows, zones, chunk_format)
+        for chunk in old_chunks:
+            os.remove(chunk)
+        # the rows moved to other chunks
+        for field, entries in index_entries.items():
+            self.indexes.create(table_name, field, entries)
+        return len(chunk_rows)
+
+    @locks_tables(write=("table_name",))
+    def create_index(self, table_name: str, field: str, io_output=sys.stdout) -> bool:
+        # check if the table exists
+        if not self._table_exists(table_name):
+            print(f"Table {table_name} does not exist!", file=io_output)
+            return True
+        # check if the field is in the table schema
+        if not self._field_exists_in_schema(self._get_table_schema(table_name), field):
+            print(f"Field {field} does not exist.", file=io_output)
+            return True
+        index_fields = self.catalog.get_indexes(table_name)
+        if field in index_fields:
+            print(f"Index on {field} already exists!", file=io_output)
+            return True
+        self._build_index(table_name, field)
+        self.catalog.set_indexes(table_name, index_fields + [field])
+        print("index created", file=io_output)
+        return True
+
+    @locks_tables(write=("table_name",))
+    def drop_index(self, table_name: str, field: str, io_output=sys.stdout) -> bool:
+        # check if the table exists
+        if not self._table_exists(table_name):
+            print(f"Table {table_name} does not exist!", file=io_output)
+            return True
+        index_fields = self.catalog.get_indexes(table_name)
+        if field not in index_fields:
+            print(f"Index on {field} does not exist!", file=io_output)
+            return True
+        self.catalog.set_indexes(table_name, [index_field for index_field in index_fields if index_field != field])
+        self.indexes.drop(table_name, field)
+        print("index dropped", file=io_output)
         return True
 
     # ========================================================
@@ -531,29 +687,25 @@ class Relational(BaseEngine):
     #                   For value typping 
     # ========================================================
 
-    # refrence the types of the table based on this row and write the types to the schema.txt
+    # refrence the types of the table based on this row and record the types in the catalog
     def _type_reference_from_row(self, table_name: str, row: list) -> None:
-        schema_path = f"{BASE_DIR}/Storage/Relational/{table_name}/schema.txt"
         schema = self._get_table_schema(table_name)
         # check if row has the same number of fields as the schema
         if len(row) != len(schema):
             raise Exception(f"row does not match the schema")
-        # generate a tuple of types based on the row values
+        # generate a list of type names based on the row values
         types = []
         for field in schema:
             field_index = schema.index(field)
             field_value = row[field_index]
             if field_value.isdigit():
-                types.append(int)
+                types.append("int")
             elif field_value.replace('.', '', 1).isdigit():
-                types.append(float)
+                types.append("float")
             else:
-                types.append(str)
-        types = tuple(types)
-        # write the types to the schema.txt
-        with open(schema_path, "a") as f:
-            csv_writer = csv.writer(f)
-            csv_writer.writerow(types)
+                types.append("str")
+        # record the types in the manifest
+        self.catalog.set_types(table_name, types)
     
     # convert the value to the type
     def _convert_to_type(self, value: str, type: type) -> int or float or str:
@@ -575,26 +727,30 @@ class Relational(BaseEngine):
         return types[schema.index(field)]
     
     def _convert_row_to_typed_row(self, types: tuple, row: list) -> list:
-        typed_row = []
-        for i in range(len(row)):
-            field_value = row[i]
-            field_type = types[i]
-            typed_row.append(self._convert_to_type(field_value, field_type))
-        return typed_row
-    
-    def _next_typed_row(self, types: tuple, reader: csv.reader) -> list or None:
-        row = next(reader, None)
-        if row is None:
-            return None
-        return self._convert_row_to_typed_row(types, row)
+        # str values are kept as they are
+        return [field_value if field_type == str else self._convert_to_type(field_value, field_type) for field_value, field_type in zip(row, types)]
     
-    def _read_typed_rows(self, types: tuple, reader: csv.reader) -> list:
-        rows = []
-        row = next(reader, None)
-        while row is not None:
-            rows.append(self._convert_row_to_typed_row(types, row))
-            row = next(reader, None)
-        return rows
+    # yield the typed rows of a chunk of either format
+    def _scan_chunk(self, chunk_path: str, types: tuple):
+        if chunk_path.endswith(COLUMNAR_SUFFIX):
+            yield from ColumnarChunk(chunk_path).read_rows()
+        else:
+            yield from self._scan_typed_file(chunk_path, types)
+
+    # yield the typed rows of a csv file
+    def _scan_typed_file(self, file_path: str, types: tuple):
+        with ChunkReader(file_path) as reader:
+            for row in csv.reader(reader.lines()):
+                yield self._convert_row_to_typed_row(types, row)
+
+    # yield the untyped rows of the chunks in order, columnar chunks are stored typed
+    def _read_raw_rows(self, chunks: list):
+        for chunk in chunks:
+            if chunk.endswith(COLUMNAR_SUFFIX):
+                yield from ColumnarChunk(chunk).read_rows()
+                continue
+            with ChunkReader(chunk) as reader:
+                yield from csv.reader(reader.lines())
 
     # ========================================================
     #                  ***** Helpers *****
@@ -613,53 +769,29 @@ class Relational(BaseEngine):
         
     # return a tuple of field names
     def _get_table_schema(self, table_name: str) -> tuple:
-        schema_path = f"{BASE_DIR}/Storage/Relational/{table_name}/schema.txt"
-        with open(schema_path, "r") as f:
-            csv_reader = csv.reader(f)
-            schema = next(csv_reader)
-        return tuple(schema)
+        return self.catalog.get_schema(table_name)
     
     # return a tuple of types of the table
     def _get_table_types(self, table_name: str) -> tuple:
-        schema_path = f"{BASE_DIR}/Storage/Relational/{table_name}/schema.txt"
-        with open(schema_path, "r") as f:
-            csv_reader = csv.reader(f)
-            schema = next(csv_reader, [])
-            types = next(csv_reader, [])
-        if len(schema) != len(types):
-            # get first row in chunk_0.csv
-            table_storage_path = self._get_table_path(table_name)
-            chunk_path = f"{table_storage_path}/chunk_0.csv"
-            with open(chunk_path, "r") as f:
-                csv_reader = csv.reader(f)
-                row = next(csv_reader, None)
+        types = self.catalog.get_types(table_name)
+        if types is None:
+            # get first row in the first chunk
+            chunks = self._get_table_chunks(table_name)
+            row = None
+            if len(chunks) > 0:
+                row = next(self._read_raw_rows(chunks[:1]), None)
             if row is None:
                 raise Exception(f"Table {table_name} is empty, cannot get types")
             # reference types from the first row
             self._type_reference_from_row(table_name, row)
-            # get the types again
-            with open(schema_path, "r") as f:
-                csv_reader = csv.reader(f)
-                schema = next(csv_reader, [])
-                types = next(csv_reader, [])
+            types = self.catalog.get_types(table_name)
         # deserialize the types to type objects
-        for i in range(len(types)):
-            if types[i] == "<class 'int'>":
-                types[i] = int
-            elif types[i] == "<class 'float'>":
-                types[i] = float
-            else:
-                types[i] = str
-        return tuple(types)
+        type_dict = {"int": int, "float": float, "str": str}
+        return tuple(type_dict.get(type_name, str) for type_name in types)
     
-    # return a list of chunk paths
+    # return a list of chunk paths ordered by chunk number
     def _get_table_chunks(self, table_name: str) -> list:
-        table_storage_path = self._get_table_path(table_name)
-        chunks = []
-        for file in os.listdir(table_storage_path):
-            if file.endswith(".csv"):
-                chunks.append(f"{table_storage_path}/{file}")
-        return chunks
+        return [self.catalog.get_chunk_path(table_name, chunk_num) for chunk_num in self.catalog.get_chunk_numbers(table_name)]
     
     def _check_if_field_exists_in_table(self, table_name: str, field: str) -> None:
         table_schema = self._get_table_schema(table_name)
@@ -708,75 +840,324 @@ class Relational(BaseEngine):
     # Assumption: 
     # - the row is valid and matches the schema
     # - the table exists
-    def _insert_row(self, table_name: str, row: list) -> None:
-        table_storage_path = self._get_table_path(table_name)
-        # iterate through all chunks in this directory and find the chunk_num with max num
-        max_chunk_num = -1
-        for chunk in self._get_table_chunks(table_name):
-            chunk_num = self._get_chunk_number(chunk)
-            if chunk_num > max_chunk_num:
-                max_chunk_num = chunk_num
-        # If the max_chunk_num is -1, there is no chunk already created. Create a new chunk.
-        if max_chunk_num == -1:
-            # create a new csv chunk
-            with open(f"{table_storage_path}/chunk_0.csv", "w") as f:
-                csv_writer = csv.writer(f)
-                csv_writer.writerow(row)
-                # reference types from the first row
-                self._type_reference_from_row(table_name, row)
-                # print a warning message
-                warning_msg = """
+    def _insert_row(self, table_name: str, row: list, io_output=sys.stdout) -> None:
+        self._bulk_insert_rows(table_name, [row], io_output)
+
+    # append an iterable of rows to the table and return the number of rows written
+    # the current chunk and its row count are tracked in memory and the
+    # catalog is updated once at the end
+    # Assumption: 
+    # - the rows are valid and match the schema
+    # - the table exists
+    def _bulk_insert_rows(self, table_name: str, rows, io_output=sys.stdout) -> int:
+        # the last chunk and its row count come from the catalog
+        max_chunk_num = self.catalog.get_max_chunk(table_name)
+        chunk_rows = {}
+        zones = {}
+        chunk_formats = {}
+        index_entries = {field: [] for field in self.catalog.get_indexes(table_name)}
+        try:
+            return self._write_rows_to_chunks(table_name, rows, max(max_chunk_num, 0), self.catalog.get_chunk_rows(table_name, max_chunk_num), self.catalog.get_format(table_name), True, chunk_rows, zones, chunk_formats, index_entries, io_output)
+        finally:
+            # record the new row counts, zone maps and chunk formats in the catalog and the new rows in the indexes
+            if len(chunk_rows) > 0:
+                old_chunk_paths = {chunk_num: self.catalog.get_chunk_path(table_name, chunk_num) for chunk_num in chunk_formats}
+                self.catalog.set_chunk_rows(table_name, chunk_rows, zones, chunk_formats)
+                # the row tails written again as columnar chunks
+                for chunk_num, old_chunk_path in old_chunk_paths.items():
+                    if old_chunk_path != self.catalog.get_chunk_path(table_name, chunk_num) and os.path.exists(old_chunk_path):
+                        os.remove(old_chunk_path)
+            for field, entries in index_entries.items():
+                self.indexes.add_entries(table_name, field, entries)
+
+    # write the rows to the chunks of the table in the chunk format from the chunk first_chunk_num,
+    # holding first_chunk_size rows, on and return the number of rows written. The row counts,
+    # zone maps, chunk formats and index entries ({field: [(value, chunk number, row offset)]}) of
+    # the chunks are added to chunk_rows, zones, chunk_formats and index_entries as the rows are
+    # written, the catalog is left to the caller. With row_tail, the rows of a columnar table that
+    # do not fill a chunk are kept in a csv chunk (the row tail) that later rows are appended to
+    def _write_rows_to_chunks(self, table_name: str, rows, first_chunk_num: int, first_chunk_size: int, chunk_format: str or None, row_tail: bool, chunk_rows: dict, zones: dict, chunk_formats: dict, index_entries: dict, io_output=sys.stdout) -> int:
+        # a table without chunks gets its types from its first row
+        reference_types = self.catalog.get_max_chunk(table_name) == -1
+        cur_chunk_num = first_chunk_num
+        cur_chunk_size = first_chunk_size
+        # columnar chunks are written whole: the rows of the current chunk are buffered
+        # and the chunk is written once it is full or the rows run out
+        columnar = chunk_format == "columnar"
+        chunk_buffer = None
+        if columnar and cur_chunk_size > 0 and self.catalog.get_chunk_format(table_name, cur_chunk_num) == "columnar":
+            # a partially filled columnar chunk is not rewritten for the new rows, they start
+            # a new chunk (compaction merges the partial chunks)
+            cur_chunk_num += 1
+            cur_chunk_size = 0
+        max_chunk_size, max_chunk_bytes = self.catalog.get_chunk_limits(table_name)
+        cur_chunk_bytes = 0
+        if max_chunk_bytes is not None and cur_chunk_size > 0:
+            cur_chunk_bytes = os.path.getsize(self.catalog.get_chunk_path(table_name, cur_chunk_num))
+        row_count = 0
+        opened_file = None
+        # the new rows of the current chunk and its row count before them, for its zone map
+        zone_rows = []
+        zone_start_size = cur_chunk_size
+        table_schema = self._get_table_schema(table_name)
+        index_fields = list(index_entries)
+        table_types = None
+        # rows are formatted into line_buffer first so that the bytes of each chunk are known
+        line_buffer = io.StringIO()
+        csv_writer = csv.writer(line_buffer)
+        try:
+            for row in rows:
+                if reference_types and row_count == 0:
+                    # reference types from the first row
+                    self._type_reference_from_row(table_name, row)
+                    # print a warning message
+                    warning_msg = """
 *** Warning: The types of the table are referenced from 
 *** the first row of the table. The first row cannot 
 *** contain empty values
 """
-                print(warning_msg)
-        else:
-            # check if the last chunk is full
-            with open(f"{table_storage_path}/chunk_{max_chunk_num}.csv", "r") as f:
-                csv_reader = csv.reader(f)
-                rows = list(csv_reader)
-                if len(rows) < CHUNK_SIZE:
-                    # last chunk is not full -> append to the last chunk
-                    with open(f"{table_storage_path}/chunk_{max_chunk_num}.csv", "a") as f:
-                        csv_writer = csv.writer(f)
-                        csv_writer.writerow(row)
-                else:
-                    # lcat chunk is full -> create a new chunk
-                    with open(f"{table_storage_path}/chunk_{max_chunk_num + 1}.csv", "w") as f:
-                        csv_writer = csv.writer(f)
-                        csv_writer.writerow(row)
-        
-    def _row_meets_condition(self, schema, typed_row, condition):
-        # !!! issue: only support one condition
-        match = re.match(r"(.*?)\s*(!=|=|>=|<=|>|<)\s*(.*)", condition)
-        field, op, value = match.groups()
-
-        field_type = type(self._get_row_value(schema, typed_row, field))
-        value = self._convert_to_type(value, field_type)
-
-        # get the operator function
-        ops = {
-            "=": operator.eq,
-            "!=": operator.ne,
-            ">": operator.gt,
-            "<": operator.lt,
-            ">=": operator.ge,
-            "<=": operator.le,
-        }
-        op_func = ops.get(op)
-
-        # check if the operator is valid
-        if not op_func:
-            raise Exception(f"Invalid operator {op}")
+                    print(warning_msg, file=io_output)
+                if self._chunk_is_full(cur_chunk_size, cur_chunk_bytes, max_chunk_size, max_chunk_bytes):
+                    # current chunk is full -> move on to a new chunk
+                    if opened_file is not None:
+                        opened_file.close()
+                        opened_file = None
+                    if columnar and (chunk_buffer is not None or zone_start_size > 0):
+                        # the full chunk (with its row tail) is written as a columnar chunk
+                        chunk_formats[cur_chunk_num] = self._write_chunk_buffer(table_name, cur_chunk_num, zone_start_size, chunk_buffer or [], True)
+                        chunk_buffer = None
+                    zones[cur_chunk_num] = self._chunk_zone_with_rows(table_name, cur_chunk_num, zone_start_size, zone_rows)
+                    zone_rows = []
+                    zone_start_size = 0
+                    cur_chunk_num += 1
+                    cur_chunk_size = 0
+                    cur_chunk_bytes = 0
+                if columnar:
+                    if chunk_buffer is None:
+                        chunk_buffer = []
+                    chunk_buffer.append(row)
+                elif opened_file is None:
+                    # append to a partially filled chunk, otherwise start a new one
+                    mode = "a" if cur_chunk_size > 0 else "w"
+                    opened_file = open(self.catalog.get_format_chunk_path(table_name, cur_chunk_num, chunk_format), mode, buffering=1 << 16)
+                line = ""
+                if not columnar or max_chunk_bytes is not None:
+                    # the csv line of the row also estimates its size in a columnar chunk
+                    csv_writer.writerow(row)
+                    line = line_buffer.getvalue()
+                    line_buffer.seek(0)
+                    line_buffer.truncate(0)
+                if opened_file is not None:
+                    opened_file.write(line)
+                zone_rows.append(row)
+                if len(index_fields) > 0:
+                    if table_types is None:
+                        table_types = self._get_table_types(table_name)
+                    for field in index_fields:
+                        field_index = table_schema.index(field)
+                        index_entries[field].append((self._convert_to_type(row[field_index], table_types[field_index]), cur_chunk_num, cur_chunk_size))
+                cur_chunk_size += 1
+                cur_chunk_bytes += len(line)
+                chunk_rows[cur_chunk_num] = cur_chunk_size
+                row_count += 1
+        finally:
+            if opened_file is not None:
+                opened_file.close()
+            if chunk_buffer is not None:
+                chunk_formats[cur_chunk_num] = self._write_chunk_buffer(table_name, cur_chunk_num, zone_start_size, chunk_buffer, not row_tail)
+            if len(zone_rows) > 0:
+                zones[cur_chunk_num] = self._chunk_zone_with_rows(table_name, cur_chunk_num, zone_start_size, zone_rows)
+        return row_count
+
+    # write the new rows of a chunk of a columnar table, after the old_rows rows of its row tail:
+    # as a columnar chunk holding the rows of the row tail too, or appended to the row tail
+    # return the chunk format the chunk is stored in
+    def _write_chunk_buffer(self, table_name: str, chunk_num: int, old_rows: int, rows: list, as_columnar: bool) -> str:
+        tail_path = self.catalog.get_format_chunk_path(table_name, chunk_num, None)
+        if as_columnar:
+            if old_rows > 0:
+                with ChunkReader(tail_path) as reader:
+                    rows = list(csv.reader(reader.lines())) + rows
+            self._write_typed_rows(self.catalog.get_format_chunk_path(table_name, chunk_num, "columnar"), rows, self._get_table_types(table_name))
+            return "columnar"
+        with open(tail_path, "a" if old_rows > 0 else "w") as c:
+            csv.writer(c).writerows(rows)
+        return "csv"
+
+    # a chunk is full once it reaches either the row or the byte limit (None means no limit)
+    def _chunk_is_full(self, chunk_size: int, chunk_bytes: int, max_chunk_size: int or None, max_chunk_bytes: int or None) -> bool:
+        if chunk_size == 0:
+            return False
+        if max_chunk_size is not None and chunk_size >= max_chunk_size:
+            return True
+        if max_chunk_bytes is not None and chunk_bytes >= max_chunk_bytes:
+            return True
+        return False
         
-        # get the index of the field
-        field_index = schema.index(field)
-        # get the value of the field
-        typed_row_value = typed_row[field_index]
-        # compare the row_value and value
-        return op_func(typed_row_value, value)
+    # compile the condition into a predicate on the typed rows of the table: the column indexes,
+    # the operator functions and the typed values are resolved once instead of for every row,
+    # and the operands of and/or are ordered by their estimated selectivity
+    # return None (after printing the error) if the condition is invalid
+    def _compile_condition(self, table_name: str, condition: str, io_output=sys.stdout) -> Predicate or None:
+        node = self.parse_condition(condition, io_output)
+        if node is None:
+            return None
+        predicate = self._compile_node(self._get_table_schema(table_name), self._get_table_types(table_name), node, io_output)
+        if predicate is not None:
+            self._reorder_predicate(table_name, predicate)
+        return predicate
+
+    # compile a node of the condition tree, None (after printing the error) if it is invalid
+    def _compile_node(self, schema: tuple, types: tuple, node: tuple, io_output=sys.stdout) -> Predicate or None:
+        if node[0] in ("and", "or"):
+            children = []
+            for child_node in node[1]:
+                child = self._compile_node(schema, types, child_node, io_output)
+                if child is None:
+                    return None
+                children.append(child)
+            return And(children) if node[0] == "and" else Or(children)
+        if node[0] == "not":
+            child = self._compile_node(schema, types, node[1], io_output)
+            return Not(child) if child is not None else None
+        field = node[1]
+        if not self._field_exists_in_schema(schema, field):
+            print(f"Field {field} does not exist.", file=io_output)
+            return None
+        column_index = schema.index(field)
+        field_type = types[column_index]
+        try:
+            if node[0] == "compare":
+                return self._compile_comparison(schema, types, field, node[2], node[3])
+            elif node[0] == "in":
+                return ColumnIn(field, [self._convert_to_type(value, field_type) for value in node[2]], column_index)
+            elif node[0] == "between":
+                return ColumnBetween(field, self._convert_to_type(node[2], field_type), self._convert_to_type(node[3], field_type), column_index)
+        except ValueError:
+            print(f"A value does not match the type of field {field}.", file=io_output)
+            return None
+        # like
+        if field_type != str:
+            print(f"like needs a string field, {field} is not a string field.", file=io_output)
+            return None
+        return ColumnLike(field, node[2], column_index)
+
+    # return the predicate "field op value" with the value string converted to the type of the field
+    def _compile_comparison(self, schema: tuple, types: tuple, field: str, op: str, value: str) -> ColumnComparison:
+        column_index = schema.index(field)
+        return ColumnComparison(field, op, self._convert_to_type(value, types[column_index]), column_index)
     
+    # ========================================================
+    #                  ***** Helpers *****
+    #
+    #                      For indexes
+    # ========================================================
+
+    # build the index of the field from all rows of the table
+    def _build_index(self, table_name: str, field: str) -> None:
+        entries = []
+        chunk_nums = self.catalog.get_chunk_numbers(table_name)
+        if self.catalog.get_row_count(table_name) > 0:
+            field_index = self._get_table_schema(table_name).index(field)
+            table_types = self._get_table_types(table_name)
+            for chunk_num in chunk_nums:
+                for offset, typed_row in enumerate(self._scan_chunk(self.catalog.get_chunk_path(table_name, chunk_num), table_types)):
+                    entries.append((typed_row[field_index], chunk_num, offset))
+        self.indexes.create(table_name, field, entries)
+
+    # replace the index entries of the rewritten chunks ({chunk number: typed rows})
+    def _reindex_chunks(self, table_name: str, chunk_typed_rows: dict) -> None:
+        table_schema = self._get_table_schema(table_name)
+        for field in self.catalog.get_indexes(table_name):
+            field_index = table_schema.index(field)
+            entries = []
+            for chunk_num, typed_rows in chunk_typed_rows.items():
+                for offset, typed_row in enumerate(typed_rows):
+                    entries.append((typed_row[field_index], chunk_num, offset))
+            self.indexes.replace_chunks(table_name, field, set(chunk_typed_rows), entries)
+
+    # yield (chunk number, typed rows) of the chunks that can hold rows meeting the predicate:
+    # the chunks found by an index, or every chunk
+    def _read_candidate_chunks(self, table_name: str, predicate: Predicate):
+        table_types = self._get_table_types(table_name)
+        positions = self._index_lookup(table_name, predicate)
+        chunk_nums = positions.keys() if positions is not None else self._zone_chunks(table_name, predicate)
+        for chunk_num in chunk_nums:
+            yield chunk_num, list(self._scan_chunk(self.catalog.get_chunk_path(table_name, chunk_num), table_types))
+
+    # yield the typed rows that can meet the predicate: the rows found by an index, or the rows
+    # of the chunks whose zone maps do not rule the predicate out
+    def _scan_candidates(self, table_name: str, predicate: Predicate or None):
+        positions = self._index_lookup(table_name, predicate) if predicate is not None else None
+        table_types = self._get_table_types(table_name)
+        if positions is None:
+            for chunk_num in self._zone_chunks(table_name, predicate):
+                yield from self._scan_chunk(self.catalog.get_chunk_path(table_name, chunk_num), table_types)
+            return
+        for chunk_num, offsets in positions.items():
+            yield from self._read_rows_at(self.catalog.get_chunk_path(table_name, chunk_num), offsets, table_types)
+
+    # yield the typed rows at the sorted row offsets of a chunk
+    def _read_rows_at(self, chunk_path: str, offsets: list, types: tuple):
+        if chunk_path.endswith(COLUMNAR_SUFFIX):
+            # only the values at the offsets are read
+            yield from ColumnarChunk(chunk_path).read_rows_at(offsets)
+            return
+        # only the rows at the offsets are parsed
+        with ChunkReader(chunk_path, csv_rows=True) as reader:
+            for row_bytes in reader.rows_at(offsets):
+                row = next(csv.reader(row_bytes.decode().splitlines(True)))
+                yield self._convert_row_to_typed_row(types, row)
+
+    # overwrite the chunk with the typed rows
+    # the rows are written to a temp file renamed over the chunk, so a failed write (e.g. of a
+    # delete or update) leaves the old chunk
+    def _write_typed_rows(self, chunk_path: str, typed_rows: list, types: tuple) -> None:
+        temp_chunk_path = f"{chunk_path}.tmp"
+        if chunk_path.endswith(COLUMNAR_SUFFIX):
+            ColumnarChunk(temp_chunk_path).write(types, typed_rows)
+        else:
+            with open(temp_chunk_path, "w") as c:
+                csv.writer(c).writerows(typed_rows)
+        os.replace(temp_chunk_path, chunk_path)
+
+    # ========================================================
+    #                  ***** Helpers *****
+    #
+    #                     For zone maps
+    # ========================================================
+
+    # return the zone map of the chunk with the rows (strings or typed values) added to its
+    # first old_rows rows, None if the zone map of the old rows is unknown or a value is invalid
+    def _chunk_zone_with_rows(self, table_name: str, chunk_num: int, old_rows: int, rows: list) -> dict or None:
+        zone = None
+        if old_rows > 0:
+            zone = self.catalog.get_zone(table_name, chunk_num)
+            if zone is None:
+                return None
+            zone = copy.deepcopy(zone)
+        zone = ZoneMap(zone)
+        try:
+            self._add_rows_to_zone(zone, self._get_table_schema(table_name), self._get_table_types(table_name), rows)
+        except ValueError:
+            # a value does not match the type of its field, the chunk cannot be skipped
+            return None
+        return zone.to_dict()
+
+    # return the zone map of a chunk holding the typed rows
+    def _zone_of_rows(self, schema: tuple, types: tuple, typed_rows: list) -> dict:
+        zone = ZoneMap()
+        self._add_rows_to_zone(zone, schema, types, typed_rows)
+        return zone.to_dict()
+
+    # add the rows (strings or typed values) to the zone map, empty values are nulls
+    def _add_rows_to_zone(self, zone: ZoneMap, schema: tuple, types: tuple, rows: list) -> None:
+        zone.add_rows(len(rows))
+        if len(rows) == 0:
+            return
+        for field, column_type, values in zip(schema, types, zip(*rows)):
+            zone.add_values(field, to_column(values, column_type), values.count(""))
+
     # ========================================================
     #                  ***** Helpers *****
     #
@@ -785,7 +1166,7 @@ class Relational(BaseEngine):
 
     # for create temporary files name in external sort
     def _temp_file_name(self, chunk_num: int, pass_num: int) -> str:
-        return f"{TEMP_DIR}/chunk_{chunk_num}_pass_{pass_num}.csv"
+        return temp_path(f"chunk_{chunk_num}_pass_{pass_num}.run")
 
     def _get_chunk_number_from_temp_file(self, temp_file_name: str) -> int:
         return int(temp_file_name.split("/")[-1].split(".")[0].split("_")[1])
@@ -793,12 +1174,9 @@ class Relational(BaseEngine):
     def _get_pass_number_from_temp_file(self, temp_file_name: str) -> int:
         return int(temp_file_name.split("/")[-1].split(".")[0].split("_")[3])
     
+    # return the runs of the external sort in the temp workspace of the query
     def _get_temp_chunks(self) -> list:
-        temp_chunks = []
-        for file in os.listdir(TEMP_DIR):
-            if file.endswith(".csv"):
-                temp_chunks.append(f"{TEMP_DIR}/{file}")
-        return temp_chunks
+        return [temp_file for temp_file in temp_files() if temp_file.endswith(".run")]
 
     # ========================================================
     #                  ***** Helpers *****
@@ -806,25 +1184,46 @@ class Relational(BaseEngine):
     #                   For external sort
     # ========================================================
 
-    def _external_sort(self, table_name: str, field: str, order_method: str) -> str:
-        table_schema = self._get_table_schema(table_name)
-        table_types = self._get_table_types(table_name)
-        # sorting phase
-        for chunk in self._get_table_chunks(table_name):
-            with open(chunk, "r") as c:
-                csv_reader = csv.reader(c)
-                typed_rows = self._read_typed_rows(table_types, csv_reader)
-                # sort the current chunk using STD sort
-                cur_sorted_table = sorted(typed_rows, key = lambda typed_row: self._get_row_value(table_schema, typed_row, field), reverse = order_method == "desc")
-            # write the sorted table to the Temp directory
-            chunk_num = self._get_chunk_number(chunk)
-            with open(self._temp_file_name(chunk_num, 0), "w") as c:
-                csv_writer = csv.writer(c)
-                csv_writer.writerows(cur_sorted_table)
-        # merging phase
-        return self._merge_sorted_chunks(field, table_schema, table_types, order_method, 0)
-
-    def _merge_sorted_chunks(self, field, schema, types, order_method, pass_num) -> str:
+    # return the sort key of the typed rows for the sort fields [(field, order_method)]
+    def _row_sort_key(self, schema: tuple, types: tuple, sort_fields: list) -> SortKey:
+        field_indexes = [schema.index(field) for field, _ in sort_fields]
+        encoders = [TYPE_ENCODERS[types[field_index]] for field_index in field_indexes]
+        return SortKey(field_indexes, encoders, [order_method for _, order_method in sort_fields])
+
+    # yield the typed rows sorted on the sort key
+    # the rows are cut into sorted runs written to Temp with a heap of CHUNK_SIZE rows, then
+    # the runs are merged, so at most CHUNK_SIZE rows are in memory at a time. The key of a row
+    # is computed once, the runs keep it with the row
+    def _external_sort_rows(self, typed_rows, sort_key: SortKey):
+        self._sort_rows_to_runs(typed_rows, sort_key)
+        yield from self._merge_sorted_chunks(0)
+
+    # sort the typed rows into the runs of pass 0 in Temp with replacement selection, the runs of
+    # random rows are about 2 * CHUNK_SIZE rows long
+    def _sort_rows_to_runs(self, typed_rows, sort_key: SortKey) -> None:
+        numbered_rows = replacement_selection(((sort_key(typed_row), typed_row) for typed_row in typed_rows), CHUNK_SIZE)
+        write_runs(numbered_rows, lambda run_num: self._temp_file_name(run_num, 0))
+
+    # sort the typed rows of a run and write them with their keys to the run file
+    def _write_sorted_run(self, run: list, sort_key: SortKey, run_file: str) -> None:
+        # sort the current run using STD sort
+        keyed_rows = sorted(zip(map(sort_key, run), run), key=operator.itemgetter(0))
+        # write the sorted run to the Temp directory
+        with RunWriter(run_file) as writer:
+            writer.write_all(keyed_rows)
+
+    # yield the typed rows of the sorted runs (one per chunk) written by the workers, merged
+    def _merge_worker_runs(self, runs):
+        # wait for every run
+        for _ in runs:
+            pass
+        yield from self._merge_sorted_chunks(0)
+
+    # yield the typed rows of the sorted runs of the pass in Temp, merged
+    # while there are more than MERGE_FAN_IN runs, every group of MERGE_FAN_IN runs is merged into
+    # a run of the next pass, the groups of a pass at the same time in worker processes. The last
+    # MERGE_FAN_IN runs (or fewer) are merged straight into the output instead of another file
+    def _merge_sorted_chunks(self, pass_num):
         # find the max chunk number under the Temp directory
         max_chunk_num = -1
         for chunk in self._get_temp_chunks():
@@ -840,56 +1239,492 @@ class Relational(BaseEngine):
             # no data in the Temp directory
             raise Exception("No data in the Temp directory")
 
-        if max_chunk_num == 0:
-            # this is the final run, no need to merge
-            return self._temp_file_name(0, pass_num)
-        
-        next_chunk_num = 0 # the chunk number of the merged file in the next pass
-        start_chunk_num = 0 # the starting chunk of current merge group
-        end_chunk_num = min(start_chunk_num + CHUNK_SIZE, max_chunk_num + 1) # the ending chunk of current merge group
-
-        while start_chunk_num <= max_chunk_num:
-            output_file = self._temp_file_name(next_chunk_num, pass_num + 1)
-            reader_dict = {}
-            loaded_rows = PriorityQueue() # pq of RowElement
-            # open the csv readers for all the chunks in the current merge group
-            opened_files = []
-            for cur_chunk_num in range(start_chunk_num, end_chunk_num):
-                cur_chunk = self._temp_file_name(cur_chunk_num, pass_num)
-                opened_file = open(cur_chunk, "r")
-                opened_files.append(opened_file)
-                reader_dict[cur_chunk_num] = csv.reader(opened_file)
-            # load the first row from each chunk into the heap
-            for cur_chunk_num in range(start_chunk_num, end_chunk_num):
-                csv_reader = reader_dict[cur_chunk_num]
-                typed_row = self._next_typed_row(types, csv_reader)
-                if typed_row is not None:
-                    row_element = RowElement(cur_chunk_num, typed_row, schema.index(field), order_method)
-                    loaded_rows.put(row_element)
-            # output until the heap is empty
-            while not loaded_rows.empty():
-                row_element = loaded_rows.get()
-                typed_row = row_element.row
-                chunk_num = row_element.chunk_num
-                # write the row to the output file
-                with open(output_file, "a") as f:
-                    csv_writer = csv.writer(f)
-                    csv_writer.writerow(typed_row)
-                # load the next row from the same chunk that output the row
-                next_row = self._next_typed_row(types, reader_dict[chunk_num])
-                if next_row is not None:
-                    row_element = RowElement(chunk_num, next_row, schema.index(field), order_method)
-                    loaded_rows.put(row_element)
-            # close all open files
+        run_count = max_chunk_num + 1
+        while run_count > MERGE_FAN_IN:
+            # the runs of a merge group and the run of the next pass it is merged into
+            group_args = []
+            for next_chunk_num, start_chunk_num in enumerate(range(0, run_count, MERGE_FAN_IN)):
+                run_files = [self._temp_file_name(chunk_num, pass_num) for chunk_num in range(start_chunk_num, min(start_chunk_num + MERGE_FAN_IN, run_count))]
+                group_args.append((run_files, self._temp_file_name(next_chunk_num, pass_num + 1)))
+            for _ in map_chunks(self, "_merge_run_group", group_args, task_workers(len(group_args))):
+                pass
+            # proceed to the next pass
+            run_count = len(group_args)
+            pass_num += 1
+        # the keys are dropped from the output
+        run_files = [self._temp_file_name(chunk_num, pass_num) for chunk_num in range(run_count)]
+        yield from map(operator.itemgetter(1), merge_runs(run_files))
+
+    # merge the sorted runs into the output file, the task of a merge group
+    def _merge_run_group(self, run_files: list, output_file: str) -> None:
+        with RunWriter(output_file) as writer:
+            writer.write_all(merge_runs(run_files))
+
+    # ========================================================
+    #                  ***** Helpers *****
+    #
+    #                    For aggregation
+    # ========================================================
+
+    # return one new accumulator per aggregation
+    def _new_accumulators(self, aggregations: list) -> list:
+        return [create_accumulator(aggregation) for aggregation in aggregations]
+
+    # return the row index of the field of every aggregation, None for count(*)
+    def _get_aggregate_indexes(self, schema: tuple, aggregations: list) -> list:
+        return [schema.index(field) if field != "*" else None for _, field, _ in aggregations]
+
+    def _update_accumulators(self, accumulators: list, aggregate_indexes: list, typed_row: list) -> None:
+        for accumulator, aggregate_index in zip(accumulators, aggregate_indexes):
+            accumulator.add(typed_row[aggregate_index] if aggregate_index is not None else None)
+
+    # return the printable results of the accumulators, "0" for no result
+    def _final_results(self, accumulators: list) -> list:
+        results = []
+        for accumulator in accumulators:
+            result = accumulator.result()
+            results.append(str(result) if result is not None else "0")
+        return results
+
+    # yield the results of the aggregations over all typed rows
+    def _aggregate_rows(self, schema: tuple, typed_rows, aggregations: list):
+        accumulators = self._new_accumulators(aggregations)
+        aggregate_indexes = self._get_aggregate_indexes(schema, aggregations)
+        for typed_row in typed_rows:
+            self._update_accumulators(accumulators, aggregate_indexes, typed_row)
+        yield self._final_results(accumulators)
+
+    # yield the results of the aggregations over the batches of a vectorized scan
+    def _aggregate_batches(self, schema: tuple, batches, aggregations: list):
+        accumulators = self._new_accumulators(aggregations)
+        aggregate_indexes = self._get_aggregate_indexes(schema, aggregations)
+        for batch in batches:
+            self._add_batch_to_accumulators(accumulators, aggregate_indexes, batch)
+        yield self._final_results(accumulators)
+
+    def _add_batch_to_accumulators(self, accumulators: list, aggregate_indexes: list, batch: Batch) -> None:
+        for accumulator, aggregate_index in zip(accumulators, aggregate_indexes):
+            # count(*) only counts the selected rows
+            accumulator.add_batch(batch.values(aggregate_index) if aggregate_index is not None else batch.selection)
+
+    # yield the results of the aggregations merged from the partial accumulators of every chunk
+    def _merge_aggregates(self, partials, aggregations: list):
+        accumulators = self._new_accumulators(aggregations)
+        for partial_accumulators in partials:
+            for accumulator, partial_accumulator in zip(accumulators, partial_accumulators):
+                accumulator.merge(partial_accumulator)
+        yield self._final_results(accumulators)
+
+    # yield (group value, aggregate results) for every group in ascending group order, merged
+    # from the partial groups ({group value: accumulators}) of every chunk
+    # if the groups do not fit in HASH_AGG_MEMORY_GROUPS, the rows are aggregated again
+    # by the groups of aggregate_rows(), which spills groups to Temp
+    def _merge_groups(self, partials, aggregations: list, aggregate_rows):
+        groups = {}
+        for partial_groups in partials:
+            for group_value, partial_accumulators in partial_groups.items():
+                accumulators = groups.get(group_value)
+                if accumulators is None:
+                    if len(groups) >= HASH_AGG_MEMORY_GROUPS:
+                        yield from aggregate_rows()
+                        return
+                    groups[group_value] = partial_accumulators
+                    continue
+                for accumulator, partial_accumulator in zip(accumulators, partial_accumulators):
+                    accumulator.merge(partial_accumulator)
+        yield from sorted((group_value, self._final_results(accumulators)) for group_value, accumulators in groups.items())
+
+    # yield (group value, aggregate results) for every group of the typed rows of the table
+    # in ascending group order
+    # the groups are aggregated in a dict during one pass over the rows. Once there are
+    # HASH_AGG_MEMORY_GROUPS groups, rows of new groups are spilled to Temp and
+    # aggregated by sorting, and the two sorted group streams are merged
+    def _hash_aggregate(self, table_name: str, typed_rows, group_by_field: str, aggregations: list = ()):
+        table_schema = self._get_table_schema(table_name)
+        table_types = self._get_table_types(table_name)
+        group_index = table_schema.index(group_by_field)
+        aggregate_indexes = self._get_aggregate_indexes(table_schema, aggregations)
+        groups = {}
+        spill_files = []
+        spill_file = None
+        spill_rows = 0
+        try:
+            for typed_row in typed_rows:
+                group_value = typed_row[group_index]
+                accumulators = groups.get(group_value)
+                if accumulators is None:
+                    if len(groups) >= HASH_AGG_MEMORY_GROUPS:
+                        # no memory for a new group -> spill the row into chunk-sized spill files
+                        if spill_file is None or spill_rows >= CHUNK_SIZE:
+                            if spill_file is not None:
+                                spill_file.close()
+                            spill_files.append(temp_path(f"spill_{len(spill_files)}.part"))
+                            spill_file = open(spill_files[-1], "w", buffering=1 << 16)
+                            spill_writer = csv.writer(spill_file)
+                            spill_rows = 0
+                        spill_writer.writerow(typed_row)
+                        spill_rows += 1
+                        continue
+                    accumulators = groups[group_value] = self._new_accumulators(aggregations)
+                self._update_accumulators(accumulators, aggregate_indexes, typed_row)
+        finally:
+            if spill_file is not None:
+                spill_file.close()
+        in_memory_groups = sorted((group_value, self._final_results(accumulators)) for group_value, accumulators in groups.items())
+        if len(spill_files) == 0:
+            yield from in_memory_groups
+            return
+        # the spilled rows belong to groups that are not in memory
+        try:
+            spilled_rows = itertools.chain.from_iterable(self._scan_typed_file(spill, table_types) for spill in spill_files)
+            sorted_rows = self._external_sort_rows(spilled_rows, self._row_sort_key(table_schema, table_types, [(group_by_field, "asc")]))
+            spilled_groups = self._sort_aggregate(sorted_rows, group_index, aggregations, aggregate_indexes)
+            yield from heapq.merge(in_memory_groups, spilled_groups, key=lambda group: group[0])
+        finally:
+            for spill in spill_files:
+                os.remove(spill)
+
+    # yield (group value, aggregate results) for every group of typed rows sorted on the group field
+    def _sort_aggregate(self, sorted_rows, group_index: int, aggregations: list, aggregate_indexes: list):
+        accumulators = None
+        pre_group_value = None
+        for typed_row in sorted_rows:
+            group_value = typed_row[group_index]
+            # if the group value changes, output the result of the previous group
+            if pre_group_value is None or group_value != pre_group_value:
+                if pre_group_value is not None:
+                    yield pre_group_value, self._final_results(accumulators)
+                accumulators = self._new_accumulators(aggregations)
+            self._update_accumulators(accumulators, aggregate_indexes, typed_row)
+            pre_group_value = group_value
+        # output the result of the last group
+        if pre_group_value is not None:
+            yield pre_group_value, self._final_results(accumulators)
+
+    # ========================================================
+    #                  ***** Helpers *****
+    #
+    #                       For joins
+    # ========================================================
+
+    # yield (typed_left_row, typed_right_row) pairs where left_field op right_field
+    # left_input and right_input are the operators producing the typed rows of the tables
+    def _nested_loop_join(self, left: str, right: str, left_input, right_input, left_field: str, op: str, right_field: str):
+        left_schema = self._get_table_schema(left)
+        left_types = self._get_table_types(left)
+        right_schema = self._get_table_schema(right)
+        # for each row in the right table, iterate through all rows in the left table
+        # and output matching rows
+        # * we choose right table as the outter table because using the left table as the outter table
+        # * will cause new condition to have reversed operator than the one user specified
+        for typed_right_row in right_input:
+            right_field_value = self._get_row_value(right_schema, typed_right_row, right_field)
+            # convert the condition id=id to id=4 for the left table
+            predicate = self._compile_comparison(left_schema, left_types, left_field, op, f"{right_field_value}")
+            # loop through inner table, which is scanned again for every outer row
+            for typed_left_row in left_input:
+                # check if the row meets the condition
+                if predicate(typed_left_row):
+                    yield typed_left_row, typed_right_row
+
+    # yield (typed_left_row, typed_right_row) pairs where left_field = right_field
+    # the smaller table (by row count in the catalog) is loaded into a hash table
+    # and the larger one probes it in a single pass
+    def _hash_join(self, left: str, right: str, left_input, right_input, left_field: str, right_field: str):
+        left_rows = self.catalog.get_row_count(left)
+        right_rows = self.catalog.get_row_count(right)
+        build_is_left = left_rows <= right_rows
+        if build_is_left:
+            build, build_input, build_field, probe, probe_input, probe_field = left, left_input, left_field, right, right_input, right_field
+        else:
+            build, build_input, build_field, probe, probe_input, probe_field = right, right_input, right_field, left, left_input, left_field
+        build_rows = min(left_rows, right_rows)
+        build_index = self._get_table_schema(build).index(build_field)
+        probe_index = self._get_table_schema(probe).index(probe_field)
+        if build_rows > HASH_JOIN_MEMORY_ROWS:
+            # the build side does not fit the memory budget
+            joined_rows = self._grace_hash_join(build, build_input, build_index, probe, probe_input, probe_index, build_rows)
+        else:
+            hash_table = self._build_hash_table(build_input, build_index)
+            joined_rows = self._probe_hash_table(hash_table, probe_input, probe_index)
+        for build_row, probe_row in joined_rows:
+            if build_is_left:
+                yield build_row, probe_row
+            else:
+                yield probe_row, build_row
+
+    # Grace hash join: partition both inputs by the hash of the join key into Temp,
+    # then join each pair of partitions in memory
+    def _grace_hash_join(self, build: str, build_input, build_index: int, probe: str, probe_input, probe_index: int, build_rows: int):
+        num_partitions = build_rows // HASH_JOIN_MEMORY_ROWS + 1
+        build_types = self._get_table_types(build)
+        probe_types = self._get_table_types(probe)
+        build_partitions = self._partition_rows(build_input, build_index, num_partitions, "build")
+        probe_partitions = self._partition_rows(probe_input, probe_index, num_partitions, "probe")
+        try:
+            for build_partition, probe_partition in zip(build_partitions, probe_partitions):
+                hash_table = self._build_hash_table(self._scan_typed_file(build_partition, build_types), build_index)
+                yield from self._probe_hash_table(hash_table, self._scan_typed_file(probe_partition, probe_types), probe_index)
+        finally:
+            for partition in build_partitions + probe_partitions:
+                os.remove(partition)
+
+    def _build_hash_table(self, typed_rows, key_index: int) -> dict:
+        hash_table = {}
+        for typed_row in typed_rows:
+            hash_table.setdefault(typed_row[key_index], []).append(typed_row)
+        return hash_table
+
+    def _probe_hash_table(self, hash_table: dict, typed_rows, key_index: int):
+        for typed_row in typed_rows:
+            for build_row in hash_table.get(typed_row[key_index], ()):
+                yield build_row, typed_row
+
+    # yield (typed_left_row, typed_right_row) pairs where left_field op right_field
+    # both inputs are sorted with the external sort and then merged in a single pass
+    def _sort_merge_join(self, left: str, right: str, left_input, right_input, left_field: str, op: str, right_field: str):
+        if self.catalog.get_row_count(left) == 0 or self.catalog.get_row_count(right) == 0:
+            return
+        left_schema = self._get_table_schema(left)
+        left_types = self._get_table_types(left)
+        left_index = left_schema.index(left_field)
+        right_schema = self._get_table_schema(right)
+        right_types = self._get_table_types(right)
+        right_index = right_schema.index(right_field)
+        # the left rows matching a right row are a prefix of the left table sorted
+        # in descending order for > and >=, and in ascending order otherwise
+        left_order = "desc" if op in (">", ">=") else "asc"
+        left_sorted = temp_path("merge_join_left.part")
+        right_sorted = temp_path("merge_join_right.part")
+        try:
+            self._sort_rows_to_file(left_input, self._row_sort_key(left_schema, left_types, [(left_field, left_order)]), left_sorted)
+            self._sort_rows_to_file(right_input, self._row_sort_key(right_schema, right_types, [(right_field, "asc")]), right_sorted)
+            right_rows = read_run(right_sorted)
+            if op == "=":
+                yield from self._merge_equal_rows(read_run(left_sorted), left_index, right_rows, right_index)
+                return
+            op_func = self.join_ops[op]
+            first_left_row = next(read_run(left_sorted), None)
+            for right_row in right_rows:
+                right_value = right_row[right_index]
+                if not op_func(first_left_row[left_index], right_value):
+                    if op in (">", ">="):
+                        # the right rows only grow, no later right row can match either
+                        break
+                    continue
+                # output the prefix of the sorted left table that meets the condition
+                for left_row in read_run(left_sorted):
+                    if not op_func(left_row[left_index], right_value):
+                        break
+                    yield left_row, right_row
+        finally:
+            for sorted_file in (left_sorted, right_sorted):
+                if os.path.exists(sorted_file):
+                    os.remove(sorted_file)
+
+    # merge two row streams sorted in ascending order on their keys and yield the pairs with equal keys
+    def _merge_equal_rows(self, left_rows, left_index: int, right_rows, right_index: int):
+        left_row = next(left_rows, None)
+        group_key = None
+        group = []
+        for right_row in right_rows:
+            right_value = right_row[right_index]
+            if len(group) == 0 or right_value != group_key:
+                # skip the left rows with smaller keys and collect the group with an equal key
+                while left_row is not None and left_row[left_index] < right_value:
+                    left_row = next(left_rows, None)
+                group_key = right_value
+                group = []
+                while left_row is not None and left_row[left_index] == right_value:
+                    group.append(left_row)
+                    left_row = next(left_rows, None)
+            for group_row in group:
+                yield group_row, right_row
+
+    # sort the typed rows on the sort key into the run file output_file and clear the runs of the sort
+    def _sort_rows_to_file(self, typed_rows, sort_key: SortKey, output_file: str) -> None:
+        with RunWriter(output_file) as writer:
+            writer.write_all(self._external_sort_rows(typed_rows, sort_key))
+        for temp_chunk in self._get_temp_chunks():
+            os.remove(temp_chunk)
+
+    # write the rows into num_partitions files by the hash of the key and return the file paths
+    def _partition_rows(self, typed_rows, key_index: int, num_partitions: int, side: str) -> list:
+        partitions = [temp_path(f"partition_{side}_{i}.part") for i in range(num_partitions)]
+        opened_files = [open(partition, "w", buffering=1 << 16) for partition in partitions]
+        try:
+            csv_writers = [csv.writer(opened_file) for opened_file in opened_files]
+            for typed_row in typed_rows:
+                csv_writers[hash(typed_row[key_index]) % num_partitions].writerow(typed_row)
+        finally:
             for opened_file in opened_files:
                 opened_file.close()
-            # update the start/end_chunk_num and next_chunk_num and proceed to the next merge group
-            start_chunk_num += CHUNK_SIZE
-            end_chunk_num = min(start_chunk_num + CHUNK_SIZE, max_chunk_num + 1)
-            next_chunk_num += 1
-        # proceed to the next pass
-        return self._merge_sorted_chunks(field, schema, types, order_method, pass_num + 1)
-    
+        return partitions
+
+    # ========================================================
+    #                  ***** Helpers *****
+    #
+    #                For vectorized execution
+    # ========================================================
+
+    # return the operators reading the columns of the fields (and of the predicate) of the rows
+    # meeting the predicate a chunk at a time, None if the query runs row by row: vectorized
+    # execution is off or an index can answer the predicate
+    def _plan_batches(self, table_name: str, predicate: Predicate or None, fields: list) -> Operator or None:
+        if not VECTORIZED_EXECUTION:
+            return None
+        if predicate is not None and self._choose_index(table_name, predicate) is not None:
+            return None
+        table_schema = self._get_table_schema(table_name)
+        column_indexes = self._read_column_indexes(table_schema, predicate, fields)
+        fields = [table_schema[column_index] for column_index in column_indexes]
+        chunk_nums = self._zone_chunks(table_name, predicate)
+        rows = sum(self.catalog.get_chunk_rows(table_name, chunk_num) for chunk_num in chunk_nums)
+        scan = ColumnScan(table_name, fields, rows, lambda: self._scan_column_batches(table_name, column_indexes, chunk_nums))
+        scan.detail += self._zone_scan_detail(table_name, chunk_nums)
+        if predicate is None:
+            return scan
+        return self._plan_filter(table_name, predicate, scan)
+
+    # return the sorted column indexes of the fields and of the fields of the predicate
+    def _read_column_indexes(self, schema: tuple, predicate: Predicate or None, fields: list) -> list:
+        fields = set(fields) | (predicate.fields() if predicate is not None else set())
+        return sorted(schema.index(field) for field in fields)
+
+    # yield a Batch per chunk of the table (or of the chunks numbered chunk_nums)
+    # with the typed columns at the column indexes
+    def _scan_column_batches(self, table_name: str, column_indexes: list, chunk_nums: list or None = None):
+        table_types = self._get_table_types(table_name)
+        if chunk_nums is None:
+            chunk_nums = self.catalog.get_chunk_numbers(table_name)
+        for chunk in [self.catalog.get_chunk_path(table_name, chunk_num) for chunk_num in chunk_nums]:
+            batch = self._read_chunk_batch(chunk, table_types, column_indexes)
+            if len(batch) > 0:
+                yield batch
+
+    # return a Batch of the rows of the chunk with the typed columns at the column indexes
+    def _read_chunk_batch(self, chunk_path: str, types: tuple, column_indexes: list) -> Batch:
+        if chunk_path.endswith(COLUMNAR_SUFFIX):
+            # only the bytes of the columns are read, already typed
+            columnar_chunk = ColumnarChunk(chunk_path)
+            if columnar_chunk.row_count() == 0:
+                return Batch({}, range(0))
+            return Batch(columnar_chunk.read_columns(column_indexes), range(columnar_chunk.row_count()))
+        with ChunkReader(chunk_path) as reader:
+            rows = list(csv.reader(reader.lines()))
+        if len(rows) == 0:
+            return Batch({}, range(0))
+        # transpose the rows into columns and only type the columns that are read
+        raw_columns = list(zip(*rows)) if len(column_indexes) > 0 else []
+        columns = {column_index: to_column(raw_columns[column_index], types[column_index]) for column_index in column_indexes}
+        return Batch(columns, range(len(rows)))
+
+    # return the row dicts of the fields (at the column indexes) of the selected rows of a batch
+    def _batch_to_dicts(self, batch: Batch, fields: list, column_indexes: list) -> list:
+        columns = [batch.values(column_index) for column_index in column_indexes]
+        return [dict(zip(fields, values)) for values in zip(*columns)]
+
+    # ========================================================
+    #                  ***** Helpers *****
+    #
+    #                   For parallel scans
+    # ========================================================
+
+    # return the operator merging the partial accumulators of the aggregations computed by the workers
+    # on every chunk, batches is the vectorized plan of a chunk (None to aggregate row by row)
+    def _plan_parallel_aggregate(self, table_name: str, predicate: Predicate or None, labels: tuple, aggregations: list, workers: int, batches: Operator or None) -> Aggregate:
+        table_schema = self._get_table_schema(table_name)
+        aggregate_indexes = self._get_aggregate_indexes(table_schema, aggregations)
+        read_indexes = self._read_column_indexes(table_schema, predicate, [field for _, field, _ in aggregations if field != "*"])
+        chunk_paths = self._gather_chunk_paths(table_name, predicate)
+        worker_plan = PlanNode("Partial Aggregate", ",".join(labels), len(chunk_paths), [batches if batches is not None else self._plan_rows(table_name, predicate)])
+        chunk_args = [(chunk, self._get_table_types(table_name), predicate, aggregations, aggregate_indexes, read_indexes) for chunk in chunk_paths]
+        plan = Aggregate(self._plan_gather(worker_plan, workers, "_aggregate_chunk", chunk_args), labels, lambda partials: self._merge_aggregates(partials, aggregations))
+        plan.operator = "Finalize Aggregate"
+        return plan
+
+    # return the operator merging the partial groups of the aggregations computed by the workers on every chunk
+    def _plan_parallel_groups(self, table_name: str, predicate: Predicate or None, group_by_field: str, labels: tuple, aggregations: list, workers: int) -> HashAggregate:
+        table_schema = self._get_table_schema(table_name)
+        aggregate_indexes = self._get_aggregate_indexes(table_schema, aggregations)
+        worker_plan = PlanNode("Partial Hash Aggregate", f"group by {group_by_field}", None, [self._plan_rows(table_name, predicate)])
+        chunk_args = [(chunk, self._get_table_types(table_name), predicate, table_schema.index(group_by_field), aggregations, aggregate_indexes) for chunk in self._gather_chunk_paths(table_name, predicate)]
+        # too many groups to merge in memory are aggregated again from the rows in this process
+        aggregate_rows = lambda: self._hash_aggregate(table_name, self._filtered_rows(table_name, predicate), group_by_field, aggregations)
+        plan = HashAggregate(self._plan_gather(worker_plan, workers, "_group_chunk", chunk_args, batched=True), group_by_field, labels, lambda partials: self._merge_groups(partials, aggregations, aggregate_rows))
+        plan.operator = "Finalize Hash Aggregate"
+        return plan
+
+    # the tasks run on a chunk by the worker processes of parallel scans, they return the rows
+    # output by the operators of their worker plan and their output (see Gather)
+
+    # return (rows scanned, typed rows meeting the predicate) of the chunk
+    def _select_chunk_rows(self, chunk_path: str, types: tuple, predicate: Predicate or None) -> tuple:
+        typed_rows = list(self._scan_chunk(chunk_path, types))
+        if predicate is None:
+            return len(typed_rows), typed_rows
+        return len(typed_rows), [typed_row for typed_row in typed_rows if predicate(typed_row)]
+
+    # return (rows scanned, Batch of the rows meeting the predicate) of the chunk with the
+    # columns at the column indexes, which hold the fields of the predicate
+    def _select_chunk_batch(self, chunk_path: str, types: tuple, predicate: Predicate or None, column_indexes: list) -> tuple:
+        batch = self._read_chunk_batch(chunk_path, types, column_indexes)
+        if predicate is None or len(batch) == 0:
+            return len(batch), batch
+        return len(batch), Batch(batch.columns, predicate.select(batch.columns, batch.selection))
+
+    # the row dicts of the fields of the rows of the chunk as stored (not typed), for projection
+    def _project_chunk(self, chunk_path: str, types: tuple, fields: list, column_indexes: list) -> tuple:
+        if chunk_path.endswith(COLUMNAR_SUFFIX):
+            batch = self._read_chunk_batch(chunk_path, types, column_indexes)
+            row_dicts = self._batch_to_dicts(batch, fields, column_indexes) if len(batch) > 0 else []
+        else:
+            row_dicts = [dict(zip(fields, map(row.__getitem__, column_indexes))) for row in self._read_raw_rows([chunk_path])]
+        return self._worker_counts(len(row_dicts), None, 0, len(row_dicts)), row_dicts
+
+    # the row dicts of the fields (at the column indexes) of the rows of the chunk meeting the
+    # predicate, the columns at the read indexes are read
+    def _filter_chunk(self, chunk_path: str, types: tuple, predicate: Predicate, fields: list, column_indexes: list, read_indexes: list) -> tuple:
+        if VECTORIZED_EXECUTION:
+            scanned, batch = self._select_chunk_batch(chunk_path, types, predicate, read_indexes)
+            row_dicts = self._batch_to_dicts(batch, fields, column_indexes) if len(batch) > 0 else []
+        else:
+            scanned, typed_rows = self._select_chunk_rows(chunk_path, types, predicate)
+            row_dicts = [dict(zip(fields, map(typed_row.__getitem__, column_indexes))) for typed_row in typed_rows]
+        return self._worker_counts(len(row_dicts), predicate, len(row_dicts), scanned), row_dicts
+
+    # the partial accumulators of the aggregations over the rows of the chunk meeting the predicate
+    def _aggregate_chunk(self, chunk_path: str, types: tuple, predicate: Predicate or None, aggregations: list, aggregate_indexes: list, read_indexes: list) -> tuple:
+        accumulators = self._new_accumulators(aggregations)
+        if VECTORIZED_EXECUTION:
+            scanned, batch = self._select_chunk_batch(chunk_path, types, predicate, read_indexes)
+            if len(batch) > 0:
+                self._add_batch_to_accumulators(accumulators, aggregate_indexes, batch)
+            selected = len(batch)
+        else:
+            scanned, typed_rows = self._select_chunk_rows(chunk_path, types, predicate)
+            for typed_row in typed_rows:
+                self._update_accumulators(accumulators, aggregate_indexes, typed_row)
+            selected = len(typed_rows)
+        return self._worker_counts(1, predicate, selected, scanned), accumulators
+
+    # the partial groups {group value: accumulators} of the rows of the chunk meeting the predicate
+    def _group_chunk(self, chunk_path: str, types: tuple, predicate: Predicate or None, group_index: int, aggregations: list, aggregate_indexes: list) -> tuple:
+        scanned, typed_rows = self._select_chunk_rows(chunk_path, types, predicate)
+        groups = {}
+        for typed_row in typed_rows:
+            accumulators = groups.get(typed_row[group_index])
+            if accumulators is None:
+                accumulators = groups[typed_row[group_index]] = self._new_accumulators(aggregations)
+            self._update_accumulators(accumulators, aggregate_indexes, typed_row)
+        return self._worker_counts(len(groups), predicate, len(typed_rows), scanned), groups
+
+    # sort the rows of the chunk meeting the predicate into the run file, the output is the run size
+    def _sort_chunk(self, chunk_path: str, types: tuple, predicate: Predicate or None, sort_key: SortKey, run_file: str) -> tuple:
+        scanned, typed_rows = self._select_chunk_rows(chunk_path, types, predicate)
+        self._write_sorted_run(typed_rows, sort_key, run_file)
+        return self._worker_counts(len(typed_rows), predicate, len(typed_rows), scanned), len(typed_rows)
+
     # ========================================================
     #                  ***** Helpers *****
     #
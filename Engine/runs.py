@@ -0,0 +1,102 @@
+import heapq
+import itertools
+import operator
+import pickle
+
+# rows (docs) per pickled block of a run file, a merge holds a block of every run it reads
+RUN_BLOCK_ITEMS = 128
+
+
+# writes the sorted rows (docs) of a run of the external sort to its file in Temp
+# the runs are only read back by the sort, so the rows are kept as pickled blocks of
+# RUN_BLOCK_ITEMS typed rows instead of csv / json lines: reading a run back parses
+# and types nothing. The external sort keeps every row with its sort key, as (key, row)
+#
+#   with RunWriter(path) as writer:
+#       writer.write(row)
+#
+class RunWriter():
+    def __init__(self, path: str):
+        self.file = open(path, "wb", buffering=1 << 16)
+        self.block = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def write(self, item) -> None:
+        self.block.append(item)
+        if len(self.block) == RUN_BLOCK_ITEMS:
+            pickle.dump(self.block, self.file, pickle.HIGHEST_PROTOCOL)
+            self.block = []
+
+    def write_all(self, items) -> None:
+        for item in items:
+            self.write(item)
+
+    def close(self) -> None:
+        if self.file.closed:
+            return
+        if len(self.block) > 0:
+            pickle.dump(self.block, self.file, pickle.HIGHEST_PROTOCOL)
+            self.block = []
+        self.file.close()
+
+
+# yield the rows (docs) of a run file written by a RunWriter
+def read_run(path: str):
+    with open(path, "rb", buffering=1 << 16) as f:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                return
+            yield from block
+
+
+# yield the (key, item) pairs of the run files sorted on the keys, merged with a heap
+def merge_runs(run_files: list):
+    return heapq.merge(*map(read_run, run_files), key=operator.itemgetter(0))
+
+
+# write the items to a run file for every run of replacement_selection (keyed by run number,
+# starting at 0), there is always a run 0 (maybe empty)
+def write_runs(numbered_items, run_path) -> None:
+    run_num = 0
+    writer = RunWriter(run_path(run_num))
+    try:
+        for item_run_num, item in numbered_items:
+            if item_run_num != run_num:
+                # the item starts the next run
+                writer.close()
+                run_num = item_run_num
+                writer = RunWriter(run_path(run_num))
+            writer.write(item)
+    finally:
+        writer.close()
+
+
+# yield (run number, (key, item)) for every (key, item) pair, cut into runs sorted on the
+# keys with replacement selection: a heap of capacity items outputs its first item to the
+# current run and takes the next input item in its place, an item sorting before the last
+# output waits in the heap for the next run. The runs of random input are about 2 * capacity
+# items long, sorted input makes a single run. The run numbers start at 0 and grow by 1
+def replacement_selection(keyed_items, capacity: int):
+    keyed_items = iter(keyed_items)
+    # the heap holds (run number, key, arrival number, item), the arrival number breaks ties
+    # before the items are compared
+    heap = [(0, key, seq, item) for seq, (key, item) in enumerate(itertools.islice(keyed_items, capacity))]
+    heapq.heapify(heap)
+    seq = len(heap)
+    for key, item in keyed_items:
+        run_num, top_key, _, top_item = heap[0]
+        yield run_num, (top_key, top_item)
+        # an item sorting before the item output cannot follow it in the current run
+        heapq.heapreplace(heap, (run_num + 1 if key < top_key else run_num, key, seq, item))
+        seq += 1
+    while len(heap) > 0:
+        run_num, key, _, item = heapq.heappop(heap)
+        yield run_num, (key, item)
@@ -0,0 +1,95 @@
+import struct
+
+# byte -> 255 - byte, bytes.translate with it inverts the order of encoded values
+_INVERT = bytes(range(255, -1, -1))
+
+_pack_double = struct.Struct(">d").pack
+_SIGN_BIT = 1 << 63
+_ALL_BITS = (1 << 64) - 1
+
+
+# ========================================================
+#                    Value encodings
+# ========================================================
+# every value is encoded to bytes comparing like the values: a < b exactly when
+# encode(a) < encode(b). No encoding is the prefix of another, so the encodings of
+# several fields can be concatenated and still compare field by field
+
+# a length byte (0x80 + length for positives, 0x7f - length for negatives) before the
+# big-endian magnitude (inverted for negatives): longer magnitudes sort further from 0
+def encode_int(value: int) -> bytes:
+    if value >= 0:
+        magnitude = value.to_bytes((value.bit_length() + 7) // 8, "big")
+        return bytes((0x80 + len(magnitude),)) + magnitude
+    magnitude = (-value).to_bytes(((-value).bit_length() + 7) // 8, "big")
+    return bytes((0x7f - len(magnitude),)) + magnitude.translate(_INVERT)
+
+
+# the 8 bytes of the double, with the sign bit set for positives and every bit
+# inverted for negatives
+def encode_float(value: float) -> bytes:
+    if value == 0:
+        # -0.0 == 0.0
+        value = 0.0
+    bits = int.from_bytes(_pack_double(value), "big")
+    bits = bits ^ _ALL_BITS if bits & _SIGN_BIT else bits | _SIGN_BIT
+    return bits.to_bytes(8, "big")
+
+
+# the utf-8 bytes (ordered like the code points, as str compares) with 0x00 escaped
+# as 0x00 0xff, ended by 0x00 0x00
+def encode_str(value: str) -> bytes:
+    return value.encode("utf-8", "surrogatepass").replace(b"\x00", b"\x00\xff") + b"\x00\x00"
+
+
+# a document value, ordered like mix_key: strings (and the other values, by their text)
+# before the numbers. Ints and floats compare by value: a number is encoded as the nearest
+# double, then the difference of an int from it (0 for a float), exact beyond 2 ** 53
+def encode_mixed(value) -> bytes:
+    if type(value) is float:
+        return b"\x01" + encode_float(value) + _ZERO_INT
+    if type(value) is int:
+        approx = float(value)
+        return b"\x01" + encode_float(approx) + encode_int(value - int(approx))
+    if type(value) is not str:
+        value = str(value)
+    return b"\x00" + encode_str(value)
+
+
+_ZERO_INT = encode_int(0)
+
+# the encoding of the values of a typed column
+TYPE_ENCODERS = {int: encode_int, float: encode_float, str: encode_str}
+
+
+# ========================================================
+#                    Sort keys
+# ========================================================
+
+# the normalized key of a row (doc) for a sort on several fields, each ascending or
+# descending: the encodings of the fields, inverted for the descending ones. The keys
+# are computed once per row and compare as plain bytes, so sorting ascending on them
+# sorts the rows on every field in its direction
+#
+#   sort_key = SortKey([1, 0], [encode_int, encode_str], ["desc", "asc"])
+#   rows.sort(key=sort_key)
+#
+# a SortKey is pickled to the worker processes sorting chunks in parallel
+class SortKey():
+    def __init__(self, fields: list, encoders: list, order_methods: list):
+        # row indexes (doc fields) of the sort fields
+        self.fields = fields
+        self.encoders = encoders
+        self.order_methods = order_methods
+        self.parts = list(zip(fields, encoders, [order_method == "desc" for order_method in order_methods]))
+
+    def __call__(self, item) -> bytes:
+        if len(self.parts) == 1:
+            field, encode, desc = self.parts[0]
+            key = encode(item[field])
+            return key.translate(_INVERT) if desc else key
+        key = bytearray()
+        for field, encode, desc in self.parts:
+            part = encode(item[field])
+            key += part.translate(_INVERT) if desc else part
+        return bytes(key)
@@ -0,0 +1,134 @@
+import functools
+import inspect
+import os
+import shutil
+import sys
+import threading
+import uuid
+
+from config import TEMP_DIRS, TEMP_QUOTA_BYTES
+from .plan import current_query_stats
+
+# the workspace of the query running in the current thread
+_local = threading.local()
+# the workspaces of the running queries, whose files count against TEMP_QUOTA_BYTES
+_active = set()
+_active_lock = threading.Lock()
+
+
+# raised when a query creates a temp file while the temp files of the running queries
+# take more than TEMP_QUOTA_BYTES
+class TempQuotaExceeded(Exception):
+    pass
+
+
+# the temp directory of a query: the runs of its sorts, its spill and partition files, ...
+# every query gets a new directory with a unique name under one of the TEMP_DIRS (the one
+# with the most free space), so concurrent queries never see each other's files, and the
+# directory is removed with everything in it when the query ends, even if it failed
+#
+#   with TempWorkspace():
+#       path = temp_path("spill_0.part")
+#
+class TempWorkspace():
+    def __init__(self):
+        self.dir = None
+
+    def __enter__(self):
+        temp_dir = max(TEMP_DIRS, key=_free_space)
+        os.makedirs(temp_dir, exist_ok=True)
+        self.dir = os.path.join(temp_dir, f"query_{uuid.uuid4().hex}")
+        os.mkdir(self.dir)
+        with _active_lock:
+            _active.add(self)
+        _local.workspace = self
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.workspace = None
+        with _active_lock:
+            _active.discard(self)
+        shutil.rmtree(self.dir, ignore_errors=True)
+        return False
+
+    # return the path of the temp file of the workspace, checking the quota before it is written
+    # the file is counted in the io counters of the query (explain analyze)
+    def path(self, name: str) -> str:
+        if TEMP_QUOTA_BYTES is not None:
+            with _active_lock:
+                workspaces = list(_active)
+            used = sum(workspace.size() for workspace in workspaces)
+            if used > TEMP_QUOTA_BYTES:
+                raise TempQuotaExceeded(f"temp space quota of {TEMP_QUOTA_BYTES} bytes exceeded ({used} bytes in use)")
+        path = os.path.join(self.dir, name)
+        stats = current_query_stats()
+        if stats is not None:
+            stats.temp_files.add(path)
+        return path
+
+    # return the paths of the files in the workspace
+    def files(self) -> list:
+        return [entry.path for entry in os.scandir(self.dir) if entry.is_file()]
+
+    # return the bytes of the files in the workspace
+    def size(self) -> int:
+        size = 0
+        try:
+            for entry in os.scandir(self.dir):
+                try:
+                    size += entry.stat().st_size
+                except FileNotFoundError:
+                    # removed while scanning
+                    pass
+        except FileNotFoundError:
+            # the query ended
+            pass
+        return size
+
+
+# return the workspace of the query running in the current thread, None if none
+def current_workspace() -> TempWorkspace or None:
+    return getattr(_local, "workspace", None)
+
+
+# return the path of the temp file of the query running in the current thread
+def temp_path(name: str) -> str:
+    workspace = current_workspace()
+    if workspace is None:
+        raise Exception("temp files can only be written by a query running in a temp workspace")
+    return workspace.path(name)
+
+
+# return the paths of the temp files of the query running in the current thread
+def temp_files() -> list:
+    workspace = current_workspace()
+    return workspace.files() if workspace is not None else []
+
+
+# run the query method (of an engine) in a temp workspace of its own, or in the workspace of the
+# query calling it. A query going over the temp space quota prints the error to its io_output
+def in_temp_workspace(method):
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def run_query(*args, **kwargs):
+        if current_workspace() is not None:
+            return method(*args, **kwargs)
+        try:
+            with TempWorkspace():
+                return method(*args, **kwargs)
+        except TempQuotaExceeded as e:
+            io_output = signature.bind(*args, **kwargs).arguments.get("io_output", sys.stdout)
+            print(e, file=io_output)
+            return True
+    return run_query
+
+
+def _free_space(temp_dir: str) -> int:
+    # the directory may not exist yet
+    while not os.path.exists(temp_dir):
+        parent = os.path.dirname(temp_dir)
+        if parent == temp_dir:
+            return 0
+        temp_dir = parent
+    return shutil.disk_usage(temp_dir).free
@@ -0,0 +1,85 @@
+from array import array
+
+# the types of values with numeric bounds (bools compare as ints)
+NUMBER_TYPES = (int, float, bool)
+
+
+# the zone map of a chunk: its row count and, for every field, the min/max of its numbers
+# and of its strings, the number of rows holding a value (the other rows are null: the
+# value is missing, None or an empty relational value) and the number of values that are
+# neither numbers nor strings (e.g. lists in docs)
+# zone maps are kept in the manifest of the table, as {"rows": n, "fields": {field:
+# {"num": [min, max] or None, "str": [min, max] or None, "count": n, "other": n}}}
+# so a scan can skip the chunks that cannot hold a matching value without reading them
+class ZoneMap():
+    def __init__(self, zone: dict or None = None):
+        # the zone is used as is, not copied
+        self.zone = zone if zone is not None else {"rows": 0, "fields": {}}
+
+    def to_dict(self) -> dict:
+        return self.zone
+
+    # record rows added to the chunk
+    def add_rows(self, rows: int) -> None:
+        self.zone["rows"] += rows
+
+    # record the values of the field in rows added to the chunk, nulls of them are empty values
+    # (None values are left out by the caller)
+    def add_values(self, field: str, values, nulls: int = 0) -> None:
+        stats = self.zone["fields"].setdefault(field, {"num": None, "str": None, "count": 0, "other": 0})
+        if isinstance(values, array):
+            numbers, strings = values, ()
+        else:
+            strings = [value for value in values if type(value) == str]
+            numbers = [value for value in values if type(value) in NUMBER_TYPES] if len(strings) < len(values) else ()
+        for key, kind_values in (("num", numbers), ("str", strings)):
+            if len(kind_values) == 0:
+                continue
+            low, high = min(kind_values), max(kind_values)
+            if stats[key] is not None:
+                low, high = min(low, stats[key][0]), max(high, stats[key][1])
+            stats[key] = [low, high]
+        stats["count"] += len(values) - nulls
+        stats["other"] += len(values) - len(numbers) - len(strings)
+
+    # return the (min, max) of the values of the field in the chunk that compare with the value
+    # (strings with strings, numbers with numbers), None if the chunk has none
+    def bounds(self, field: str, value) -> tuple or None:
+        stats = self.zone["fields"].get(field)
+        if stats is None:
+            return None
+        return stats["str" if type(value) == str else "num"]
+
+    # return the number of rows of the chunk without a value of the field
+    def null_count(self, field: str) -> int:
+        stats = self.zone["fields"].get(field)
+        return self.zone["rows"] - (stats["count"] if stats is not None else 0)
+
+    # False if no row of the chunk can meet the predicate
+    def may_match(self, predicate) -> bool:
+        return predicate.may_match(self.bounds)
+
+
+# return ("num" or "str", min, max) of the values of the field over the zone maps of the chunks,
+# None if a chunk has no zone map or the values are not all numbers or all strings
+def table_range(zones: list, field: str) -> tuple or None:
+    kind, low, high = None, None, None
+    for zone in zones:
+        if zone is None:
+            return None
+        stats = zone["fields"].get(field)
+        if stats is None:
+            continue
+        if stats["other"] > 0:
+            return None
+        for key in ("num", "str"):
+            if stats[key] is None:
+                continue
+            if kind is not None and kind != key:
+                return None
+            kind = key
+            low = stats[key][0] if low is None else min(low, stats[key][0])
+            high = stats[key][1] if high is None else max(high, stats[key][1])
+    if kind is None:
+        return None
+    return kind, low, high
@@ -2,6 +2,44 @@ import os
 
 BASE_DIR = os.path.dirname(__file__)
 TEMP_DIR = f"{BASE_DIR}/Temp"
+# directories (e.g. on several disks) the temp files of the queries are written to, every query
+# writes to a directory of its own, created in the one with the most free space
+TEMP_DIRS = (TEMP_DIR,)
+# bytes the temp files of the running queries may take together, a query creating a temp file
+# over the quota fails, None for no limit
+TEMP_QUOTA_BYTES = None
 
-CHUNK_SIZE = 5
-FIELD_PRINT_LEN = 20
\ No newline at end of file
+# default number of rows (docs) per storage chunk, None for no row limit
+CHUNK_SIZE = 4096
+# default target size of a storage chunk in bytes, None for no byte limit
+CHUNK_BYTES = None
+# entries the changes logged to an index (by insert, update and delete) may add before the log is
+# folded into the index file, a longer log costs memory and time when it is read
+INDEX_LOG_MAX_ENTRIES = 50000
+# rows (docs) a sort with limit n offset m keeps in a heap: when n + m is at most this, the first
+# rows are kept in memory while the table is scanned and nothing is written to Temp
+TOP_K_MAX_ROWS = 100000
+# number of sorted runs merged at once by the external sort, the merges of a pass run in parallel
+MERGE_FAN_IN = 64
+# rows the build side of a hash join may hold in memory, larger inputs are partitioned to Temp
+HASH_JOIN_MEMORY_ROWS = 100000
+# joins producing at most this many row pairs to compare use a nested loop join
+NESTED_LOOP_JOIN_MAX_PAIRS = 10000
+# groups a hash aggregation may hold in memory, rows of further groups are spilled to Temp
+HASH_AGG_MEMORY_GROUPS = 100000
+# items kept per level of the sketch used by approximate median/percentile, larger is more exact
+PERCENTILE_SKETCH_SIZE = 200
+# relational filtering and aggregation without grouping read chunks as typed column arrays
+# and evaluate conditions and aggregations a batch at a time, False to process row by row
+VECTORIZED_EXECUTION = True
+# chunk formats of relational tables: csv rows, or columnar chunks storing every column as a typed
+# binary array so queries only read and decode the columns they use
+CHUNK_FORMATS = ("csv", "columnar")
+# chunk format of new relational tables, set format of <table> to <format>; converts a table
+RELATIONAL_CHUNK_FORMAT = "csv"
+# worker processes scanning the chunks of a table in parallel for filtering, projection, aggregation,
+# grouping and the sorted runs of sort, 1 to scan every chunk in the process running the query
+PARALLEL_WORKERS = os.cpu_count() or 1
+# scans of fewer rows (docs) run in the process of the query, handing them to the workers costs more than it saves
+PARALLEL_MIN_ROWS = 50000
+FIELD_PRINT_LEN = 20
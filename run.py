@@ -1,36 +1,49 @@
-from flask import Flask, jsonify, render_template, request, send_from_directory
+import io
+import os
+import uuid
+
+from flask import Flask, Response, jsonify, render_template, request, send_from_directory
 from Engine.nosql import NoSQL
 from Engine.relational import Relational
-import re
-
-from config import BASE_DIR
 
+# the engines are shared by the threads (and requests) of a worker: every request prints to a buffer
+# of its own, and the engines lock the tables of a query, so requests can run concurrently, in threads
+# or in the processes of a WSGI server (see README)
 app = Flask(__name__)
-app.config["RESULT_DIR"] = f"{BASE_DIR}/Results"
 app.config["RELATIONAL_ENGINE"] = Relational()
 app.config["NOSQL_ENGINE"] = NoSQL()
 
+# return the output of a request as its response
+def result_response(io_output: io.StringIO) -> Response:
+    return Response(io_output.getvalue(), mimetype="text/plain")
+
 @app.route('/')
 def index():
     return send_from_directory("static", "index.html")
 
 @app.route('/load', methods=['POST'])
 def load():
-    io_output = open(f"{app.config['RESULT_DIR']}/result.txt", "w")
+    io_output = io.StringIO()
     engine = request.form['engine']
     try:
         datasetToLoad = request.files['file']
-        if datasetToLoad:
-            datasetToLoad.save(f'ToBeLoaded/{datasetToLoad.filename}')
         if engine == 'relational':
-            ok = app.config["RELATIONAL_ENGINE"].load_data(datasetToLoad.filename, io_output)
+            db = app.config["RELATIONAL_ENGINE"]
         else:
-            ok = app.config["NOSQL_ENGINE"].load_data(datasetToLoad.filename, io_output)
+            db = app.config["NOSQL_ENGINE"]
+        # the upload is saved and loaded with the table locked, so a concurrent upload of the
+        # same file cannot overwrite it while it is loaded
+        with db.locks.lock(write=[datasetToLoad.filename.split(".")[0]]):
+            if datasetToLoad:
+                # saved under a temp name first, so the file is never read half written
+                upload_path = f'ToBeLoaded/{datasetToLoad.filename}'
+                temp_upload_path = f'ToBeLoaded/.{datasetToLoad.filename}.{uuid.uuid4().hex}.tmp'
+                datasetToLoad.save(temp_upload_path)
+                os.replace(temp_upload_path, upload_path)
+            ok = db.load_data(datasetToLoad.filename, io_output)
         if not ok:
             return "Error occurred"
-        # close output file
-        io_output.close()
-        return send_from_directory(app.config["RESULT_DIR"], "result.txt")
+        return result_response(io_output)
     except Exception as e:
         return jsonify({'error': f'Error occurred: {str(e)}'}), 500
 
@@ -41,18 +54,16 @@ def show_data():
     engine = data.get('engine')
     table_name = data.get('table_name')
     fields = data.get('fields').split(',')
-    # open output file
-    io_output = open(f"{app.config['RESULT_DIR']}/result.txt", "w")
+    # the output of the request, in a buffer of its own
+    io_output = io.StringIO()
     # call the specified engine
     if engine == 'relational':
         ok = app.config["RELATIONAL_ENGINE"].projection(table_name, fields, io_output)
     else:
         ok = app.config["NOSQL_ENGINE"].projection(table_name, fields, io_output)
-    # close output file
-    io_output.close()
     if not ok:
         return "Error occurred"
-    return send_from_directory(app.config["RESULT_DIR"], "result.txt")
+    return result_response(io_output)
 
 @app.route('/filtering', methods=['POST'])
 def filtering():
@@ -62,18 +73,16 @@ def filtering():
     table_name = data.get('table_name')
     fields = data.get('fields').split(',')
     condition = data.get('condition')
-    # open output file
-    io_output = open(f"{app.config['RESULT_DIR']}/result.txt", "w")
+    # the output of the request, in a buffer of its own
+    io_output = io.StringIO()
     # call the specified engine
     if engine == 'relational':
         ok = app.config["RELATIONAL_ENGINE"].filtering(table_name, fields, condition, io_output)
     else:
         ok = app.config["NOSQL_ENGINE"].filtering(table_name, fields, condition, io_output)
-    # close output file
-    io_output.close()
     if not ok:
         return "Error occurred"
-    return send_from_directory(app.config["RESULT_DIR"], "result.txt")
+    return result_response(io_output)
 
 @app.route('/updating', methods=['POST'])
 def updating():
@@ -83,18 +92,16 @@ def updating():
     table_name = data.get('table_name')
     data_val = data.get('data').split(',')
     condition = data.get('condition')
-    # open output file
-    io_output = open(f"{app.config['RESULT_DIR']}/result.txt", "w")
+    # the output of the request, in a buffer of its own
+    io_output = io.StringIO()
     # call the specified engine
     if engine == 'relational':
         ok = app.config["RELATIONAL_ENGINE"].update_data(table_name, condition, data_val, io_output)
     else:
         ok = app.config["NOSQL_ENGINE"].update_data(table_name, condition, data_val, io_output)
-    # close output file
-    io_output.close()
     if not ok:
         return "Error occurred"
-    return send_from_directory(app.config["RESULT_DIR"], "result.txt")
+    return result_response(io_output)
 
 @app.route('/deletion', methods=['POST'])
 def deletion():
@@ -103,18 +110,16 @@ def deletion():
     engine = data.get('engine')
     table_name = data.get('table_name')
     condition = data.get('condition')
-    # open output file
-    io_output = open(f"{app.config['RESULT_DIR']}/result.txt", "w")
+    # the output of the request, in a buffer of its own
+    io_output = io.StringIO()
     # call the specified engine
     if engine == 'relational':
         ok = app.config["RELATIONAL_ENGINE"].delete_data(table_name, condition, io_output)
     else:
         ok = app.config["NOSQL_ENGINE"].delete_data(table_name, condition, io_output)
-    # close output file
-    io_output.close()
     if not ok:
         return "Error occurred"
-    return send_from_directory(app.config["RESULT_DIR"], "result.txt")
+    return result_response(io_output)
 
 @app.route('/insertion', methods=['POST'])
 def insertion():
@@ -123,18 +128,16 @@ def insertion():
     engine = data.get('engine')
     table_name = data.get('table_name')
     data_val = data.get('data').split(',')
-    # open output file
-    io_output = open(f"{app.config['RESULT_DIR']}/result.txt", "w")
+    # the output of the request, in a buffer of its own
+    io_output = io.StringIO()
     # call the specified engine
     if engine == 'relational':
         ok = app.config["RELATIONAL_ENGINE"].insert_data(table_name, data_val, io_output)
     else:
         ok = app.config["NOSQL_ENGINE"].insert_data(table_name, data_val, io_output)
-    # close output file
-    io_output.close()
     if not ok:
         return "Error occurred"
-    return send_from_directory(app.config["RESULT_DIR"], "result.txt")
+    return result_response(io_output)
 
 @app.route('/sorting', methods=['POST'])
 def sorting():
@@ -144,18 +147,16 @@ def sorting():
     table_name = data.get('table_name')
     field = data.get('field')
     method = data.get('method')
-    # open output file
-    io_output = open(f"{app.config['RESULT_DIR']}/result.txt", "w")
+    # the output of the request, in a buffer of its own
+    io_output = io.StringIO()
     # call the specified engine
     if engine == 'relational':
-        ok = app.config["RELATIONAL_ENGINE"].order(table_name, field, method, io_output)
+        ok = app.config["RELATIONAL_ENGINE"].order(table_name, [(field, method)], io_output)
     else:
-        ok = app.config["NOSQL_ENGINE"].order(table_name, field, method, io_output)
-    # close output file
-    io_output.close()
+        ok = app.config["NOSQL_ENGINE"].order(table_name, [(field, method)], io_output)
     if not ok:
         return "Error occurred"
-    return send_from_directory(app.config["RESULT_DIR"], "result.txt")
+    return result_response(io_output)
 
 @app.route('/join', methods=['POST'])
 def join():
@@ -165,18 +166,16 @@ def join():
     left_table = data.get('left_table')
     right_table = data.get('right_table')
     condition = data.get('condition')
-    # open output file
-    io_output = open(f"{app.config['RESULT_DIR']}/result.txt", "w")
+    # the output of the request, in a buffer of its own
+    io_output = io.StringIO()
     # call the specified engine
     if engine == 'relational':
         ok = app.config["RELATIONAL_ENGINE"].join(left_table, right_table, condition, io_output)
     else:
         ok = app.config["NOSQL_ENGINE"].join(left_table, right_table, condition, io_output)
-    # close output file
-    io_output.close()
     if not ok:
         return "Error occurred"
-    return send_from_directory(app.config["RESULT_DIR"], "result.txt")
+    return result_response(io_output)
 
 @app.route('/aggregate', methods=['POST'])
 def aggregate():
@@ -186,56 +185,33 @@ def aggregate():
     table_name = data.get('table_name')
     to_find = data.get('to_find')
     group_by = data.get('group_by')
+    # the output of the request, in a buffer of its own
+    io_output = io.StringIO()
     if to_find == '':
-        group(engine, table_name, group_by)
+        ok = group(engine, table_name, group_by, io_output)
     elif group_by == '':
-        aggregation_method = re.match(r'(.*?)\((.*?)\)', to_find).group(1)
-        aggregation_field = re.match(r'(.*?)\((.*?)\)', to_find).group(2)
-        aggregate_table(engine, table_name, aggregation_method, aggregation_field)
-    else:
-        aggregation_method = re.match(r'(.*?)\((.*?)\)', to_find).group(1)
-        aggregation_field = re.match(r'(.*?)\((.*?)\)', to_find).group(2)
-        aggregate_group(engine, table_name, aggregation_method, aggregation_field, group_by)
-    return send_from_directory(app.config["RESULT_DIR"], "result.txt")
-
-def aggregate_group(engine, table_name, aggregation_method, aggregation_field, group_field):
-    # open output file
-    io_output = open(f"{app.config['RESULT_DIR']}/result.txt", "w")
-    # call the specified engine
-    if engine == 'relational':
-        ok = app.config["RELATIONAL_ENGINE"].aggregate(table_name, aggregation_method, aggregation_field, group_field, io_output)
+        ok = aggregate_group(engine, table_name, to_find, None, io_output)
     else:
-        ok = app.config["NOSQL_ENGINE"].aggregate(table_name, aggregation_method, aggregation_field, group_field, io_output)
-    # close output file
-    io_output.close()
+        ok = aggregate_group(engine, table_name, to_find, group_by, io_output)
     if not ok:
         return "Error occurred"
+    return result_response(io_output)
 
-def aggregate_table(engine, table_name, aggregation_method, aggregation_field):
-    # open output file
-    io_output = open(f"{app.config['RESULT_DIR']}/result.txt", "w")
+def aggregate_group(engine, table_name, to_find, group_field, io_output):
     # call the specified engine
     if engine == 'relational':
-        ok = app.config["RELATIONAL_ENGINE"].aggregate_table(table_name, aggregation_method, aggregation_field, io_output)
+        db = app.config["RELATIONAL_ENGINE"]
     else:
-        ok = app.config["NOSQL_ENGINE"].aggregate_table(table_name, aggregation_method, aggregation_field, io_output)
-    # close output file
-    io_output.close()
-    if not ok:
-        return "Error occurred"
+        db = app.config["NOSQL_ENGINE"]
+    # several aggregations can be computed at once, e.g. count(*),avg(score)
+    aggregations = db.parse_aggregations(to_find, io_output)
+    return aggregations is not None and db.multi_aggregate(table_name, aggregations, group_field, io_output)
 
-def group(engine, table_name, group_field):
-    # open output file
-    io_output = open(f"{app.config['RESULT_DIR']}/result.txt", "w")
+def group(engine, table_name, group_field, io_output):
     # call the specified engine
     if engine == 'relational':
-        ok = app.config["RELATIONAL_ENGINE"].group(table_name, group_field, io_output)
-    else:
-        ok = app.config["NOSQL_ENGINE"].group(table_name, group_field, io_output)
-    # close output file
-    io_output.close()
-    if not ok:
-        return "Error occurred"
+        return app.config["RELATIONAL_ENGINE"].group(table_name, group_field, io_output)
+    return app.config["NOSQL_ENGINE"].group(table_name, group_field, io_output)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,268 @@
+# accumulators for aggregations: values are added one by one during a scan (or a batch at a time
+# by vectorized scans), partial accumulators can be merged and result() returns the final value (None if no value)
+import math
+
+from config import PERCENTILE_SKETCH_SIZE
+
+
+class Accumulator(object):
+    def add(self, value):
+        pass
+
+    # add a batch of values (e.g. a typed column array)
+    def add_batch(self, values):
+        for value in values:
+            self.add(value)
+
+    def merge(self, other):
+        pass
+
+    def result(self):
+        return None
+
+
+class CountAccumulator(Accumulator):
+    def __init__(self):
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+
+    def add_batch(self, values):
+        self.count += len(values)
+
+    def merge(self, other):
+        self.count += other.count
+
+    def result(self):
+        return self.count
+
+
+class CountDistinctAccumulator(Accumulator):
+    def __init__(self):
+        self.values = set()
+
+    def add(self, value):
+        self.values.add(value)
+
+    def add_batch(self, values):
+        self.values.update(values)
+
+    def merge(self, other):
+        self.values |= other.values
+
+    def result(self):
+        return len(self.values)
+
+
+class SumAccumulator(Accumulator):
+    # number converts a value to the number that is added (e.g. strings to 0 in NoSQL)
+    def __init__(self, number=None):
+        self.number = number
+        self.total = 0
+
+    def add(self, value):
+        self.total += self.number(value) if self.number is not None else value
+
+    def add_batch(self, values):
+        if self.number is not None:
+            values = map(self.number, values)
+        self.total += sum(values)
+
+    def merge(self, other):
+        self.total += other.total
+
+    def result(self):
+        return self.total
+
+
+class AvgAccumulator(SumAccumulator):
+    def __init__(self, number=None):
+        super().__init__(number)
+        self.count = 0
+
+    def add(self, value):
+        super().add(value)
+        self.count += 1
+
+    def add_batch(self, values):
+        super().add_batch(values)
+        self.count += len(values)
+
+    def merge(self, other):
+        super().merge(other)
+        self.count += other.count
+
+    def result(self):
+        if self.count == 0:
+            return None
+        return round(self.total / self.count, 2)
+
+
+class MaxAccumulator(Accumulator):
+    # the best value of a batch
+    _best = staticmethod(max)
+
+    # key orders the values (e.g. mix_key in NoSQL)
+    def __init__(self, key=None):
+        self.key = key
+        self.value = None
+
+    def _better(self, value, cur_value) -> bool:
+        if self.key is not None:
+            return self.key(value) > self.key(cur_value)
+        return value > cur_value
+
+    def add(self, value):
+        if self.value is None or self._better(value, self.value):
+            self.value = value
+
+    def add_batch(self, values):
+        if len(values) > 0:
+            self.add(self._best(values, key=self.key))
+
+    def merge(self, other):
+        if other.value is not None:
+            self.add(other.value)
+
+    def result(self):
+        return self.value
+
+
+class MinAccumulator(MaxAccumulator):
+    _best = staticmethod(min)
+
+    def _better(self, value, cur_value) -> bool:
+        if self.key is not None:
+            return self.key(value) < self.key(cur_value)
+        return value < cur_value
+
+
+class VarianceAccumulator(Accumulator):
+    # sample variance with Welford's online algorithm, merged with Chan's formula
+    def __init__(self, number=None):
+        self.number = number
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        value = self.number(value) if self.number is not None else value
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+
+    def variance(self):
+        if self.count == 0:
+            return None
+        if self.count == 1:
+            return 0.0
+        return self.m2 / (self.count - 1)
+
+    def result(self):
+        variance = self.variance()
+        return round(variance, 2) if variance is not None else None
+
+
+class StddevAccumulator(VarianceAccumulator):
+    def result(self):
+        variance = self.variance()
+        return round(math.sqrt(variance), 2) if variance is not None else None
+
+
+class PercentileAccumulator(Accumulator):
+    # approximate percentile with a KLL-style sketch: level i keeps a sorted sample where
+    # every item stands for 2^i values. A full level is compacted by keeping every other
+    # item in the next level, so the memory stays around sketch_size * levels items
+    def __init__(self, percentile: float, key=None, sketch_size: int = PERCENTILE_SKETCH_SIZE):
+        self.percentile = percentile
+        self.key = key
+        self.sketch_size = sketch_size
+        self.levels = [[]]
+        # alternate the kept half between compactions to avoid a biased result
+        self.offset = 0
+
+    def add(self, value):
+        self.levels[0].append(value)
+        if len(self.levels[0]) >= self.sketch_size:
+            self._compact()
+
+    def merge(self, other):
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append([])
+            self.levels[level].extend(items)
+        self._compact()
+
+    def _compact(self):
+        for level in range(len(self.levels)):
+            items = self.levels[level]
+            if len(items) < self.sketch_size:
+                continue
+            items.sort(key=self.key)
+            # an odd item out stays on this level
+            kept = items[len(items) - len(items) % 2:]
+            if level + 1 == len(self.levels):
+                self.levels.append([])
+            self.levels[level + 1].extend(items[self.offset:len(items) - len(kept):2])
+            self.levels[level] = kept
+            self.offset = 1 - self.offset
+
+    def result(self):
+        weighted = [(item, 1 << level) for level, items in enumerate(self.levels) for item in items]
+        if len(weighted) == 0:
+            return None
+        if self.key is not None:
+            weighted.sort(key=lambda pair: self.key(pair[0]))
+        else:
+            weighted.sort(key=lambda pair: pair[0])
+        total = sum(weight for _, weight in weighted)
+        # nearest rank
+        rank = max(1, math.ceil(self.percentile / 100 * total))
+        seen = 0
+        for item, weight in weighted:
+            seen += weight
+            if seen >= rank:
+                return item
+        return weighted[-1][0]
+
+
+# aggregation methods that only make sense for numbers
+NUMERIC_METHODS = ("sum", "avg", "stddev", "variance", "median", "percentile")
+
+
+# return a new accumulator for the aggregation (method, field, param)
+# key orders values for max/min/median/percentile, number converts values for sum/avg/stddev/variance
+def create_accumulator(aggregation: tuple, key=None, number=None) -> Accumulator:
+    method, _, param = aggregation
+    if method == "count":
+        return CountAccumulator()
+    elif method == "count distinct":
+        return CountDistinctAccumulator()
+    elif method == "sum":
+        return SumAccumulator(number)
+    elif method == "avg":
+        return AvgAccumulator(number)
+    elif method == "max":
+        return MaxAccumulator(key)
+    elif method == "min":
+        return MinAccumulator(key)
+    elif method == "variance":
+        return VarianceAccumulator(number)
+    elif method == "stddev":
+        return StddevAccumulator(number)
+    elif method == "median":
+        return PercentileAccumulator(50, key)
+    elif method == "percentile":
+        return PercentileAccumulator(param, key)
+    raise Exception(f"Invalid aggregation method {method}")
@@ -1,7 +1,3 @@
-import os
-
-from config import BASE_DIR
-
 # ========================================================
 #                   For printing tables
 # ========================================================
@@ -54,14 +50,3 @@ def add_key(key1, key2):
         if key2[0] == 1:
             rtn += key2[1]
     return (1, rtn)
-
-# ========================================================
-#                   For the temp folder
-# ========================================================
-
-def clear_temp_files():
-    for file in os.listdir(f"{BASE_DIR}/Temp"):
-            # keep the .gitkeep file
-            if file.endswith(".gitkeep") or file.endswith(".keep"):
-                continue
-            os.remove(f"{BASE_DIR}/Temp/{file}")
\ No newline at end of file